@@ -0,0 +1,41 @@
+"""add known_hosts table
+
+Revision ID: 3f9a2c7d1e54
+Revises: bc484cccebb4
+Create Date: 2026-10-18 09:12:41.208114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a2c7d1e54'
+down_revision: Union[str, None] = 'bc484cccebb4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'known_hosts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('host', sa.String(length=255), nullable=False),
+        sa.Column('port', sa.Integer(), nullable=False),
+        sa.Column('key_type', sa.String(length=64), nullable=False),
+        sa.Column('key_data', sa.Text(), nullable=False),
+        sa.Column('fingerprint', sa.String(length=128), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'host', 'port', name='uq_known_hosts_user_host_port')
+    )
+    op.create_index(op.f('ix_known_hosts_id'), 'known_hosts', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_known_hosts_id'), table_name='known_hosts')
+    op.drop_table('known_hosts')
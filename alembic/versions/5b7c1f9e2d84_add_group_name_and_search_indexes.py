@@ -0,0 +1,70 @@
+"""add group_name and host search indexes to ssh_clients
+
+Revision ID: 5b7c1f9e2d84
+Revises: 8d2e6b4f0a17
+Create Date: 2026-10-18 15:41:06.318502
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7c1f9e2d84'
+down_revision: Union[str, None] = '8d2e6b4f0a17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_COLUMNS = ('label', 'host', 'username')
+
+
+def has_trigram_support(bind) -> bool:
+    if bind.dialect.name != 'postgresql':
+        return False
+    available = bind.execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    ).first()
+    if available is None:
+        return False
+    # Creating the extension needs sufficient privileges; fall back to btree if not granted
+    with op.get_context().autocommit_block():
+        try:
+            bind.execute(sa.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        except sa.exc.DBAPIError:
+            return False
+    return True
+
+
+def upgrade() -> None:
+    op.add_column('ssh_clients', sa.Column('group_name', sa.String(length=255), nullable=True))
+    op.create_index('ix_ssh_clients_user_id_group_name', 'ssh_clients', ['user_id', 'group_name'], unique=False)
+    op.create_index('ix_ssh_clients_user_id_detected_os', 'ssh_clients', ['user_id', 'detected_os'], unique=False)
+
+    # Prefix search on SQLite scans the user's rows via (user_id, id); only
+    # Postgres gets dedicated search indexes
+    bind = op.get_bind()
+    if has_trigram_support(bind):
+        # Trigram indexes serve both prefix and substring matches
+        for column in SEARCH_COLUMNS:
+            op.execute(
+                f'CREATE INDEX ix_ssh_clients_{column}_trgm ON ssh_clients '
+                f'USING gin (lower({column}) gin_trgm_ops)'
+            )
+    elif bind.dialect.name == 'postgresql':
+        for column in SEARCH_COLUMNS:
+            op.execute(
+                f'CREATE INDEX ix_ssh_clients_user_id_{column}_lower ON ssh_clients '
+                f'(user_id, lower({column}) text_pattern_ops)'
+            )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        for column in SEARCH_COLUMNS:
+            op.execute(f'DROP INDEX IF EXISTS ix_ssh_clients_{column}_trgm')
+            op.execute(f'DROP INDEX IF EXISTS ix_ssh_clients_user_id_{column}_lower')
+    op.drop_index('ix_ssh_clients_user_id_detected_os', table_name='ssh_clients')
+    op.drop_index('ix_ssh_clients_user_id_group_name', table_name='ssh_clients')
+    op.drop_column('ssh_clients', 'group_name')
@@ -0,0 +1,26 @@
+"""add (user_id, id) index to ssh_clients
+
+Revision ID: 8d2e6b4f0a17
+Revises: 3f9a2c7d1e54
+Create Date: 2026-10-18 14:03:27.551920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2e6b4f0a17'
+down_revision: Union[str, None] = '3f9a2c7d1e54'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_ssh_clients_user_id_id', 'ssh_clients', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_ssh_clients_user_id_id', table_name='ssh_clients')
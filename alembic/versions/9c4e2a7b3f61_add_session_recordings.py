@@ -0,0 +1,46 @@
+"""add session recordings
+
+Revision ID: 9c4e2a7b3f61
+Revises: 5b7c1f9e2d84
+Create Date: 2026-10-18 17:12:44.902316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c4e2a7b3f61'
+down_revision: Union[str, None] = '5b7c1f9e2d84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('ssh_clients', sa.Column('record_sessions', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.create_table(
+        'session_recordings',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.Integer(), nullable=True),
+        sa.Column('title', sa.String(length=255), nullable=True),
+        sa.Column('path', sa.String(length=255), nullable=False),
+        sa.Column('cols', sa.Integer(), nullable=False),
+        sa.Column('rows', sa.Integer(), nullable=False),
+        sa.Column('size_bytes', sa.Integer(), nullable=True),
+        sa.Column('started_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.Column('ended_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_session_recordings_id'), 'session_recordings', ['id'], unique=False)
+    op.create_index('ix_session_recordings_user_id_id', 'session_recordings', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_session_recordings_user_id_id', table_name='session_recordings')
+    op.drop_index(op.f('ix_session_recordings_id'), table_name='session_recordings')
+    op.drop_table('session_recordings')
+    op.drop_column('ssh_clients', 'record_sessions')
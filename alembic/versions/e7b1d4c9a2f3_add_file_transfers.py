@@ -0,0 +1,49 @@
+"""add file transfers
+
+Revision ID: e7b1d4c9a2f3
+Revises: 9c4e2a7b3f61
+Create Date: 2026-10-18 19:03:27.518640
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b1d4c9a2f3'
+down_revision: Union[str, None] = '9c4e2a7b3f61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'file_transfers',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.Integer(), nullable=False),
+        sa.Column('direction', sa.String(length=16), nullable=False),
+        sa.Column('remote_path', sa.Text(), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('confirmed_offset', sa.BigInteger(), nullable=False),
+        sa.Column('remote_mtime', sa.Integer(), nullable=True),
+        sa.Column('sha256', sa.String(length=64), nullable=True),
+        sa.Column('overwrite', sa.Boolean(), server_default=sa.false(), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['client_id'], ['ssh_clients.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_file_transfers_id'), 'file_transfers', ['id'], unique=False)
+    op.create_index('ix_file_transfers_user_id_id', 'file_transfers', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_file_transfers_user_id_id', table_name='file_transfers')
+    op.drop_index(op.f('ix_file_transfers_id'), table_name='file_transfers')
+    op.drop_table('file_transfers')
@@ -1,4 +1,6 @@
 import os
+import asyncio
+import functools
 import secrets
 import qrcode
 import pyotp
@@ -6,6 +8,7 @@ import bcrypt
 import smtplib
 from io import BytesIO
 from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, List
 from email.mime.text import MIMEText
@@ -15,13 +18,19 @@ from sqlalchemy.orm import Session
 from app.models.user_model import User
 from app.core.config import settings
 
+# bcrypt releases the GIL while hashing, so a small thread pool hashes in
+# parallel without blocking the event loop
+password_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+)
+
 class AuthManager:
     """Authentication and MFA management class"""
     
     @staticmethod
     def hash_password(password: str) -> str:
         """Hash a password using bcrypt"""
-        salt = bcrypt.gensalt()
+        salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
         hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
         return hashed.decode('utf-8')
     
@@ -30,6 +39,21 @@ class AuthManager:
         """Verify a password against its hash"""
         return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
     
+    @staticmethod
+    def needs_rehash(hashed_password: str) -> bool:
+        """Check if a hash was made with a different work factor than configured"""
+        try:
+            rounds = int(hashed_password.split('$')[2])
+        except (IndexError, ValueError):
+            return True
+        return rounds != settings.BCRYPT_ROUNDS
+    
+    @staticmethod
+    async def run_password_task(func, *args, **kwargs):
+        """Run a call that hashes or verifies passwords on the bcrypt pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(password_executor, functools.partial(func, *args, **kwargs))
+    
     @staticmethod
     def generate_mfa_secret() -> str:
         """Generate a new MFA secret"""
@@ -1,27 +1,50 @@
-from fastapi import Request
-from fastapi.responses import RedirectResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
+import re
+from typing import Callable, Iterable
+from starlette.requests import Request
+from starlette.responses import RedirectResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
 from app.core.jwt_auth import verify_token
 import logging
 
 logger = logging.getLogger(__name__)
 
-class AuthMiddleware(BaseHTTPMiddleware):
+def compile_route_matcher(routes: Iterable[str]) -> Callable[[str], bool]:
+    """Build a single regex matching any of the given route prefixes.
+    
+    A prefix matches whole path segments ("/auth" matches "/auth/login" but
+    not "/authors"), and "/" only matches the root path itself.
+    """
+    patterns = []
+    for route in routes:
+        if route == "/":
+            patterns.append(r"/")
+        else:
+            patterns.append(re.escape(route.rstrip("/")) + r"(?:/.*)?")
+    if not patterns:
+        return lambda path: False
+    return re.compile("|".join(patterns)).fullmatch
+
+class AuthMiddleware:
     """Middleware to handle authentication redirects for protected routes"""
     
     PROTECTED_ROUTES = []  # Frontend handles auth check for main page
     PUBLIC_ROUTES = ["/auth", "/css", "/js", "/docs", "/openapi.json", "/"]  # Routes that don't require auth
     
-    async def dispatch(self, request: Request, call_next):
-        path = request.url.path
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.is_public = compile_route_matcher(self.PUBLIC_ROUTES)
+        self.protected_routes = frozenset(self.PROTECTED_ROUTES)
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.protected_routes:
+            await self.app(scope, receive, send)
+            return
         
-        # Skip auth check for public routes
-        if any(path.startswith(route) for route in self.PUBLIC_ROUTES):
-            return await call_next(request)
+        path = scope["path"]
         
         # Check if route requires authentication
-        if path in self.PROTECTED_ROUTES:
+        if path in self.protected_routes and not self.is_public(path):
+            request = Request(scope)
             # Check for JWT token in cookies or Authorization header
             token = None
             
@@ -37,9 +60,9 @@ class AuthMiddleware(BaseHTTPMiddleware):
             # If no token or invalid token, redirect to login
             if not token or not verify_token(token):
                 if request.headers.get("accept", "").startswith("text/html"):
-                    return RedirectResponse(url="/auth/login-page", status_code=302)
-                else:
-                    # For API calls, let the endpoint handle the 401
-                    pass
+                    response = RedirectResponse(url="/auth/login-page", status_code=302)
+                    await response(scope, receive, send)
+                    return
+                # For API calls, let the endpoint handle the 401
         
-        return await call_next(request)
\ No newline at end of file
+        await self.app(scope, receive, send)
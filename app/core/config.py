@@ -12,11 +12,20 @@ class Settings(BaseSettings):
     POSTGRES_HOST: Optional[str] = "localhost"
     POSTGRES_PORT: int = 5432
     
+    # Database connection pool settings (per engine, per worker process)
+    DB_POOL_SIZE: int = 5  # Connections kept open
+    DB_MAX_OVERFLOW: int = 10  # Extra connections opened under load
+    DB_POOL_TIMEOUT: float = 30.0  # Seconds a request waits for a connection
+    DB_POOL_RECYCLE: int = 300  # Replace connections older than this many seconds
+    DB_POOL_PRE_PING: bool = True  # Test connections on checkout; costs a round trip each
+    DB_POOL_SLOW_CHECKOUT_MS: float = 100.0  # Log checkouts that wait longer than this
+    
     # JWT settings
     SECRET_KEY: str = "your-secret-key-change-this-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
+    PRINCIPAL_CACHE_TTL: float = 30.0  # Seconds an authenticated user is served from memory
     
     # Email settings (optional)
     SMTP_SERVER: Optional[str] = None
@@ -25,9 +34,51 @@ class Settings(BaseSettings):
     SMTP_PASSWORD: Optional[str] = None
     SMTP_TLS: bool = True
     
+    # Password hashing settings
+    BCRYPT_ROUNDS: int = 12  # bcrypt work factor; existing hashes are upgraded on login
+    PASSWORD_HASH_WORKERS: int = 4  # Threads available for bcrypt hashing and verification
+    
     # MFA settings
     APP_NAME: str = "SSH Client"
     ISSUER_NAME: str = "SSH Client App"
+    
+    # SSH settings
+    SSH_EXECUTOR_WORKERS: int = 32  # Threads available for blocking paramiko calls
+    SSH_CONNECT_TIMEOUT: float = 10.0  # TCP connect timeout in seconds
+    SSH_BANNER_TIMEOUT: float = 15.0  # Wait for the server's SSH banner
+    SSH_AUTH_TIMEOUT: float = 15.0  # Wait for an authentication response
+    SSH_POOL_MAX_CONNECTIONS: int = 200  # Pooled connections kept per worker
+    SSH_POOL_IDLE_TIMEOUT: float = 300.0  # Close unused pooled connections after this many seconds
+    SSH_KEY_CACHE_SIZE: int = 256  # Parsed private keys kept in memory
+    KNOWN_HOSTS_CACHE_TTL: float = 60.0  # Seconds a pinned host key is served from memory
+    SSH_BULK_CONCURRENCY: int = 20  # Hosts contacted in parallel by bulk operations
+    SSH_EXEC_DEFAULT_TIMEOUT: float = 30.0  # Per-host limit for fan-out commands
+    SSH_EXEC_MAX_TIMEOUT: float = 3600.0  # Longest per-host limit a caller may request
+    SSH_EXEC_MAX_OUTPUT_BYTES: int = 1048576  # Output streamed per host before truncating
+    SSH_EXEC_WORKERS: int = 8  # Threads for fan-out commands and transfer hashes, kept apart from the interactive SSH executor
+    SFTP_READ_WINDOW_BYTES: int = 4 * 1024 * 1024  # Download data requested ahead per round of pipelined reads
+    SFTP_TRANSFER_SEGMENT_BYTES: int = 8 * 1024 * 1024  # Upload progress is confirmed and saved this often
+    SFTP_HASH_TIMEOUT: float = 600.0  # Longest a remote sha256sum may run when verifying a transfer
+    SSH_TUNNEL_MAX_PER_USER: int = 64  # Forwarded connections a user may have open at once
+    SSH_TUNNEL_OPEN_TIMEOUT: float = 10.0  # Wait for the host to connect a forwarded port
+    SSH_TUNNEL_READ_BUFFER_MAX: int = 65536  # Read size ceiling for forwarded connection data
+    SSH_TUNNEL_WORKERS: int = 16  # Threads sending forwarded data, kept apart from the interactive SSH executor
+    SSH_TUNNEL_SEND_TIMEOUT: float = 30.0  # Close a tunnel whose target stops reading for this long
+    CLIENT_IMPORT_MAX_BYTES: int = 10 * 1024 * 1024  # Largest accepted host inventory upload
+    
+    # Terminal streaming settings
+    TERMINAL_READ_BUFFER_MIN: int = 4096  # Initial channel read size in bytes
+    TERMINAL_READ_BUFFER_MAX: int = 65536  # Read size ceiling during bulk output
+    TERMINAL_FLUSH_BYTES: int = 65536  # Send a frame once this much output is buffered
+    TERMINAL_FLUSH_INTERVAL_MS: float = 3.0  # Max time bulk output waits to be coalesced
+    TERMINAL_DETACH_GRACE_SECONDS: float = 300.0  # Keep detached sessions alive this long
+    TERMINAL_SCROLLBACK_BYTES: int = 262144  # Output replayed when a session is reattached
+    
+    # Session recording settings
+    SESSION_RECORDINGS_DIR: str = "./recordings"  # Where asciicast recordings are stored
+    SESSION_RECORDING_FLUSH_BYTES: int = 65536  # Hand output to the writer once this much is buffered
+    SESSION_RECORDING_FLUSH_INTERVAL_MS: float = 1000.0  # Max time output waits before being written
+    SESSION_RECORDING_COMPRESSLEVEL: int = 6  # gzip level used for recordings
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,94 @@
+"""
+Resumable file transfers over SFTP.
+
+Every transfer has a database row recording how far it has been confirmed.
+Uploads go to a partial file next to the target and are written in
+segments: each segment is a burst of pipelined SFTP writes, confirmed by
+closing the remote handle (which waits for every write reply) before its
+end offset is stored. An interrupted upload resumes from the last
+confirmed offset. Downloads resume from the offset the client already
+holds, and are refused if the remote file changed in between.
+
+Integrity is checked on the remote host with sha256sum, so verifying a
+multi-GB file never reads it back over the network.
+"""
+import re
+import shlex
+import threading
+from typing import AsyncIterator, Awaitable, Callable
+
+import paramiko
+
+from app.core.sftp import MAX_REQUEST_SIZE, coalesce_chunks
+from app.core.ssh_bulk import exec_streaming
+
+TRANSFER_DIRECTIONS = ("upload", "download")
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class TransferError(Exception):
+    """Raised when a transfer cannot continue from its recorded state"""
+
+
+def partial_path(remote_path: str, transfer_id: int) -> str:
+    """Return where an upload is written until it has been verified"""
+    return f"{remote_path}.part-{transfer_id}"
+
+
+def remote_sha256(ssh_client: paramiko.SSHClient, path: str, timeout: float) -> str:
+    """Hash a remote file with sha256sum on the host itself (blocking)"""
+    output = {"stdout": "", "stderr": ""}
+
+    def collect(stream, text):
+        if stream in output:
+            output[stream] += text
+
+    status = exec_streaming(
+        ssh_client, f"sha256sum -- {shlex.quote(path)}", timeout, 4096, collect, threading.Event()
+    )
+    # Names with special characters are printed with a leading backslash
+    digest = output["stdout"].split(" ", 1)[0].lstrip("\\").lower()
+    if status != 0 or not SHA256_PATTERN.match(digest):
+        raise TransferError(f"sha256sum failed: {output['stderr'].strip() or f'exit status {status}'}")
+    return digest
+
+
+async def upload_segments(executor, sftp: paramiko.SFTPClient, path: str, body: AsyncIterator[bytes],
+                          offset: int, limit: int, segment_bytes: int,
+                          confirm: Callable[[int], Awaitable[None]]) -> int:
+    """Write the body into an existing remote file from offset on.
+
+    confirm(offset) is awaited after every segment once the server has
+    acknowledged all of its writes. Returns the final confirmed offset.
+    Raises TransferError if the body would go past limit.
+    """
+    remote_file = None
+    segment_end = offset
+    try:
+        async for data in coalesce_chunks(body, MAX_REQUEST_SIZE):
+            if offset + len(data) > limit:
+                raise TransferError(f"Upload exceeds the declared size of {limit} bytes")
+            if remote_file is None:
+                remote_file = await executor.run(sftp.open, path, "r+b")
+                remote_file.seek(offset)
+                remote_file.set_pipelined(True)
+                segment_end = offset + segment_bytes
+            await executor.run(remote_file.write, data)
+            offset += len(data)
+            if offset >= segment_end:
+                # Closing waits for the replies to the segment's pipelined writes
+                closing, remote_file = remote_file, None
+                await executor.run(closing.close)
+                await confirm(offset)
+        if remote_file is not None:
+            closing, remote_file = remote_file, None
+            await executor.run(closing.close)
+            await confirm(offset)
+    finally:
+        if remote_file is not None:
+            try:
+                await executor.run(remote_file.close)
+            except Exception:
+                # Already failing; the segment simply stays unconfirmed
+                pass
+    return offset
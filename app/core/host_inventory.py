@@ -0,0 +1,156 @@
+"""
+Parsing and rendering of host inventories for bulk import and export.
+
+Imports accept CSV, JSON (a list of hosts or the export's {"clients": [...]})
+or an OpenSSH client config. Every entry is validated with the same schema
+as a single create, and parse errors are collected per entry so a file can
+be fixed and resubmitted in one go.
+"""
+import csv
+import fnmatch
+import io
+import json
+import re
+from typing import Dict, Iterable, List, Tuple
+
+from pydantic import ValidationError
+
+from app.schemas import user_schema
+
+IMPORT_FORMATS = ("csv", "json", "ssh_config")
+EXPORT_FORMATS = ("csv", "json")
+EXPORT_FIELDS = ("label", "host", "port", "username", "group_name", "detected_os")
+
+ParseResult = Tuple[List[user_schema.SSHClient], List[dict]]
+
+CONFIG_LINE = re.compile(r"^(\w+)(?:\s*=\s*|\s+|$)(.*)$")
+# The only ssh_config options an imported client uses
+CONFIG_OPTIONS = ("hostname", "user", "port")
+
+
+def guess_format(filename: str) -> str:
+    """Infer the import format from an upload's file name"""
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith(".json"):
+        return "json"
+    return "ssh_config"
+
+
+def parse_inventory(text: str, fmt: str) -> ParseResult:
+    """Parse an inventory file into validated clients and per-entry errors"""
+    if fmt == "csv":
+        entries = enumerate(csv.DictReader(io.StringIO(text)), start=2)
+    elif fmt == "json":
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            return [], [{"entry": None, "error": f"Invalid JSON: {e}"}]
+        if isinstance(data, dict):
+            data = data.get("clients", [])
+        if not isinstance(data, list):
+            return [], [{"entry": None, "error": "Expected a list of hosts"}]
+        entries = enumerate(data, start=1)
+    elif fmt == "ssh_config":
+        entries, config_errors = parse_ssh_config(text)
+        clients, errors = validate_entries(entries)
+        return clients, config_errors + errors
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+    return validate_entries(entries)
+
+
+def parse_ssh_config(text: str) -> Tuple[List[Tuple[str, dict]], List[dict]]:
+    """Return one entry per concrete Host block of an OpenSSH client config.
+
+    Wildcard patterns only contribute defaults (e.g. "Host *" / "User"), and
+    the first alias of a block names the host. As in ssh, the first value
+    found for an option wins. Only Host, HostName, User and Port are read;
+    Match blocks are reported and skipped rather than evaluated, since
+    "Match exec" would run commands on the server.
+    """
+    # Options before the first Host line apply to every host
+    blocks: List[Tuple[List[str], Dict[str, str]]] = [(["*"], {})]
+    options = blocks[0][1]
+    errors = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        match = CONFIG_LINE.match(line)
+        if not match:
+            errors.append({"entry": f"line {number}", "error": "Expected a keyword and a value"})
+            continue
+        keyword, value = match.group(1).lower(), match.group(2).strip()
+        if keyword == "host":
+            if not value:
+                errors.append({"entry": f"line {number}", "error": "Host needs at least one pattern"})
+                options = None
+                continue
+            options = {}
+            blocks.append((value.split(), options))
+        elif keyword == "match":
+            errors.append({"entry": f"line {number}", "error": "Match blocks are not supported"})
+            options = None
+        elif keyword in CONFIG_OPTIONS and options is not None:
+            options.setdefault(keyword, value.strip('"'))
+
+    entries, seen = [], set()
+    for patterns, _ in blocks[1:]:
+        aliases = [
+            alias for alias in patterns
+            if not alias.startswith("!") and not any(c in alias for c in "*?")
+        ]
+        if not aliases or aliases[0] in seen:
+            continue
+        alias = aliases[0]
+        seen.add(alias)
+        values = {}
+        for block_patterns, block_options in blocks:
+            if host_matches(alias, block_patterns):
+                for key, value in block_options.items():
+                    values.setdefault(key, value)
+        entries.append((alias, {
+            "label": alias,
+            "host": values.get("hostname", alias),
+            "port": values.get("port", 22),
+            "username": values.get("user"),
+        }))
+    return entries, errors
+
+
+def host_matches(alias: str, patterns: List[str]) -> bool:
+    """Match a host against a Host line's patterns; any negated match excludes it"""
+    if any(fnmatch.fnmatch(alias, pattern[1:]) for pattern in patterns if pattern.startswith("!")):
+        return False
+    return any(fnmatch.fnmatch(alias, pattern) for pattern in patterns if not pattern.startswith("!"))
+
+
+def validate_entries(entries: Iterable[Tuple[object, dict]]) -> ParseResult:
+    clients, errors = [], []
+    for position, entry in entries:
+        if not isinstance(entry, dict):
+            errors.append({"entry": position, "error": "Expected an object"})
+            continue
+        # Blank CSV cells mean "not set"
+        values = {key: value for key, value in entry.items() if key and value not in ("", None)}
+        values.setdefault("port", 22)
+        try:
+            clients.append(user_schema.SSHClient(**values))
+        except ValidationError as e:
+            problems = "; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+            )
+            errors.append({"entry": position, "error": problems})
+    return clients, errors
+
+
+def render_csv_header() -> str:
+    return render_csv_row(EXPORT_FIELDS)
+
+
+def render_csv_row(values: Iterable) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(["" if value is None else value for value in values])
+    return buffer.getvalue()
@@ -1,15 +1,57 @@
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Tuple
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.core.config import settings
 from app.dependencies import get_db
 from app.models.user_model import User
+from app.schemas.user_schema import Principal
 
 security = HTTPBearer()
 
+class PrincipalCache:
+    """Short-lived in-process cache of authenticated users, keyed by user id.
+    
+    Entries are dropped explicitly whenever an account's email, status or
+    existence changes, so the TTL only bounds staleness across workers.
+    """
+    
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[int, Tuple[float, Principal]] = {}
+        # Sync dependencies resolve on the threadpool
+        self._lock = threading.Lock()
+    
+    def get(self, user_id: int) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[user_id]
+                return None
+            return entry[1]
+    
+    def put(self, principal: Principal):
+        with self._lock:
+            self._entries[principal.id] = (time.monotonic() + self.ttl, principal)
+    
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+principal_cache = PrincipalCache(settings.PRINCIPAL_CACHE_TTL)
+
+def token_claims(user: User) -> dict:
+    """Claims identifying a user in access and refresh tokens"""
+    return {"sub": user.email, "uid": user.id, "active": user.is_active}
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
     to_encode = data.copy()
@@ -45,6 +87,82 @@ def verify_token(token: str) -> Optional[str]:
     except JWTError:
         return None
 
+def decode_token(token: str) -> Optional[dict]:
+    """Verify JWT token and return its claims"""
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("sub") is None:
+        return None
+    return payload
+
+def _cached_principal(payload: dict) -> Optional[Principal]:
+    user_id = payload.get("uid")
+    if user_id is None:
+        return None
+    if payload.get("active") is False:
+        # Tokens minted for a disabled account never need a lookup
+        return Principal(id=user_id, email=payload["sub"], is_active=False)
+    return principal_cache.get(user_id)
+
+def _principal_query(payload: dict):
+    query = select(User.id, User.email, User.is_active)
+    if payload.get("uid") is not None:
+        return query.where(User.id == payload["uid"])
+    # Tokens issued before ids were embedded only carry the email
+    return query.where(User.email == payload["sub"])
+
+def _load_principal(row) -> Optional[Principal]:
+    if row is None:
+        return None
+    principal = Principal(id=row.id, email=row.email, is_active=row.is_active)
+    principal_cache.put(principal)
+    return principal
+
+def _match_token(payload: dict, principal: Optional[Principal]) -> Optional[Principal]:
+    # Tokens issued under a previous email stop working once it changes
+    if principal is None or principal.email != payload["sub"]:
+        return None
+    return principal
+
+def resolve_principal(token: str, db: Session) -> Optional[Principal]:
+    """Resolve a token to its user, hitting the database only on a cache miss"""
+    payload = decode_token(token)
+    if payload is None:
+        return None
+    principal = _cached_principal(payload)
+    if principal is None:
+        principal = _load_principal(db.execute(_principal_query(payload)).first())
+    return _match_token(payload, principal)
+
+async def resolve_principal_async(token: str, db: AsyncSession) -> Optional[Principal]:
+    """Async variant of resolve_principal for code running on the event loop"""
+    payload = decode_token(token)
+    if payload is None:
+        return None
+    principal = _cached_principal(payload)
+    if principal is None:
+        result = await db.execute(_principal_query(payload))
+        principal = _load_principal(result.first())
+    return _match_token(payload, principal)
+
+def get_current_principal(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+) -> Principal:
+    """Get the current active user's identity without loading the full user"""
+    principal = resolve_principal(credentials.credentials, db)
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if not principal.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return principal
+
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
@@ -81,17 +199,13 @@ def get_current_verified_user(current_user: User = Depends(get_current_active_us
         )
     return current_user
 
-async def get_current_user_from_token(token: str, db: Session) -> User:
+async def get_current_user_from_token(token: str, db: AsyncSession) -> Principal:
     """Get current user from token string (for WebSockets)"""
-    email = verify_token(token)
-    if email is None:
+    principal = await resolve_principal_async(token, db)
+    if principal is None:
         raise HTTPException(status_code=401, detail="Invalid token")
-    
-    user = db.query(User).filter(User.email == email).first()
-    if user is None:
-        raise HTTPException(status_code=401, detail="User not found")
         
-    if not user.is_active:
+    if not principal.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
         
-    return user
\ No newline at end of file
+    return principal
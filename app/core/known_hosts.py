@@ -0,0 +1,138 @@
+"""
+Known-hosts store for SSH connections.
+
+Host keys are pinned per user on first connect and kept in the database,
+with a short-lived in-memory cache in front of it. A pinned key is handed to paramiko
+before connecting, which makes it offer that key type first during
+negotiation and reject the connection if the server's key has changed.
+"""
+import base64
+import hashlib
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import paramiko
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.user_model import KnownHost
+
+logger = logging.getLogger(__name__)
+
+HostKey = Tuple[int, str, int]
+
+
+def host_key_name(host: str, port: int) -> str:
+    """Return the known_hosts style name paramiko uses for host and port"""
+    return host if port == 22 else f"[{host}]:{port}"
+
+
+def fingerprint(key: paramiko.PKey) -> str:
+    """Return the OpenSSH style SHA256 fingerprint of a public key"""
+    digest = hashlib.sha256(key.asbytes()).digest()
+    return "SHA256:" + base64.b64encode(digest).decode().rstrip("=")
+
+
+class KnownHostStore:
+    """Database-backed host keys with an in-memory cache.
+
+    forget() only clears this worker's cache, so the TTL bounds how long
+    other workers keep rejecting a host that was legitimately re-keyed.
+    """
+
+    def __init__(self, session_factory=SessionLocal, ttl: float = settings.KNOWN_HOSTS_CACHE_TTL):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self._cache: Dict[HostKey, Tuple[float, paramiko.PKey]] = {}
+        # Lookups happen on SSH executor threads
+        self._lock = threading.Lock()
+
+    def lookup(self, user_id: int, host: str, port: int) -> Optional[paramiko.PKey]:
+        """Return the pinned key for a host, if any"""
+        cache_key = (user_id, host, port)
+        with self._lock:
+            entry = self._cache.get(cache_key)
+            if entry is not None:
+                if entry[0] >= time.monotonic():
+                    return entry[1]
+                del self._cache[cache_key]
+
+        db = self.session_factory()
+        try:
+            row = db.query(KnownHost).filter(
+                KnownHost.user_id == user_id,
+                KnownHost.host == host,
+                KnownHost.port == port
+            ).first()
+            if row is None:
+                return None
+            key = paramiko.PKey.from_type_string(row.key_type, base64.b64decode(row.key_data))
+        finally:
+            db.close()
+
+        self._remember(cache_key, key)
+        return key
+
+    def pin(self, user_id: int, host: str, port: int, key: paramiko.PKey):
+        """Remember a host's key for future connections"""
+        db = self.session_factory()
+        try:
+            db.add(KnownHost(
+                user_id=user_id,
+                host=host,
+                port=port,
+                key_type=key.get_name(),
+                key_data=key.get_base64(),
+                fingerprint=fingerprint(key)
+            ))
+            db.commit()
+            logger.info(f"Pinned {key.get_name()} host key for {host}:{port}: {fingerprint(key)}")
+        except IntegrityError:
+            # Another connection pinned the host first; keep its key
+            db.rollback()
+            return
+        finally:
+            db.close()
+
+        self._remember((user_id, host, port), key)
+
+    def forget(self, user_id: int, host: str, port: int) -> bool:
+        """Drop a pinned key, e.g. after the host was legitimately re-keyed"""
+        db = self.session_factory()
+        try:
+            deleted = db.query(KnownHost).filter(
+                KnownHost.user_id == user_id,
+                KnownHost.host == host,
+                KnownHost.port == port
+            ).delete()
+            db.commit()
+        finally:
+            db.close()
+
+        with self._lock:
+            self._cache.pop((user_id, host, port), None)
+        return bool(deleted)
+
+    def _remember(self, cache_key: HostKey, key: paramiko.PKey):
+        with self._lock:
+            self._cache[cache_key] = (time.monotonic() + self.ttl, key)
+
+
+class PinningPolicy(paramiko.MissingHostKeyPolicy):
+    """Trust a host's key on first use and pin it for later connections"""
+
+    def __init__(self, store: KnownHostStore, user_id: int, host: str, port: int):
+        self.store = store
+        self.user_id = user_id
+        self.host = host
+        self.port = port
+
+    def missing_host_key(self, client, hostname, key):
+        self.store.pin(self.user_id, self.host, self.port, key)
+        client.get_host_keys().add(hostname, key.get_name(), key)
+
+
+known_hosts = KnownHostStore()
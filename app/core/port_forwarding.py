@@ -0,0 +1,309 @@
+"""
+TCP port forwarding through WebSocket tunnels.
+
+Browsers and local helper tools cannot speak SSH, so every forwarded TCP
+connection is carried by one WebSocket whose binary frames are the
+connection's bytes. On the host side a direct-tcpip channel is opened on
+the pooled transport of the saved client, so forwarding many connections
+costs no extra handshakes.
+
+A tunnel either connects to a fixed host and port (local forwarding) or
+reads a SOCKS5 CONNECT request from the start of the stream (dynamic
+forwarding), so a local tool such as websocat can expose it as a SOCKS
+proxy for a browser.
+
+Sending blocks while the target leaves the SSH window full, so tunnels
+send on their own executor and give up after SSH_TUNNEL_SEND_TIMEOUT:
+a target that stops reading cannot hold threads that terminals need.
+"""
+import asyncio
+import ipaddress
+import itertools
+import logging
+import struct
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import paramiko
+from paramiko.common import OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED, OPEN_FAILED_CONNECT_FAILED
+
+from app.core.config import settings
+from app.core.ssh_bridge import ChannelReader
+from app.core.ssh_executor import SSHExecutor
+from app.core.ssh_pool import SSHConnectionManager, PooledConnection, ssh_pool
+
+logger = logging.getLogger(__name__)
+
+TUNNEL_MODES = ("direct", "socks")
+
+SOCKS_VERSION = 5
+SOCKS_NO_AUTH = 0x00
+SOCKS_NO_ACCEPTABLE_METHODS = 0xFF
+SOCKS_CONNECT = 0x01
+SOCKS_ATYP_IPV4 = 0x01
+SOCKS_ATYP_DOMAIN = 0x03
+SOCKS_ATYP_IPV6 = 0x04
+
+SOCKS_SUCCEEDED = 0x00
+SOCKS_GENERAL_FAILURE = 0x01
+SOCKS_NOT_ALLOWED = 0x02
+SOCKS_HOST_UNREACHABLE = 0x04
+SOCKS_CONNECTION_REFUSED = 0x05
+SOCKS_COMMAND_NOT_SUPPORTED = 0x07
+SOCKS_ADDRESS_TYPE_NOT_SUPPORTED = 0x08
+
+
+class TunnelError(Exception):
+    """Raised when a tunnel cannot be set up; reply is the SOCKS status to report"""
+
+    def __init__(self, message: str, reply: int = SOCKS_GENERAL_FAILURE):
+        super().__init__(message)
+        self.reply = reply
+
+
+def validate_target(host: str, port: int):
+    """Check a forwarding destination; raises ValueError"""
+    if not host or len(host) > 255:
+        raise ValueError("Target host must be 1-255 characters")
+    if not 1 <= port <= 65535:
+        raise ValueError("Target port must be between 1 and 65535")
+
+
+def socks_reply(reply: int) -> bytes:
+    """Build a SOCKS5 reply; the bound address is not meaningful here"""
+    return bytes([SOCKS_VERSION, reply, 0, SOCKS_ATYP_IPV4]) + bytes(6)
+
+
+class FrameReader:
+    """Read a byte stream that arrives as WebSocket frames.
+
+    receive() returns the next frame's bytes, or None once the WebSocket
+    is closed. Bytes read ahead during a handshake are kept and returned
+    first by read().
+    """
+
+    def __init__(self, receive: Callable[[], Awaitable[Optional[bytes]]]):
+        self._receive = receive
+        self._buffer = bytearray()
+
+    async def readexactly(self, size: int) -> bytes:
+        while len(self._buffer) < size:
+            data = await self._receive()
+            if data is None:
+                raise TunnelError("Connection closed during the SOCKS handshake")
+            self._buffer += data
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    async def read(self) -> Optional[bytes]:
+        """Return the next chunk of the stream, or None at the end"""
+        if self._buffer:
+            data = bytes(self._buffer)
+            self._buffer.clear()
+            return data
+        return await self._receive()
+
+
+async def socks_handshake(reader: FrameReader, send: Callable[[bytes], Awaitable[None]]) -> Tuple[str, int]:
+    """Negotiate a SOCKS5 CONNECT request and return its (host, port).
+
+    Only the no-authentication method is offered: the WebSocket itself is
+    already authenticated. A refused request is answered here; the success
+    reply is left to the caller, which sends it once the host has connected
+    the target.
+    """
+    version, count = await reader.readexactly(2)
+    if version != SOCKS_VERSION:
+        raise TunnelError(f"Unsupported SOCKS version {version}")
+    methods = await reader.readexactly(count)
+    if SOCKS_NO_AUTH not in methods:
+        await send(bytes([SOCKS_VERSION, SOCKS_NO_ACCEPTABLE_METHODS]))
+        raise TunnelError("SOCKS client requires authentication")
+    await send(bytes([SOCKS_VERSION, SOCKS_NO_AUTH]))
+
+    try:
+        host, port = await read_socks_request(reader)
+    except TunnelError as e:
+        await send(socks_reply(e.reply))
+        raise
+    return host, port
+
+
+async def read_socks_request(reader: FrameReader) -> Tuple[str, int]:
+    """Parse the SOCKS5 request that follows method negotiation"""
+    version, command, _, address_type = await reader.readexactly(4)
+    if version != SOCKS_VERSION:
+        raise TunnelError(f"Unsupported SOCKS version {version}")
+    if address_type == SOCKS_ATYP_IPV4:
+        host = str(ipaddress.IPv4Address(await reader.readexactly(4)))
+    elif address_type == SOCKS_ATYP_IPV6:
+        host = str(ipaddress.IPv6Address(await reader.readexactly(16)))
+    elif address_type == SOCKS_ATYP_DOMAIN:
+        length, = await reader.readexactly(1)
+        host = (await reader.readexactly(length)).decode("idna")
+    else:
+        raise TunnelError(f"Unsupported address type {address_type}", SOCKS_ADDRESS_TYPE_NOT_SUPPORTED)
+    port, = struct.unpack("!H", await reader.readexactly(2))
+    if command != SOCKS_CONNECT:
+        raise TunnelError(f"Unsupported SOCKS command {command}", SOCKS_COMMAND_NOT_SUPPORTED)
+    try:
+        validate_target(host, port)
+    except ValueError as e:
+        raise TunnelError(str(e), SOCKS_NOT_ALLOWED)
+    return host, port
+
+
+class Tunnel:
+    """One forwarded TCP connection and its byte counters"""
+
+    def __init__(self, tunnel_id: int, user_id: int, client_id: int, mode: str, registry: "TunnelRegistry"):
+        self.id = tunnel_id
+        self.user_id = user_id
+        self.client_id = client_id
+        self.mode = mode
+        self.registry = registry
+        self.host = None
+        self.port = None
+        self.bytes_sent = 0  # From the WebSocket to the target
+        self.bytes_received = 0  # From the target to the WebSocket
+        self.opened_at = time.time()
+        self.conn: Optional[PooledConnection] = None
+        self.channel: Optional[paramiko.Channel] = None
+        self.closed = False
+
+    def describe(self) -> dict:
+        return {
+            "id": self.id,
+            "client_id": self.client_id,
+            "mode": self.mode,
+            "host": self.host,
+            "port": self.port,
+            "connected": self.channel is not None,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "opened_at": self.opened_at,
+        }
+
+    async def connect(self, client_details, host: str, port: int):
+        """Open a direct-tcpip channel to host:port on the client's pooled connection"""
+        self.host, self.port = host, port
+        pool = self.registry.pool
+        conn = await pool.acquire(self.user_id, client_details)
+        try:
+            self.channel = await pool.open_forward(conn, host, port, self.registry.open_timeout)
+        except paramiko.ChannelException as e:
+            pool.release(conn)
+            if e.code == OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED:
+                raise TunnelError(f"Forwarding to {host}:{port} is not allowed by the host", SOCKS_NOT_ALLOWED)
+            if e.code == OPEN_FAILED_CONNECT_FAILED:
+                raise TunnelError(f"Host could not connect to {host}:{port}", SOCKS_CONNECTION_REFUSED)
+            raise TunnelError(f"Forwarding to {host}:{port} failed: {e}")
+        except paramiko.SSHException as e:
+            pool.release(conn)
+            raise TunnelError(f"Forwarding to {host}:{port} failed: {e}", SOCKS_HOST_UNREACHABLE)
+        except Exception:
+            pool.release(conn)
+            raise
+        self.conn = conn
+        logger.info(f"Tunnel {self.id} forwarding to {host}:{port} via client {self.client_id}.")
+
+    async def run(self, reader: FrameReader, send: Callable[[bytes], Awaitable[None]]):
+        """Copy bytes both ways until either side closes"""
+        executor = self.registry.executor
+        send_timeout = self.registry.send_timeout
+        channel_reader = ChannelReader(
+            self.channel, settings.TERMINAL_READ_BUFFER_MIN, settings.SSH_TUNNEL_READ_BUFFER_MAX
+        ).start()
+
+        async def downstream():
+            async for data in channel_reader:
+                self.bytes_received += len(data)
+                await send(data)
+
+        async def upstream():
+            while True:
+                data = await reader.read()
+                if data is None:
+                    return
+                if data:
+                    self.bytes_sent += len(data)
+                    # sendall blocks while the SSH window is full, which
+                    # pushes back on a fast sender. A thread still stuck
+                    # after the timeout is released when close() closes
+                    # the channel.
+                    try:
+                        await asyncio.wait_for(executor.run(self.channel.sendall, data), send_timeout)
+                    except asyncio.TimeoutError:
+                        raise TunnelError(f"{self.host}:{self.port} stopped reading for {send_timeout:g}s")
+
+        tasks = [asyncio.create_task(downstream()), asyncio.create_task(upstream())]
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            channel_reader.close()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def close(self):
+        """Close the channel and give the connection back to the pool"""
+        if self.closed:
+            return
+        self.closed = True
+        self.registry._forget(self)
+        if self.channel is not None:
+            await self.registry.pool.executor.run(self.channel.close)
+        if self.conn is not None:
+            self.registry.pool.release(self.conn)
+        logger.info(
+            f"Tunnel {self.id} to {self.host}:{self.port} closed after sending {self.bytes_sent} "
+            f"and receiving {self.bytes_received} bytes."
+        )
+
+
+class TunnelRegistry:
+    """Open tunnels of this worker, so they can be listed with their counters"""
+
+    def __init__(self, pool: SSHConnectionManager, max_per_user: int, open_timeout: float,
+                 executor: Optional[SSHExecutor] = None, send_timeout: float = settings.SSH_TUNNEL_SEND_TIMEOUT):
+        self.pool = pool
+        self.max_per_user = max_per_user
+        self.open_timeout = open_timeout
+        # Data is sent on this executor; the pool's own is used if none is given
+        self.executor = executor or pool.executor
+        self.send_timeout = send_timeout
+        self._tunnels: Dict[int, Tunnel] = {}
+        self._ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self._tunnels)
+
+    def create(self, user_id: int, client_id: int, mode: str) -> Tunnel:
+        """Register a new tunnel; raises TunnelError if the user has too many open"""
+        if mode not in TUNNEL_MODES:
+            raise ValueError(f"Unsupported tunnel mode: {mode}")
+        if len(self.list(user_id)) >= self.max_per_user:
+            raise TunnelError(f"Tunnel limit of {self.max_per_user} reached")
+        tunnel = Tunnel(next(self._ids), user_id, client_id, mode, self)
+        self._tunnels[tunnel.id] = tunnel
+        return tunnel
+
+    def list(self, user_id: int) -> List[Tunnel]:
+        """Return a user's open tunnels, oldest first"""
+        return [tunnel for tunnel in self._tunnels.values() if tunnel.user_id == user_id]
+
+    def _forget(self, tunnel: Tunnel):
+        if self._tunnels.get(tunnel.id) is tunnel:
+            del self._tunnels[tunnel.id]
+
+
+tunnels = TunnelRegistry(
+    ssh_pool,
+    max_per_user=settings.SSH_TUNNEL_MAX_PER_USER,
+    open_timeout=settings.SSH_TUNNEL_OPEN_TIMEOUT,
+    executor=SSHExecutor(settings.SSH_TUNNEL_WORKERS),
+    send_timeout=settings.SSH_TUNNEL_SEND_TIMEOUT,
+)
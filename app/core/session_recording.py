@@ -0,0 +1,219 @@
+"""
+Terminal session recording in asciicast v2 format.
+
+Recording must not add latency to the live bridge, so the event loop only
+appends timestamped output chunks to a list. Batches go to a single writer
+thread that decodes, serialises and gzip-compresses them, which also keeps
+the events of every recording in order. Each batch ends with a sync flush,
+so a recording can be downloaded and replayed while the shell is still
+running.
+"""
+import asyncio
+import codecs
+import gzip
+import json
+import logging
+import os
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Iterator
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.user_model import SessionRecording
+
+logger = logging.getLogger(__name__)
+
+ASCIICAST_VERSION = 2
+READ_CHUNK_SIZE = 65536
+
+
+class SessionRecorder:
+    """Buffers the output of one terminal and writes it as an asciicast"""
+
+    def __init__(self, writer: "RecordingWriter", user_id: int, client_details, cols: int, rows: int):
+        self.writer = writer
+        self.user_id = user_id
+        self.client_id = client_details.id
+        self.title = f"{client_details.label} ({client_details.username}@{client_details.host})"
+        self.recording_id = None
+        self.closed = False
+        self.started = time.monotonic()
+        self._events = []
+        self._pending_bytes = 0
+        self._timer = None
+        self._file = None
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        writer.submit(self._open, cols, rows, time.time())
+
+    def output(self, data: bytes):
+        """Record a chunk of terminal output"""
+        self._record("o", data)
+        self._pending_bytes += len(data)
+        if self._pending_bytes >= self.writer.flush_bytes:
+            self.flush()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.writer.flush_interval, self.flush)
+
+    def resize(self, cols: int, rows: int):
+        """Record a change of the terminal geometry"""
+        self._record("r", f"{cols}x{rows}")
+
+    def flush(self):
+        """Hand buffered events to the writer thread"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._events:
+            return
+        events, self._events, self._pending_bytes = self._events, [], 0
+        self.writer.submit(self._write, events)
+
+    async def close(self):
+        """Write what is left and finalise the recording"""
+        if self.closed:
+            return
+        self.flush()
+        self.closed = True
+        await asyncio.wrap_future(self.writer.submit(self._finish))
+
+    def _record(self, kind: str, data):
+        if not self.closed:
+            self._events.append((time.monotonic() - self.started, kind, data))
+
+    # The methods below run on the writer thread
+
+    def _open(self, cols: int, rows: int, timestamp: float):
+        filename = os.path.join(str(self.user_id), f"{uuid.uuid4().hex}.cast.gz")
+        path = self.writer.path_for(filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = gzip.open(path, "wb", compresslevel=self.writer.compresslevel)
+        header = {
+            "version": ASCIICAST_VERSION,
+            "width": cols,
+            "height": rows,
+            "timestamp": int(timestamp),
+            "title": self.title,
+        }
+        self._file.write(json.dumps(header).encode() + b"\n")
+        self._file.flush(zlib.Z_SYNC_FLUSH)
+
+        db = self.writer.session_factory()
+        try:
+            recording = SessionRecording(
+                user_id=self.user_id,
+                client_id=self.client_id,
+                title=self.title,
+                path=filename,
+                cols=cols,
+                rows=rows,
+                size_bytes=0
+            )
+            db.add(recording)
+            db.commit()
+            self.recording_id = recording.id
+        finally:
+            db.close()
+        logger.info(f"Recording terminal session for client {self.client_id} to {filename}.")
+
+    def _write(self, events):
+        if self._file is None:
+            return
+        lines = []
+        for elapsed, kind, data in events:
+            if kind == "o":
+                data = self._decoder.decode(data)
+                if not data:
+                    continue
+            lines.append(json.dumps([round(elapsed, 6), kind, data], ensure_ascii=False))
+        if lines:
+            self._file.write("\n".join(lines).encode() + b"\n")
+            self._file.flush(zlib.Z_SYNC_FLUSH)
+
+    def _finish(self):
+        if self._file is None:
+            return
+        tail = self._decoder.decode(b"", final=True)
+        if tail:
+            event = [round(time.monotonic() - self.started, 6), "o", tail]
+            self._file.write(json.dumps(event, ensure_ascii=False).encode() + b"\n")
+        path = self._file.name
+        self._file.close()
+        self._file = None
+
+        db = self.writer.session_factory()
+        try:
+            db.query(SessionRecording).filter(SessionRecording.id == self.recording_id).update({
+                "ended_at": datetime.now(timezone.utc),
+                "size_bytes": os.path.getsize(path)
+            })
+            db.commit()
+        finally:
+            db.close()
+
+
+class RecordingWriter:
+    """Single background thread that writes every recording of this worker"""
+
+    def __init__(self, directory: str, flush_bytes: int, flush_interval: float,
+                 compresslevel: int = 6, session_factory=SessionLocal):
+        self.directory = directory
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.compresslevel = compresslevel
+        self.session_factory = session_factory
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recording")
+
+    def start(self, user_id: int, client_details, cols: int, rows: int) -> SessionRecorder:
+        """Begin recording a new terminal session"""
+        return SessionRecorder(self, user_id, client_details, cols, rows)
+
+    def submit(self, func, *args):
+        """Queue a blocking write; failures are logged, never raised on the bridge"""
+        return self._executor.submit(self._run, func, *args)
+
+    def path_for(self, filename: str) -> str:
+        """Resolve a stored recording filename inside the recordings directory"""
+        return os.path.join(self.directory, filename)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    @staticmethod
+    def _run(func, *args):
+        try:
+            return func(*args)
+        except Exception as e:
+            logger.error(f"Session recording failed: {e}")
+
+
+def read_recording(path: str, decompress: bool = True) -> Iterator[bytes]:
+    """Yield a recording file in chunks (blocking), decompressed by default.
+
+    A recording that is still being written has no gzip trailer yet; its
+    content up to the last flushed batch is returned.
+    """
+    opener = gzip.open if decompress else open
+    with opener(path, "rb") as recording:
+        while True:
+            try:
+                # read1 hands back each decompressed block as soon as it is
+                # available, so a missing trailer only loses the final empty read
+                chunk = recording.read1(READ_CHUNK_SIZE)
+            except EOFError:
+                return
+            if not chunk:
+                return
+            yield chunk
+
+
+session_recordings = RecordingWriter(
+    settings.SESSION_RECORDINGS_DIR,
+    flush_bytes=settings.SESSION_RECORDING_FLUSH_BYTES,
+    flush_interval=settings.SESSION_RECORDING_FLUSH_INTERVAL_MS / 1000,
+    compresslevel=settings.SESSION_RECORDING_COMPRESSLEVEL,
+)
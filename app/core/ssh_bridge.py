@@ -0,0 +1,260 @@
+"""
+Helpers for bridging paramiko channels to WebSocket connections.
+"""
+import asyncio
+import codecs
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+MAX_TERMINAL_DIMENSION = 1000
+MAX_BROADCAST_SESSIONS = 64
+CONTROL_MESSAGE_TYPES = ("data", "resize", "ping", "broadcast")
+
+
+class ChannelReader:
+    """Readiness-driven reader for a paramiko channel.
+
+    The channel's event pipe is registered with the running event loop, so
+    output is forwarded as soon as paramiko buffers it and an idle channel
+    costs no wakeups at all. Event loops that cannot watch pipes (e.g. the
+    Windows proactor loop) fall back to a blocking reader thread.
+    """
+
+    MAX_PENDING_CHUNKS = 64
+
+    def __init__(self, channel, chunk_size: int = 4096, max_chunk_size: int = None):
+        self.channel = channel
+        self.min_chunk_size = chunk_size
+        self.max_chunk_size = max(max_chunk_size or chunk_size, chunk_size)
+        self.chunk_size = chunk_size
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._fd = None
+        self._watching = False
+        self._thread = None
+        self._eof = False
+
+    def start(self) -> "ChannelReader":
+        """Start watching the channel for output"""
+        try:
+            self._fd = self.channel.fileno()
+            self._watch()
+        except NotImplementedError:
+            self._fd = None
+            self._thread = threading.Thread(
+                target=self._read_blocking, name="ssh-channel-reader", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def close(self):
+        """Stop watching the channel; must run before the channel is closed"""
+        self._unwatch()
+        self._fd = None
+
+    async def read(self) -> bytes:
+        """Return the next chunk of output, or b'' once the channel hit EOF"""
+        if self._eof and self._queue.empty():
+            return b""
+        data = await self._queue.get()
+        self._maybe_resume()
+        return data
+
+    def read_nowait(self):
+        """Return an already buffered chunk, or None if nothing is queued"""
+        try:
+            data = self._queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return None
+        self._maybe_resume()
+        return data
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        data = await self.read()
+        if not data:
+            raise StopAsyncIteration
+        return data
+
+    def _watch(self):
+        if not self._watching:
+            self._loop.add_reader(self._fd, self._on_readable)
+            self._watching = True
+
+    def _unwatch(self):
+        if self._watching:
+            self._loop.remove_reader(self._fd)
+            self._watching = False
+
+    def _maybe_resume(self):
+        # Resume reading once the consumer has caught up
+        if self._fd is not None and not self._eof and not self._watching \
+                and self._queue.qsize() < self.MAX_PENDING_CHUNKS // 2:
+            self._watch()
+
+    def _on_readable(self):
+        try:
+            while self.channel.recv_ready():
+                data = self.channel.recv(self.chunk_size)
+                if not data:
+                    self._finish()
+                    return
+                self._adapt_chunk_size(len(data))
+                self._queue.put_nowait(data)
+                if self._queue.qsize() >= self.MAX_PENDING_CHUNKS:
+                    # Let the SSH window apply backpressure to the remote side
+                    self._unwatch()
+                    return
+            if self.channel.closed or self.channel.eof_received:
+                self._finish()
+        except Exception as e:
+            logger.error(f"Error reading from SSH channel: {e}")
+            self._finish()
+
+    def _adapt_chunk_size(self, received: int):
+        # Grow the read size while reads fill it (bulk output) and shrink it
+        # back once output turns interactive again
+        if received >= self.chunk_size and self.chunk_size < self.max_chunk_size:
+            self.chunk_size = min(self.chunk_size * 2, self.max_chunk_size)
+        elif received < self.chunk_size // 4 and self.chunk_size > self.min_chunk_size:
+            self.chunk_size = max(self.chunk_size // 2, self.min_chunk_size)
+
+    def _finish(self):
+        if self._eof:
+            return
+        self._eof = True
+        self._unwatch()
+        self._queue.put_nowait(b"")
+
+    def _read_blocking(self):
+        try:
+            while True:
+                data = self.channel.recv(self.chunk_size)
+                if not data:
+                    break
+                self._adapt_chunk_size(len(data))
+                self._loop.call_soon_threadsafe(self._queue.put_nowait, data)
+        except Exception as e:
+            logger.error(f"Error reading from SSH channel: {e}")
+        finally:
+            self._loop.call_soon_threadsafe(self._finish)
+
+
+async def coalesce_output(reader: ChannelReader, flush_bytes: int, flush_interval: float):
+    """Group channel output into larger frames.
+
+    Output smaller than one minimum read (keystroke echo, prompts) is yielded
+    as soon as nothing else is queued, so interactive latency is unchanged.
+    Larger bursts wait up to ``flush_interval`` seconds for more data and are
+    yielded once they reach ``flush_bytes``.
+    """
+    eof = False
+    while not eof:
+        data = await reader.read()
+        if not data:
+            return
+        frame = bytearray(data)
+        waited = False
+        while len(frame) < flush_bytes:
+            pending = reader.read_nowait()
+            if pending is None:
+                if waited or len(frame) < reader.min_chunk_size:
+                    break
+                await asyncio.sleep(flush_interval)
+                waited = True
+                continue
+            if not pending:
+                eof = True
+                break
+            frame += pending
+        yield bytes(frame)
+
+
+class OutputEncoder:
+    """Send channel output to a WebSocket as binary or text frames.
+
+    Binary mode ships the raw bytes untouched. Text mode decodes
+    incrementally, carrying partial UTF-8 sequences over to the next frame
+    instead of failing when a multibyte character straddles a read.
+    """
+
+    ENCODINGS = ("text", "binary")
+
+    def __init__(self, encoding: str = "text"):
+        if encoding not in self.ENCODINGS:
+            raise ValueError(f"Unsupported terminal encoding: {encoding}")
+        self.binary = encoding == "binary"
+        self._decoder = None if self.binary else codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    async def send(self, websocket, data: bytes):
+        """Send one frame of output"""
+        if self.binary:
+            await websocket.send_bytes(data)
+            return
+        text = self._decoder.decode(data)
+        if text:
+            await websocket.send_text(text)
+
+    async def flush(self, websocket):
+        """Send whatever is left of an incomplete trailing sequence"""
+        if not self.binary:
+            text = self._decoder.decode(b"", final=True)
+            if text:
+                await websocket.send_text(text)
+
+
+def send_input(channels, data) -> dict:
+    """Write the same input to one or more channels (blocking).
+
+    Every keystroke goes through here, whether it targets a single shell or a
+    whole broadcast group, so a group costs one executor job per write rather
+    than one per shell. A failing channel does not stop the others; failures
+    are returned as a {channel: exception} dict.
+    """
+    failures = {}
+    for channel in channels:
+        try:
+            channel.sendall(data)
+        except Exception as e:
+            failures[channel] = e
+    return failures
+
+
+def validate_terminal_size(cols: int, rows: int):
+    """Raise ValueError unless cols x rows is a sane terminal geometry"""
+    for name, value in (("cols", cols), ("rows", rows)):
+        if not isinstance(value, int) or isinstance(value, bool) \
+                or not 1 <= value <= MAX_TERMINAL_DIMENSION:
+            raise ValueError(f"Invalid terminal {name}: {value!r}")
+
+
+def parse_control_message(text: str) -> dict:
+    """Parse a JSON control frame sent by a binary-mode client.
+
+    Supported messages are ``{"type": "data", "data": "..."}``,
+    ``{"type": "resize", "cols": 120, "rows": 40}``, ``{"type": "ping"}`` and
+    ``{"type": "broadcast", "sessions": ["<session token>", ...]}``.
+    Raises ValueError for anything else.
+    """
+    try:
+        message = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Malformed control message: {e}")
+    if not isinstance(message, dict) or message.get("type") not in CONTROL_MESSAGE_TYPES:
+        raise ValueError("Unknown control message")
+    if message["type"] == "data" and not isinstance(message.get("data"), str):
+        raise ValueError("Data message without data")
+    if message["type"] == "resize":
+        validate_terminal_size(message.get("cols"), message.get("rows"))
+    if message["type"] == "broadcast":
+        sessions = message.get("sessions")
+        if not isinstance(sessions, list) or not all(isinstance(token, str) for token in sessions):
+            raise ValueError("Broadcast message without a session list")
+        if len(sessions) > MAX_BROADCAST_SESSIONS:
+            raise ValueError(f"Cannot broadcast to more than {MAX_BROADCAST_SESSIONS} sessions")
+    return message
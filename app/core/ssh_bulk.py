@@ -0,0 +1,145 @@
+"""
+Run blocking SSH work against many saved clients concurrently.
+
+Fan-out commands can run for up to an hour each, so they get their own
+small executor, which file transfers also use to hash files on the host:
+however many are running, the shared SSH executor stays free for
+keystrokes, resizes and connects of interactive terminals.
+"""
+import asyncio
+import codecs
+import select
+import threading
+import time
+from typing import Callable, Iterable
+
+from app.core.config import settings
+from app.core.ssh_executor import SSHExecutor
+from app.core.ssh_pool import SSHConnectionManager, ssh_pool
+
+EXEC_READ_SIZE = 32768
+
+exec_executor = SSHExecutor(settings.SSH_EXEC_WORKERS)
+
+
+async def map_clients(func: Callable, clients: Iterable, user_id: int, concurrency: int,
+                      pool: SSHConnectionManager = ssh_pool):
+    """Call ``func(ssh_client)`` for every client with bounded parallelism.
+
+    Yields ``(client, result, error)`` tuples in completion order, so callers
+    can stream per-host results while slower hosts are still running.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(client_details):
+        async with semaphore:
+            try:
+                async with pool.borrow(user_id, client_details) as ssh_client:
+                    result = await pool.executor.run(func, ssh_client)
+                return client_details, result, None
+            except Exception as e:
+                return client_details, None, e
+
+    tasks = [asyncio.create_task(run_one(client_details)) for client_details in clients]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def exec_streaming(ssh_client, command: str, timeout: float, max_output: int,
+                   emit: Callable[[str, str], None], stop: threading.Event) -> int:
+    """Run a command and pass decoded stdout/stderr chunks to emit (blocking).
+
+    Returns the exit status. Output beyond max_output bytes is dropped and
+    reported once on the "truncated" stream.
+    """
+    channel = ssh_client.get_transport().open_session(timeout=timeout)
+    decoders = {
+        "stdout": codecs.getincrementaldecoder("utf-8")(errors="replace"),
+        "stderr": codecs.getincrementaldecoder("utf-8")(errors="replace"),
+    }
+    received = 0
+    truncated = False
+
+    def forward(stream: str, data: bytes):
+        nonlocal received, truncated
+        if truncated:
+            return
+        if received + len(data) > max_output:
+            data = data[:max_output - received]
+            truncated = True
+        received += len(data)
+        text = decoders[stream].decode(data)
+        if text:
+            emit(stream, text)
+        if truncated:
+            emit("truncated", f"Output limit of {max_output} bytes reached")
+
+    try:
+        channel.exec_command(command)
+        deadline = time.monotonic() + timeout
+        while True:
+            while channel.recv_ready():
+                forward("stdout", channel.recv(EXEC_READ_SIZE))
+            while channel.recv_stderr_ready():
+                forward("stderr", channel.recv_stderr(EXEC_READ_SIZE))
+            if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                return channel.recv_exit_status()
+            if stop.is_set():
+                raise InterruptedError("Command cancelled")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Command timed out after {timeout:g}s")
+            # Exit status alone does not wake the channel, so poll at least once a second
+            select.select([channel], [], [], min(remaining, 1.0))
+    finally:
+        channel.close()
+
+
+async def exec_on_clients(command: str, clients: Iterable, user_id: int, concurrency: int,
+                          timeout: float, max_output: int, pool: SSHConnectionManager = ssh_pool,
+                          executor: SSHExecutor = exec_executor):
+    """Run a command on every client with bounded parallelism, streaming output.
+
+    Yields ``(client, kind, payload)`` events as they happen: kind is
+    "stdout", "stderr" or "truncated" with text, then exactly one "exit" with
+    the exit status or "error" with the exception per client. Commands run
+    on executor, where they queue once all of its threads are busy.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    events: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    async def run_one(client_details):
+        def emit(stream, text):
+            loop.call_soon_threadsafe(events.put_nowait, (client_details, stream, text))
+
+        async with semaphore:
+            try:
+                async with pool.borrow(user_id, client_details) as ssh_client:
+                    status = await executor.run(
+                        exec_streaming, ssh_client, command, timeout, max_output, emit, stop
+                    )
+                events.put_nowait((client_details, "exit", status))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                events.put_nowait((client_details, "error", e))
+
+    tasks = [asyncio.create_task(run_one(client_details)) for client_details in clients]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            event = await events.get()
+            if event[1] in ("exit", "error"):
+                remaining -= 1
+            yield event
+    finally:
+        # Commands still running on disconnected callers stop at their next poll
+        stop.set()
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,80 @@
+"""
+Executor for blocking SSH work.
+
+paramiko is a blocking library, so handshakes, authentication and channel
+I/O all run on a bounded thread pool instead of the asyncio event loop.
+"""
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import paramiko
+
+from app.core.config import settings
+from app.core.known_hosts import PinningPolicy, host_key_name, known_hosts
+from app.core.ssh_keys import private_key_cache
+
+logger = logging.getLogger(__name__)
+
+
+class SSHExecutor:
+    """Run blocking paramiko calls on a bounded thread pool"""
+
+    def __init__(self, max_workers: int):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ssh")
+
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking callable on the pool and await its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def submit(self, func, *args, **kwargs):
+        """Schedule a blocking callable without waiting for it"""
+        return self._executor.submit(func, *args, **kwargs)
+
+    async def connect(self, client_details) -> paramiko.SSHClient:
+        """Open an authenticated SSH connection to a saved client"""
+        return await self.run(open_ssh_client, client_details)
+
+    def shutdown(self):
+        """Stop accepting work and release the pool threads"""
+        self._executor.shutdown(wait=False)
+
+
+def open_ssh_client(client_details) -> paramiko.SSHClient:
+    """Connect and authenticate to a saved client (blocking)"""
+    ssh = paramiko.SSHClient()
+    # A pinned key makes paramiko negotiate its type first and reject
+    # servers presenting a different key; unknown hosts are pinned on first use
+    pinned_key = known_hosts.lookup(client_details.user_id, client_details.host, client_details.port)
+    if pinned_key is not None:
+        name = host_key_name(client_details.host, client_details.port)
+        ssh.get_host_keys().add(name, pinned_key.get_name(), pinned_key)
+    ssh.set_missing_host_key_policy(
+        PinningPolicy(known_hosts, client_details.user_id, client_details.host, client_details.port)
+    )
+
+    connect_kwargs = {
+        "timeout": settings.SSH_CONNECT_TIMEOUT,
+        "banner_timeout": settings.SSH_BANNER_TIMEOUT,
+        "auth_timeout": settings.SSH_AUTH_TIMEOUT,
+    }
+    try:
+        if client_details.private_key:
+            # Encrypted keys use the saved password as their passphrase
+            private_key = private_key_cache.load(
+                client_details.id, client_details.private_key, client_details.password
+            )
+            logger.info(f"Connecting to {client_details.host}:{client_details.port} with user {client_details.username} and private key.")
+            ssh.connect(client_details.host, client_details.port, client_details.username, pkey=private_key, **connect_kwargs)
+        else:
+            logger.info(f"Connecting to {client_details.host}:{client_details.port} with user {client_details.username} and password.")
+            ssh.connect(client_details.host, client_details.port, client_details.username, client_details.password, **connect_kwargs)
+    except Exception:
+        ssh.close()
+        raise
+    return ssh
+
+
+ssh_executor = SSHExecutor(settings.SSH_EXECUTOR_WORKERS)
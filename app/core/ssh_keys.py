@@ -0,0 +1,74 @@
+"""
+Private key loading for saved SSH clients.
+
+Parsing a PEM key (especially an encrypted one) is expensive, so parsed keys
+are cached per client row and reused by every connection to that client.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from io import StringIO
+from typing import Optional
+
+import paramiko
+
+from app.core.config import settings
+
+# Tried in order when the key type is not known up front
+KEY_CLASSES = (paramiko.Ed25519Key, paramiko.ECDSAKey, paramiko.RSAKey)
+
+
+def parse_private_key(pem: str, passphrase: Optional[str] = None) -> paramiko.PKey:
+    """Parse an RSA, ECDSA or Ed25519 private key, detecting its type"""
+    for key_class in KEY_CLASSES:
+        try:
+            return key_class.from_private_key(StringIO(pem), password=passphrase or None)
+        except paramiko.PasswordRequiredException:
+            raise
+        except (paramiko.SSHException, ValueError):
+            continue
+    raise paramiko.SSHException("Unsupported or invalid private key")
+
+
+class PrivateKeyCache:
+    """LRU cache of parsed private keys, keyed by SSH client id.
+
+    Entries remember a digest of the PEM they were parsed from, so a key
+    changed through update_client is never served stale even before the
+    explicit invalidation runs.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._keys = OrderedDict()
+        # Keys are loaded from SSH executor threads
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def load(self, client_id: int, pem: str, passphrase: Optional[str] = None) -> paramiko.PKey:
+        """Return the parsed key for a client, parsing it on first use"""
+        digest = hashlib.sha256(pem.encode("utf-8")).hexdigest()
+        with self._lock:
+            entry = self._keys.get(client_id)
+            if entry is not None and entry[0] == digest:
+                self._keys.move_to_end(client_id)
+                return entry[1]
+
+        key = parse_private_key(pem, passphrase)
+
+        with self._lock:
+            self._keys[client_id] = (digest, key)
+            self._keys.move_to_end(client_id)
+            while len(self._keys) > self.max_entries:
+                self._keys.popitem(last=False)
+        return key
+
+    def invalidate(self, client_id: int):
+        """Forget a client's key, e.g. after it was changed or deleted"""
+        with self._lock:
+            self._keys.pop(client_id, None)
+
+
+private_key_cache = PrivateKeyCache(settings.SSH_KEY_CACHE_SIZE)
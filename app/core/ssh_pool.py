@@ -0,0 +1,176 @@
+"""
+Pool of authenticated SSH connections.
+
+Opening a terminal tab only needs a new shell channel, not a new key
+exchange and authentication, so connections are shared per (user, client)
+and every tab or split pane opens its own channel on the pooled transport.
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Tuple
+
+import paramiko
+
+from app.core.config import settings
+from app.core.ssh_executor import SSHExecutor, ssh_executor
+
+logger = logging.getLogger(__name__)
+
+PoolKey = Tuple[int, int]
+
+
+class SSHPoolExhausted(Exception):
+    """Raised when the pool is full and no idle connection can be evicted"""
+
+
+class PooledConnection:
+    """An authenticated SSH connection shared between channels"""
+
+    def __init__(self, key: PoolKey, client: paramiko.SSHClient):
+        self.key = key
+        self.client = client
+        self.refs = 0
+        self.stale = False
+        self.last_used = time.monotonic()
+        self._expiry = None
+
+    @property
+    def transport(self) -> paramiko.Transport:
+        return self.client.get_transport()
+
+    def is_alive(self) -> bool:
+        transport = self.transport
+        return transport is not None and transport.is_active()
+
+
+class SSHConnectionManager:
+    """Share one authenticated transport per (user, client) between channels"""
+
+    def __init__(self, executor: SSHExecutor, max_connections: int, idle_timeout: float):
+        self.executor = executor
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self._connections: Dict[PoolKey, PooledConnection] = {}
+        self._locks: Dict[PoolKey, asyncio.Lock] = {}
+
+    def __len__(self):
+        return len(self._connections)
+
+    async def acquire(self, user_id: int, client_details) -> PooledConnection:
+        """Return a live connection for the client, connecting if needed"""
+        key = (user_id, client_details.id)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            conn = self._connections.get(key)
+            if conn is not None and not conn.is_alive():
+                self._discard(conn)
+                conn = None
+            if conn is None:
+                self._make_room()
+                client = await self.executor.connect(client_details)
+                conn = PooledConnection(key, client)
+                self._connections[key] = conn
+                logger.info(f"Opened pooled SSH connection for user {user_id}, client {client_details.id}.")
+            self._checkout(conn)
+            return conn
+
+    @asynccontextmanager
+    async def borrow(self, user_id: int, client_details):
+        """Yield an SSH client for one-off work.
+
+        An already pooled connection is reused; otherwise a temporary
+        connection is opened and closed afterwards, so bulk jobs across many
+        hosts do not fill the pool with idle connections.
+        """
+        conn = self._connections.get((user_id, client_details.id))
+        if conn is not None and conn.is_alive():
+            self._checkout(conn)
+            try:
+                yield conn.client
+            finally:
+                self.release(conn)
+        else:
+            client = await self.executor.connect(client_details)
+            try:
+                yield client
+            finally:
+                self.executor.submit(client.close)
+
+    def release(self, conn: PooledConnection):
+        """Give a connection back; it is closed after idling for idle_timeout"""
+        conn.refs -= 1
+        conn.last_used = time.monotonic()
+        if conn.refs > 0:
+            return
+        if conn.stale or not conn.is_alive():
+            self._discard(conn)
+        else:
+            loop = asyncio.get_running_loop()
+            conn._expiry = loop.call_later(self.idle_timeout, self._expire, conn)
+
+    async def open_shell(self, conn: PooledConnection, **kwargs) -> paramiko.Channel:
+        """Open an interactive shell channel on a pooled connection"""
+        return await self.executor.run(conn.client.invoke_shell, **kwargs)
+
+    async def open_sftp(self, conn: PooledConnection) -> paramiko.SFTPClient:
+        """Open an SFTP subsystem channel on a pooled connection"""
+        return await self.executor.run(conn.client.open_sftp)
+
+    async def open_forward(self, conn: PooledConnection, host: str, port: int, timeout: float) -> paramiko.Channel:
+        """Open a direct-tcpip channel that the host connects to host:port"""
+        return await self.executor.run(
+            conn.transport.open_channel, "direct-tcpip", (host, port), ("127.0.0.1", 0), timeout=timeout
+        )
+
+    def invalidate(self, user_id: int, client_id: int):
+        """Stop reusing a client's connection, e.g. after its settings changed"""
+        conn = self._connections.get((user_id, client_id))
+        if conn is None:
+            return
+        if conn.refs > 0:
+            # Open channels keep working; the connection closes on last release
+            conn.stale = True
+            del self._connections[conn.key]
+        else:
+            self._discard(conn)
+
+    def _checkout(self, conn: PooledConnection):
+        conn.refs += 1
+        conn.last_used = time.monotonic()
+        if conn._expiry is not None:
+            conn._expiry.cancel()
+            conn._expiry = None
+
+    def _make_room(self):
+        if len(self._connections) < self.max_connections:
+            return
+        idle = [conn for conn in self._connections.values() if conn.refs == 0]
+        if not idle:
+            raise SSHPoolExhausted(f"SSH connection limit of {self.max_connections} reached")
+        self._discard(min(idle, key=lambda conn: conn.last_used))
+
+    def _expire(self, conn: PooledConnection):
+        conn._expiry = None
+        if conn.refs == 0:
+            logger.info(f"Closing idle SSH connection for user {conn.key[0]}, client {conn.key[1]}.")
+            self._discard(conn)
+
+    def _discard(self, conn: PooledConnection):
+        if self._connections.get(conn.key) is conn:
+            del self._connections[conn.key]
+            lock = self._locks.get(conn.key)
+            if lock is not None and not lock.locked():
+                del self._locks[conn.key]
+        if conn._expiry is not None:
+            conn._expiry.cancel()
+            conn._expiry = None
+        self.executor.submit(conn.client.close)
+
+
+ssh_pool = SSHConnectionManager(
+    ssh_executor,
+    max_connections=settings.SSH_POOL_MAX_CONNECTIONS,
+    idle_timeout=settings.SSH_POOL_IDLE_TIMEOUT,
+)
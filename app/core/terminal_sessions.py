@@ -0,0 +1,291 @@
+"""
+Terminal sessions that survive WebSocket disconnects.
+
+A session owns the shell channel and keeps pumping its output into a
+bounded scrollback buffer while no browser is attached. Reconnecting with
+the same session token within the grace period replays the scrollback and
+resumes the live stream without a new SSH handshake.
+
+Sessions of one user can be joined into a broadcast group, in which input
+typed into any member is written to the shells of all members.
+"""
+import asyncio
+import logging
+import re
+from collections import deque
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.session_recording import RecordingWriter, SessionRecorder, session_recordings
+from app.core.ssh_bridge import ChannelReader, coalesce_output, send_input
+from app.core.ssh_pool import SSHConnectionManager, PooledConnection, ssh_pool
+
+logger = logging.getLogger(__name__)
+
+SESSION_TOKEN_PATTERN = re.compile(r"^[A-Za-z0-9_-]{16,128}$")
+
+
+class RingBuffer:
+    """Bounded byte buffer that keeps the most recent output"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._chunks = deque()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, data: bytes):
+        if self.capacity <= 0 or not data:
+            return
+        if len(data) >= self.capacity:
+            self._chunks.clear()
+            self._chunks.append(data[-self.capacity:])
+            self._size = self.capacity
+            return
+        self._chunks.append(data)
+        self._size += len(data)
+        while self._size > self.capacity:
+            overflow = self._size - self.capacity
+            oldest = self._chunks[0]
+            if len(oldest) <= overflow:
+                self._chunks.popleft()
+                self._size -= len(oldest)
+            else:
+                self._chunks[0] = oldest[overflow:]
+                self._size -= overflow
+
+    def getvalue(self) -> bytes:
+        return b"".join(self._chunks)
+
+
+class BroadcastGroup:
+    """Sessions whose shells all receive the input typed into any one of them"""
+
+    def __init__(self):
+        self.members: Set["TerminalSession"] = set()
+
+    def tokens(self):
+        return sorted(member.token for member in self.members if member.token)
+
+
+class TerminalSession:
+    """A shell channel whose output is buffered while no WebSocket is attached"""
+
+    ATTACHMENT_QUEUE_SIZE = 64
+
+    def __init__(self, token: str, user_id: int, client_id: int, conn: PooledConnection, channel,
+                 registry: "TerminalSessionRegistry", recorder: Optional[SessionRecorder] = None):
+        self.token = token
+        self.user_id = user_id
+        self.client_id = client_id
+        self.conn = conn
+        self.channel = channel
+        self.registry = registry
+        self.recorder = recorder
+        self.scrollback = RingBuffer(registry.scrollback_bytes)
+        self.closed = False
+        self.group: Optional[BroadcastGroup] = None
+        self._attachment: Optional[asyncio.Queue] = None
+        self._expiry = None
+        self.reader = ChannelReader(
+            channel, settings.TERMINAL_READ_BUFFER_MIN, settings.TERMINAL_READ_BUFFER_MAX
+        ).start()
+        self._pump_task = asyncio.create_task(self._pump())
+
+    def attach(self) -> Tuple[asyncio.Queue, bytes]:
+        """Attach a consumer; returns its output queue and the scrollback to replay.
+
+        A new attachment takes over from any previous one, whose queue then
+        yields b'' just as it does once the shell has exited.
+        """
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+        if self._attachment is not None:
+            self._release_attachment(self._attachment)
+            self._attachment.put_nowait(b"")
+        attachment = asyncio.Queue(maxsize=self.ATTACHMENT_QUEUE_SIZE)
+        if self.closed:
+            attachment.put_nowait(b"")
+        self._attachment = attachment
+        return attachment, self.scrollback.getvalue()
+
+    def detach(self, attachment: asyncio.Queue):
+        """Detach a consumer; the session closes if nobody reattaches in time"""
+        if self._attachment is not attachment:
+            return
+        self._attachment = None
+        self._release_attachment(attachment)
+        if self.closed:
+            return
+        grace = self.registry.grace_period if self.token else 0
+        if grace > 0:
+            loop = asyncio.get_running_loop()
+            self._expiry = loop.call_later(grace, lambda: asyncio.ensure_future(self.close()))
+        else:
+            asyncio.ensure_future(self.close())
+
+    def is_attached(self, attachment: asyncio.Queue) -> bool:
+        """Whether attachment is still the session's consumer"""
+        return self._attachment is attachment
+
+    async def end(self, attachment: asyncio.Queue):
+        """Close the session now, e.g. when the user closed its terminal.
+
+        Ignored if another connection has taken the session over since.
+        """
+        if self._attachment is attachment:
+            await self.close()
+
+    async def write(self, data):
+        """Send input to the shell, or to every shell of its broadcast group"""
+        if self.group is None:
+            targets = [self]
+        else:
+            targets = [member for member in self.group.members if not member.closed]
+        failures = await self.registry.pool.executor.run(send_input, [target.channel for target in targets], data)
+        for target in targets:
+            if target is not self and target.channel in failures:
+                logger.warning(f"Broadcast input to client {target.client_id} failed: {failures[target.channel]}")
+        if self.channel in failures:
+            raise failures[self.channel]
+
+    def leave_group(self):
+        """Stop sharing input with other sessions"""
+        if self.group is not None:
+            self.group.members.discard(self)
+            self.group = None
+
+    async def resize(self, cols: int, rows: int):
+        """Propagate the browser's terminal geometry to the remote PTY"""
+        await self.registry.pool.executor.run(self.channel.resize_pty, width=cols, height=rows)
+        if self.recorder is not None:
+            self.recorder.resize(cols, rows)
+
+    async def close(self):
+        """Close the shell channel and give the connection back to the pool"""
+        if self.closed:
+            return
+        self.closed = True
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+        self.registry._forget(self)
+        self.leave_group()
+        self.reader.close()
+        self._pump_task.cancel()
+        if self._attachment is not None:
+            self._release_attachment(self._attachment)
+            self._attachment.put_nowait(b"")
+        await self.registry.pool.executor.run(self.channel.close)
+        self.registry.pool.release(self.conn)
+        if self.recorder is not None:
+            await self.recorder.close()
+        logger.info(f"Terminal session for client {self.client_id} closed.")
+
+    async def _pump(self):
+        try:
+            async for frame in coalesce_output(
+                self.reader, settings.TERMINAL_FLUSH_BYTES, settings.TERMINAL_FLUSH_INTERVAL_MS / 1000
+            ):
+                self.scrollback.append(frame)
+                if self.recorder is not None:
+                    self.recorder.output(frame)
+                if self._attachment is not None:
+                    # A slow browser pauses the pump, which lets the SSH
+                    # window push back on the remote side
+                    await self._attachment.put(frame)
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            logger.error(f"Error reading from SSH: {e}")
+        logger.info(f"SSH read loop for client {self.client_id} finished.")
+        asyncio.ensure_future(self.close())
+
+    @staticmethod
+    def _release_attachment(attachment: asyncio.Queue):
+        # Drop undelivered frames so a pump blocked on a full queue resumes
+        while not attachment.empty():
+            attachment.get_nowait()
+
+
+class TerminalSessionRegistry:
+    """Live terminal sessions of this worker, keyed by session token"""
+
+    def __init__(self, pool: SSHConnectionManager, grace_period: float, scrollback_bytes: int,
+                 recordings: Optional[RecordingWriter] = None):
+        self.pool = pool
+        self.recordings = recordings
+        self.grace_period = grace_period
+        self.scrollback_bytes = scrollback_bytes
+        self._sessions: Dict[str, TerminalSession] = {}
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, token: str, user_id: int, client_id: int) -> Optional[TerminalSession]:
+        """Find a live session the user may reattach to"""
+        session = self._sessions.get(token)
+        if session is None or session.closed:
+            return None
+        if session.user_id != user_id or session.client_id != client_id:
+            return None
+        return session
+
+    def broadcast(self, session: TerminalSession, tokens: Iterable[str]) -> Optional[BroadcastGroup]:
+        """Put a session in one broadcast group with the user's sessions named by tokens.
+
+        Sessions already in other groups move to the new one; tokens that are
+        unknown or belong to another user are ignored. An empty list just takes
+        the session out of its group.
+        """
+        session.leave_group()
+        members = {session}
+        for token in tokens:
+            other = self._sessions.get(token)
+            if other is not None and not other.closed and other.user_id == session.user_id:
+                members.add(other)
+        if len(members) == 1:
+            return None
+        group = BroadcastGroup()
+        for member in members:
+            member.leave_group()
+            member.group = group
+            group.members.add(member)
+        return group
+
+    async def create(self, token: Optional[str], user_id: int, client_details,
+                     cols: int = 80, rows: int = 24, record: bool = False) -> TerminalSession:
+        """Open a new shell for the client; sessions without a token are not resumable.
+
+        With record set, the shell's output is saved as an asciicast recording.
+        """
+        if token and token in self._sessions:
+            raise ValueError("Session token already in use")
+        conn = await self.pool.acquire(user_id, client_details)
+        try:
+            channel = await self.pool.open_shell(conn, width=cols, height=rows)
+        except Exception:
+            self.pool.release(conn)
+            raise
+        recorder = None
+        if record and self.recordings is not None:
+            recorder = self.recordings.start(user_id, client_details, cols, rows)
+        session = TerminalSession(token, user_id, client_details.id, conn, channel, self, recorder)
+        if token:
+            self._sessions[token] = session
+        return session
+
+    def _forget(self, session: TerminalSession):
+        if session.token and self._sessions.get(session.token) is session:
+            del self._sessions[session.token]
+
+
+terminal_sessions = TerminalSessionRegistry(
+    ssh_pool,
+    grace_period=settings.TERMINAL_DETACH_GRACE_SECONDS,
+    scrollback_bytes=settings.TERMINAL_SCROLLBACK_BYTES,
+    recordings=session_recordings,
+)
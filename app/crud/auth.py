@@ -2,11 +2,14 @@ import json
 import hashlib
 from datetime import datetime, timedelta
 from typing import Optional, List
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
 from app.models.user_model import User, TrustedDevice
 from app.schemas.user_schema import UserCreate, UserUpdate
 from app.core.auth import AuthManager, MFAManager
+from app.core.jwt_auth import principal_cache
 
 class UserCRUD:
     """User CRUD operations"""
@@ -91,6 +94,7 @@ class UserCRUD:
         user.updated_at = datetime.utcnow()
         db.commit()
         db.refresh(user)
+        principal_cache.invalidate(user.id)
         return user
     
     @staticmethod
@@ -110,6 +114,10 @@ class UserCRUD:
             AuthManager.increment_failed_attempts(db, user)
             return None
         
+        # Upgrade hashes made with a different work factor while we have the password
+        if AuthManager.needs_rehash(user.hashed_password):
+            user.hashed_password = AuthManager.hash_password(password)
+        
         # Reset failed attempts on successful password verification
         AuthManager.reset_failed_attempts(db, user)
         return user
@@ -257,8 +265,10 @@ class UserCRUD:
     @staticmethod
     def delete_user(db: Session, user: User) -> bool:
         """Delete user account"""
+        user_id = user.id
         db.delete(user)
         db.commit()
+        principal_cache.invalidate(user_id)
         return True
     
     @staticmethod
@@ -286,6 +296,7 @@ class UserCRUD:
         
         db.commit()
         db.refresh(user)
+        principal_cache.invalidate(user.id)
         return True
     
     @staticmethod
@@ -317,10 +328,14 @@ class UserCRUD:
     @staticmethod
     def get_terminal_settings(db: Session, user: User) -> dict:
         """Get user's terminal settings"""
-        if user.terminal_settings:
+        return UserCRUD.parse_terminal_settings(user.terminal_settings)
+    
+    @staticmethod
+    def parse_terminal_settings(raw_settings: Optional[str]) -> dict:
+        """Decode stored terminal settings, falling back to the defaults"""
+        if raw_settings:
             try:
-                import json
-                return json.loads(user.terminal_settings)
+                return json.loads(raw_settings)
             except (json.JSONDecodeError, TypeError):
                 pass
         
@@ -328,7 +343,8 @@ class UserCRUD:
         return {
             "theme": "hacker-blue",
             "autoReconnect": True,
-            "bellSound": False
+            "bellSound": False,
+            "recordSessions": False
         }
     
     @staticmethod
@@ -467,4 +483,71 @@ class UserCRUD:
             db.commit()
             
         except Exception:
-            db.rollback()
\ No newline at end of file
+            db.rollback()
+
+
+class AsyncUserCRUD:
+    """User CRUD operations for routes running on the event loop"""
+    
+    @staticmethod
+    async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
+        """Get user by email"""
+        result = await db.execute(select(User).where(User.email == email))
+        return result.scalars().first()
+    
+    @staticmethod
+    async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
+        """Get user by ID"""
+        return await db.get(User, user_id)
+    
+    @staticmethod
+    async def get_terminal_settings(db: AsyncSession, user_id: int) -> dict:
+        """Get user's terminal settings"""
+        result = await db.execute(select(User.terminal_settings).where(User.id == user_id))
+        return UserCRUD.parse_terminal_settings(result.scalar())
+    
+    @staticmethod
+    async def save_terminal_settings(db: AsyncSession, user_id: int, settings: dict) -> bool:
+        """Save user's terminal settings"""
+        try:
+            await db.execute(
+                update(User).where(User.id == user_id).values(
+                    terminal_settings=json.dumps(settings),
+                    updated_at=datetime.utcnow()
+                )
+            )
+            await db.commit()
+            return True
+        except Exception as e:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to save terminal settings: {str(e)}"
+            )
+    
+    @staticmethod
+    async def get_trusted_devices(db: AsyncSession, user_id: int) -> List[TrustedDevice]:
+        """Get all trusted devices for a user"""
+        result = await db.execute(
+            select(TrustedDevice).where(
+                TrustedDevice.user_id == user_id,
+                TrustedDevice.is_active == True
+            ).order_by(TrustedDevice.last_used.desc())
+        )
+        return result.scalars().all()
+    
+    @staticmethod
+    async def remove_trusted_device(db: AsyncSession, user_id: int, device_id: int) -> bool:
+        """Remove a trusted device"""
+        try:
+            result = await db.execute(
+                update(TrustedDevice).where(
+                    TrustedDevice.id == device_id,
+                    TrustedDevice.user_id == user_id
+                ).values(is_active=False)
+            )
+            await db.commit()
+            return result.rowcount > 0
+        except Exception:
+            await db.rollback()
+            return False
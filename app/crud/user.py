@@ -1,36 +1,170 @@
-from sqlalchemy.orm import Session
+from typing import AsyncIterator, Dict, List, Optional
+from sqlalchemy import and_, bindparam, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models import user_model
 from app.schemas import user_schema
 
-def create_client(db: Session, client: user_schema.SSHClient, user_id: int):
-    client_data = client.dict()
-    client_data['user_id'] = user_id
-    db_client = user_model.SSHClient(**client_data)
+def _new_client_row(client: user_schema.SSHClient, user_id: int) -> dict:
+    # An omitted recording flag means off for a new client
+    return dict(client.dict(), user_id=user_id, record_sessions=bool(client.record_sessions))
+
+def _client_query(user_id: int):
+    return select(user_model.SSHClient).where(user_model.SSHClient.user_id == user_id)
+
+async def create_client_async(db: AsyncSession, client: user_schema.SSHClient, user_id: int):
+    db_client = user_model.SSHClient(**_new_client_row(client, user_id))
     db.add(db_client)
-    db.commit()
-    db.refresh(db_client)
+    await db.commit()
+    await db.refresh(db_client)
     return db_client
 
-def get_clients(db: Session, user_id: int, skip: int = 0, limit: int = 100):
-    return db.query(user_model.SSHClient).filter(user_model.SSHClient.user_id == user_id).offset(skip).limit(limit).all()
+async def bulk_create_clients_async(db: AsyncSession, clients: List[user_schema.SSHClient], user_id: int,
+                                    batch_size: int = 1000) -> int:
+    """Insert many clients in a single transaction with batched executemany"""
+    rows = [_new_client_row(client, user_id) for client in clients]
+    statement = insert(user_model.SSHClient.__table__)
+    for start in range(0, len(rows), batch_size):
+        await db.execute(statement, rows[start:start + batch_size])
+    await db.commit()
+    return len(rows)
+
+async def stream_clients_async(db: AsyncSession, user_id: int, columns) -> AsyncIterator:
+    """Yield the user's clients in id order without loading them all at once"""
+    SSHClient = user_model.SSHClient
+    query = select(*[getattr(SSHClient, column) for column in columns]).where(
+        SSHClient.user_id == user_id
+    ).order_by(SSHClient.id).execution_options(yield_per=500)
+    result = await db.stream(query)
+    async for row in result:
+        yield row
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+async def get_client_page_async(db: AsyncSession, user_id: int, cursor: Optional[int] = None, limit: int = 100,
+                                search: Optional[str] = None, os_name: Optional[str] = None,
+                                group_name: Optional[str] = None):
+    """Return one page of client summaries after the cursor id, plus the next cursor.
+
+    search matches a case-insensitive prefix of the label, host or username;
+    os_name and group_name must match exactly.
+    """
+    SSHClient = user_model.SSHClient
+    query = select(
+        SSHClient.id, SSHClient.label, SSHClient.host, SSHClient.port, SSHClient.username,
+        SSHClient.detected_os, SSHClient.group_name
+    ).where(SSHClient.user_id == user_id)
+    if search:
+        prefix = _escape_like(search.lower()) + "%"
+        query = query.where(or_(
+            func.lower(SSHClient.label).like(prefix, escape="\\"),
+            func.lower(SSHClient.host).like(prefix, escape="\\"),
+            func.lower(SSHClient.username).like(prefix, escape="\\"),
+        ))
+    if os_name:
+        query = query.where(SSHClient.detected_os == os_name)
+    if group_name:
+        query = query.where(SSHClient.group_name == group_name)
+    if cursor is not None:
+        query = query.where(SSHClient.id > cursor)
+    # One extra row tells whether another page follows
+    result = await db.execute(query.order_by(SSHClient.id).limit(limit + 1))
+    rows = result.all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+async def get_clients_by_ids_async(db: AsyncSession, user_id: int, client_ids: Optional[List[int]] = None):
+    query = _client_query(user_id)
+    if client_ids is not None:
+        query = query.where(user_model.SSHClient.id.in_(client_ids))
+    result = await db.execute(query.order_by(user_model.SSHClient.id))
+    return result.scalars().all()
 
-def get_client(db: Session, client_id: int, user_id: int):
-    return db.query(user_model.SSHClient).filter(user_model.SSHClient.id == client_id, user_model.SSHClient.user_id == user_id).first()
+async def get_client_async(db: AsyncSession, client_id: int, user_id: int):
+    result = await db.execute(_client_query(user_id).where(user_model.SSHClient.id == client_id))
+    return result.scalars().first()
 
-def update_client(db: Session, client_id: int, client: user_schema.SSHClient, user_id: int):
-    db_client = db.query(user_model.SSHClient).filter(user_model.SSHClient.id == client_id, user_model.SSHClient.user_id == user_id).first()
+async def update_client_async(db: AsyncSession, client_id: int, client: user_schema.SSHClient, user_id: int):
+    db_client = await get_client_async(db, client_id, user_id)
     if not db_client:
         return None
     for var, value in vars(client).items():
-        setattr(db_client, var, value) if value else None
-    db.commit()
-    db.refresh(db_client)
+        # Blank or omitted fields keep their stored value; flags that were
+        # sent are applied even when false
+        setattr(db_client, var, value) if value or isinstance(value, bool) else None
+    await db.commit()
+    await db.refresh(db_client)
     return db_client
 
-def delete_client(db: Session, client_id: int, user_id: int):
-    db_client = db.query(user_model.SSHClient).filter(user_model.SSHClient.id == client_id, user_model.SSHClient.user_id == user_id).first()
+async def delete_client_async(db: AsyncSession, client_id: int, user_id: int):
+    db_client = await get_client_async(db, client_id, user_id)
     if not db_client:
         return None
-    db.delete(db_client)
-    db.commit()
-    return {"message": f"SSH client {client_id} deleted successfully"}
\ No newline at end of file
+    await db.delete(db_client)
+    await db.commit()
+    return {"message": f"SSH client {client_id} deleted successfully"}
+
+async def set_detected_os_async(db: AsyncSession, user_id: int, detected: Dict[int, str]):
+    """Store OS detection results for many clients in a single transaction"""
+    if not detected:
+        return
+    table = user_model.SSHClient.__table__
+    statement = table.update().where(
+        and_(table.c.id == bindparam("client_id"), table.c.user_id == bindparam("owner_id"))
+    ).values(detected_os=bindparam("os_name"))
+    await db.execute(statement, [
+        {"client_id": client_id, "owner_id": user_id, "os_name": os_name}
+        for client_id, os_name in detected.items()
+    ])
+    await db.commit()
+
+async def get_recordings_async(db: AsyncSession, user_id: int, client_id: Optional[int] = None, limit: int = 100):
+    """Return the user's most recent session recordings"""
+    SessionRecording = user_model.SessionRecording
+    query = select(SessionRecording).where(SessionRecording.user_id == user_id)
+    if client_id is not None:
+        query = query.where(SessionRecording.client_id == client_id)
+    result = await db.execute(query.order_by(SessionRecording.id.desc()).limit(limit))
+    return result.scalars().all()
+
+async def get_recording_async(db: AsyncSession, recording_id: int, user_id: int):
+    result = await db.execute(select(user_model.SessionRecording).where(
+        user_model.SessionRecording.id == recording_id,
+        user_model.SessionRecording.user_id == user_id
+    ))
+    return result.scalars().first()
+
+async def create_transfer_async(db: AsyncSession, user_id: int, client_id: int, direction: str, remote_path: str,
+                                size: int, sha256: Optional[str] = None, remote_mtime: Optional[int] = None,
+                                overwrite: bool = False):
+    db_transfer = user_model.FileTransfer(
+        user_id=user_id,
+        client_id=client_id,
+        direction=direction,
+        remote_path=remote_path,
+        size=size,
+        sha256=sha256,
+        remote_mtime=remote_mtime,
+        overwrite=overwrite,
+        confirmed_offset=0,
+        status="active"
+    )
+    db.add(db_transfer)
+    await db.commit()
+    await db.refresh(db_transfer)
+    return db_transfer
+
+async def get_transfer_async(db: AsyncSession, transfer_id: int, user_id: int, client_id: int):
+    result = await db.execute(select(user_model.FileTransfer).where(
+        user_model.FileTransfer.id == transfer_id,
+        user_model.FileTransfer.user_id == user_id,
+        user_model.FileTransfer.client_id == client_id
+    ))
+    return result.scalars().first()
+
+async def update_transfer_async(db: AsyncSession, transfer_id: int, **values):
+    """Record transfer progress or its outcome"""
+    await db.execute(
+        update(user_model.FileTransfer).where(user_model.FileTransfer.id == transfer_id).values(**values)
+    )
+    await db.commit()
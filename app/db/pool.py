@@ -0,0 +1,95 @@
+"""
+Instrumented connection pools.
+
+The pools time every checkout so operators can see when requests queue up
+waiting for a database connection and size the pool accordingly.
+"""
+import logging
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMetrics:
+    """Checkout counts and wait times of one connection pool"""
+
+    def __init__(self, slow_checkout: float):
+        self.slow_checkout = slow_checkout
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait: float, timed_out: bool = False):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if timed_out:
+                self.timeouts += 1
+        if timed_out:
+            logger.warning(f"Timed out after {wait * 1000:.0f} ms waiting for a database connection")
+        elif wait >= self.slow_checkout:
+            logger.warning(f"Waited {wait * 1000:.0f} ms for a database connection")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": self.total_wait / self.checkouts * 1000 if self.checkouts else 0.0,
+                "max_wait_ms": self.max_wait * 1000,
+            }
+
+
+class InstrumentedPoolMixin:
+    """Time checkouts of a QueuePool subclass"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics(settings.DB_POOL_SLOW_CHECKOUT_MS / 1000)
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.metrics.record(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep the history
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_status(pool) -> dict:
+    """Current occupancy and checkout timings of a pool"""
+    status = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        status.update(metrics.snapshot())
+    return status
@@ -1,20 +1,60 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+from app.db.pool import InstrumentedAsyncQueuePool, InstrumentedQueuePool
+
+# Pool sizing shared by the sync and async engines
+pool_options = {
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW,
+    "pool_timeout": settings.DB_POOL_TIMEOUT,
+}
 
 # Create engine with database-specific configuration
 if settings.DATABASE_URL.startswith("sqlite"):
     # SQLite-specific configuration
     engine = create_engine(
         settings.DATABASE_URL,
-        connect_args={"check_same_thread": False}  # Only needed for SQLite
+        poolclass=InstrumentedQueuePool,
+        connect_args={"check_same_thread": False},  # Only needed for SQLite
+        **pool_options
     )
 else:
     # PostgreSQL and other database configuration
+    pool_options.update(
+        pool_pre_ping=settings.DB_POOL_PRE_PING,  # Validate connections before use
+        pool_recycle=settings.DB_POOL_RECYCLE     # Recycle long-lived connections
+    )
     engine = create_engine(
         settings.DATABASE_URL,
-        pool_pre_ping=True,  # Validate connections before use
-        pool_recycle=300     # Recycle connections every 5 minutes
+        poolclass=InstrumentedQueuePool,
+        **pool_options
     )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async drivers for the same databases
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+def async_database_url(url: str) -> str:
+    """Map a sync database URL to the matching async driver"""
+    scheme, _, rest = url.partition("://")
+    dialect = scheme.split("+", 1)[0]
+    if dialect not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {dialect}")
+    return f"{ASYNC_DRIVERS[dialect]}://{rest}"
+
+# Async engine used by routes that run on the event loop, so queries there
+# do not block SSH streaming
+async_engine = create_async_engine(
+    async_database_url(settings.DATABASE_URL),
+    poolclass=InstrumentedAsyncQueuePool,
+    **pool_options
+)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
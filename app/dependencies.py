@@ -1,4 +1,4 @@
-from app.db.session import SessionLocal
+from app.db.session import AsyncSessionLocal, SessionLocal
 
 def get_db():
     db = SessionLocal()
@@ -6,3 +6,12 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_async_session_factory():
+    # For long-lived handlers (WebSockets) that must not hold a session,
+    # and its pooled connection, for their whole lifetime
+    return AsyncSessionLocal
@@ -1,9 +1,9 @@
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from app.routers import user_router, auth_router
+from app.routers import user_router, auth_router, metrics_router, sftp_router, tunnel_router
 from app.db.session import engine
 from app.models import user_model
 from app.core.auth_middleware import AuthMiddleware
@@ -15,11 +15,21 @@ user_model.Base.metadata.create_all(bind=engine)
 init_db()
 
 
-class ReferrerPolicyMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        response.headers["Referrer-Policy"] = "same-origin"
-        return response
+class ReferrerPolicyMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_policy(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["Referrer-Policy"] = "same-origin"
+            await send(message)
+
+        await self.app(scope, receive, send_with_policy)
 
 
 app = FastAPI()
@@ -32,3 +42,6 @@ app.add_middleware(AuthMiddleware)
 app.add_middleware(ReferrerPolicyMiddleware)
 app.include_router(user_router.router)
 app.include_router(auth_router.router)
+app.include_router(metrics_router.router)
+app.include_router(sftp_router.router)
+app.include_router(tunnel_router.router)
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import BigInteger, Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.sql import func
+from sqlalchemy.sql import false, func
 from datetime import datetime
 
 Base = declarative_base()
@@ -46,6 +46,12 @@ class TrustedDevice(Base):
 
 class SSHClient(Base):
     __tablename__ = "ssh_clients"
+    __table_args__ = (
+        # Serves the per-user host list in keyset (id) order
+        Index("ix_ssh_clients_user_id_id", "user_id", "id"),
+        Index("ix_ssh_clients_user_id_group_name", "user_id", "group_name"),
+        Index("ix_ssh_clients_user_id_detected_os", "user_id", "detected_os"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     label = Column(String, nullable=False)
@@ -55,4 +61,59 @@ class SSHClient(Base):
     password = Column(String, nullable=True)
     private_key = Column(String, nullable=True)
     detected_os = Column(String, nullable=True)  # Operating system detected from SSH connection
+    group_name = Column(String(255), nullable=True)  # Optional folder the host is listed under
+    record_sessions = Column(Boolean, default=False, server_default=false(), nullable=False)  # Record terminals opened to this host
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+class FileTransfer(Base):
+    __tablename__ = "file_transfers"
+    __table_args__ = (
+        Index("ix_file_transfers_user_id_id", "user_id", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    client_id = Column(Integer, ForeignKey("ssh_clients.id", ondelete="CASCADE"), nullable=False)
+    direction = Column(String(16), nullable=False)  # upload or download
+    remote_path = Column(Text, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    confirmed_offset = Column(BigInteger, default=0, nullable=False)  # Bytes known to have arrived
+    remote_mtime = Column(Integer)  # Downloads are refused if the remote file changes
+    sha256 = Column(String(64))  # Expected digest, or the remote digest once verified
+    overwrite = Column(Boolean, default=False, server_default=false(), nullable=False)  # Uploads may replace an existing file
+    status = Column(String(16), default="active", nullable=False)  # active, completed or failed
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class KnownHost(Base):
+    __tablename__ = "known_hosts"
+    __table_args__ = (
+        UniqueConstraint("user_id", "host", "port", name="uq_known_hosts_user_host_port"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    host = Column(String(255), nullable=False)
+    port = Column(Integer, nullable=False)
+    key_type = Column(String(64), nullable=False)  # e.g. ssh-ed25519
+    key_data = Column(Text, nullable=False)  # Base64 encoded public key blob
+    fingerprint = Column(String(128), nullable=False)  # SHA256 fingerprint for display
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class SessionRecording(Base):
+    __tablename__ = "session_recordings"
+    __table_args__ = (
+        Index("ix_session_recordings_user_id_id", "user_id", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    client_id = Column(Integer, nullable=True)  # No foreign key; recordings outlive deleted hosts
+    title = Column(String(255))
+    path = Column(String(255), nullable=False)  # Relative to SESSION_RECORDINGS_DIR
+    cols = Column(Integer, nullable=False)
+    rows = Column(Integer, nullable=False)
+    size_bytes = Column(Integer, default=0)  # Compressed size, set when the recording ends
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    ended_at = Column(DateTime(timezone=True))
@@ -3,9 +3,11 @@ from datetime import timedelta
 from typing import Dict, Any
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.responses import HTMLResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.templating import Jinja2Templates
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.dependencies import get_db
+from app.dependencies import get_async_db, get_db
 from app.schemas.user_schema import (
     UserCreate, UserLogin, UserResponse, UserUpdate,
     MFASetup, MFAVerification, MFADisable,
@@ -13,8 +15,9 @@ from app.schemas.user_schema import (
     ChangeEmail, ChangePassword, TerminalSettings,
     TrustedDeviceResponse, TokenRefresh
 )
-from app.crud.auth import UserCRUD
-from app.core.jwt_auth import create_access_token, create_refresh_token, get_current_user, get_current_active_user, verify_token
+from app.crud.auth import AsyncUserCRUD, UserCRUD
+from app.core.auth import AuthManager
+from app.core.jwt_auth import create_access_token, create_refresh_token, get_current_user, get_current_active_user, get_current_principal, token_claims, verify_token
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
@@ -24,14 +27,16 @@ templates = Jinja2Templates(directory="templates")
 @router.post("/register", response_model=UserResponse)
 async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     """Register a new user"""
-    user = UserCRUD.create_user(db, user_data)
+    user = await AuthManager.run_password_task(UserCRUD.create_user, db, user_data)
     return user
 
 @router.post("/login")
 async def login(user_data: UserLogin, request: Request, db: Session = Depends(get_db)) -> Dict[str, Any]:
     """Authenticate user and return JWT token"""
     # Authenticate with email/password
-    user = UserCRUD.authenticate_user(db, user_data.email, user_data.password)
+    user = await AuthManager.run_password_task(
+        UserCRUD.authenticate_user, db, user_data.email, user_data.password
+    )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -49,7 +54,7 @@ async def login(user_data: UserLogin, request: Request, db: Session = Depends(ge
     device_trusted = False
     
     if mfa_required:
-        device_trusted = UserCRUD.is_device_trusted(db, user, device_fingerprint)
+        device_trusted = await run_in_threadpool(UserCRUD.is_device_trusted, db, user, device_fingerprint)
         if device_trusted:
             mfa_required = False  # Skip MFA for trusted device
     
@@ -62,22 +67,22 @@ async def login(user_data: UserLogin, request: Request, db: Session = Depends(ge
     
     # Verify MFA if provided
     if mfa_required and user_data.mfa_code:
-        UserCRUD.verify_mfa_and_login(db, user, user_data.mfa_code)
+        await run_in_threadpool(UserCRUD.verify_mfa_and_login, db, user, user_data.mfa_code)
     
     # Add device to trusted list if user requested it
     if user_data.remember_device and user.mfa_enabled:
-        UserCRUD.add_trusted_device(db, user, device_fingerprint, user_agent[:50])
+        await run_in_threadpool(UserCRUD.add_trusted_device, db, user, device_fingerprint, user_agent[:50])
     
     # Create access token
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data=token_claims(user), expires_delta=access_token_expires
     )
     
     # Create refresh token
     refresh_token_expires = timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
     refresh_token = create_refresh_token(
-        data={"sub": user.email}, expires_delta=refresh_token_expires
+        data=token_claims(user), expires_delta=refresh_token_expires
     )
     
     return {
@@ -89,7 +94,7 @@ async def login(user_data: UserLogin, request: Request, db: Session = Depends(ge
     }
 
 @router.post("/refresh")
-async def refresh_token(token_data: TokenRefresh, db: Session = Depends(get_db)):
+async def refresh_token(token_data: TokenRefresh, db: AsyncSession = Depends(get_async_db)):
     """Refresh access token using refresh token"""
     email = verify_token(token_data.refresh_token)
     if not email:
@@ -99,7 +104,7 @@ async def refresh_token(token_data: TokenRefresh, db: Session = Depends(get_db))
             headers={"WWW-Authenticate": "Bearer"},
         )
         
-    user = UserCRUD.get_user_by_email(db, email)
+    user = await AsyncUserCRUD.get_user_by_email(db, email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -113,7 +118,7 @@ async def refresh_token(token_data: TokenRefresh, db: Session = Depends(get_db))
     # Create new access token
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data=token_claims(user), expires_delta=access_token_expires
     )
     
     return {
@@ -133,11 +138,11 @@ async def update_user_info(
     db: Session = Depends(get_db)
 ):
     """Update current user information"""
-    updated_user = UserCRUD.update_user(db, current_user, user_data)
+    updated_user = await AuthManager.run_password_task(UserCRUD.update_user, db, current_user, user_data)
     return updated_user
 
 @router.post("/mfa/setup", response_model=MFASetup)
-async def setup_mfa(
+def setup_mfa(
     current_user = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -146,7 +151,7 @@ async def setup_mfa(
     return mfa_data
 
 @router.post("/mfa/verify-setup")
-async def verify_mfa_setup(
+def verify_mfa_setup(
     verification: MFAVerification,
     current_user = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -162,7 +167,9 @@ async def disable_mfa(
     db: Session = Depends(get_db)
 ):
     """Disable MFA for current user"""
-    success = UserCRUD.disable_mfa(db, current_user, mfa_disable.password, mfa_disable.code)
+    success = await AuthManager.run_password_task(
+        UserCRUD.disable_mfa, db, current_user, mfa_disable.password, mfa_disable.code
+    )
     return {"success": success, "message": "MFA disabled successfully"}
 
 @router.get("/mfa/status")
@@ -177,7 +184,7 @@ async def get_mfa_status(
     }
 
 @router.post("/password-reset")
-async def request_password_reset(reset_data: PasswordReset, db: Session = Depends(get_db)):
+def request_password_reset(reset_data: PasswordReset, db: Session = Depends(get_db)):
     """Request password reset"""
     success = UserCRUD.initiate_password_reset(db, reset_data.email)
     return {"message": "If the email exists, a reset link has been sent"}
@@ -188,11 +195,13 @@ async def confirm_password_reset(
     db: Session = Depends(get_db)
 ):
     """Confirm password reset with token"""
-    success = UserCRUD.reset_password(db, reset_data.token, reset_data.new_password)
+    success = await AuthManager.run_password_task(
+        UserCRUD.reset_password, db, reset_data.token, reset_data.new_password
+    )
     return {"success": success, "message": "Password reset successfully"}
 
 @router.delete("/me")
-async def delete_account(
+def delete_account(
     current_user = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -207,8 +216,8 @@ async def change_email(
     db: Session = Depends(get_db)
 ):
     """Change user email address"""
-    success = UserCRUD.change_email(
-        db, current_user, email_data.current_password, email_data.new_email
+    success = await AuthManager.run_password_task(
+        UserCRUD.change_email, db, current_user, email_data.current_password, email_data.new_email
     )
     return {"success": success, "message": "Email address updated successfully"}
 
@@ -220,8 +229,8 @@ async def change_password(
 ):
     """Change user password"""
     try:
-        success = UserCRUD.change_password(
-            db, current_user, password_data.current_password, password_data.new_password
+        success = await AuthManager.run_password_task(
+            UserCRUD.change_password, db, current_user, password_data.current_password, password_data.new_password
         )
         logger.info(f"Password change successful for user: {current_user.email}")
         return {"success": success, "message": "Password updated successfully"}
@@ -255,38 +264,38 @@ async def reset_password_page(request: Request, token: str = None):
 
 @router.get("/terminal-settings")
 async def get_terminal_settings(
-    current_user = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get user's terminal settings"""
-    settings = UserCRUD.get_terminal_settings(db, current_user)
+    settings = await AsyncUserCRUD.get_terminal_settings(db, current_user.id)
     return {"settings": settings}
 
 @router.post("/terminal-settings")
 async def save_terminal_settings(
     settings: TerminalSettings,
-    current_user = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Save user's terminal settings"""
-    success = UserCRUD.save_terminal_settings(db, current_user, settings.dict(exclude_unset=True))
+    success = await AsyncUserCRUD.save_terminal_settings(db, current_user.id, settings.dict(exclude_unset=True))
     return {"success": success, "message": "Terminal settings saved successfully"}
 
 @router.get("/trusted-devices")
 async def get_trusted_devices(
-    current_user = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get user's trusted devices"""
-    devices = UserCRUD.get_trusted_devices(db, current_user)
+    devices = await AsyncUserCRUD.get_trusted_devices(db, current_user.id)
     return {"devices": [TrustedDeviceResponse.from_orm(device) for device in devices]}
 
 @router.delete("/trusted-devices/{device_id}")
 async def remove_trusted_device(
     device_id: int,
-    current_user = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Remove a trusted device"""
-    success = UserCRUD.remove_trusted_device(db, current_user, device_id)
+    success = await AsyncUserCRUD.remove_trusted_device(db, current_user.id, device_id)
     return {"success": success, "message": "Trusted device removed successfully" if success else "Device not found"}
\ No newline at end of file
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Depends
+from app.core.jwt_auth import get_current_principal
+from app.db.pool import pool_status
+from app.db.session import async_engine, engine
+from app.schemas import user_schema
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+@router.get("/db-pool")
+async def db_pool_metrics(current_user: user_schema.Principal = Depends(get_current_principal)):
+    """Report connection pool occupancy and checkout wait times"""
+    return {
+        "sync": pool_status(engine.pool),
+        "async": pool_status(async_engine.sync_engine.pool),
+    }
@@ -0,0 +1,323 @@
+import logging
+import posixpath
+from contextlib import AsyncExitStack
+from typing import Optional
+
+import paramiko
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+
+from app.core.config import settings
+from app.core.file_transfer import TransferError, partial_path, remote_sha256, upload_segments
+from app.core.jwt_auth import get_current_principal
+from app.core.sftp import describe, iter_remote_file, sftp_session, write_remote_file
+from app.core.ssh_bulk import exec_executor
+from app.core.ssh_pool import SSHPoolExhausted, ssh_pool
+from app.crud import user
+from app.dependencies import get_async_session_factory
+from app.schemas import user_schema
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/clients/{client_id}/sftp", tags=["sftp"])
+
+# Failures that are reported to the caller instead of raised
+SFTP_ERRORS = (IOError, paramiko.SSHException, SSHPoolExhausted, TransferError)
+
+# Transfers with a request in flight on this worker
+active_transfers = set()
+
+
+async def load_client(session_factory, client_id: int, user_id: int):
+    # Transfers can run for a long time, so the DB session is closed before
+    # any SSH work starts
+    async with session_factory() as db:
+        row = await user.get_client_async(db=db, client_id=client_id, user_id=user_id)
+        return user_schema.SSHClientRecord.model_validate(row) if row else None
+
+
+async def load_transfer(session_factory, transfer_id: int, client_id: int, user_id: int):
+    async with session_factory() as db:
+        row = await user.get_transfer_async(db=db, transfer_id=transfer_id, user_id=user_id, client_id=client_id)
+        return user_schema.FileTransferInfo.model_validate(row) if row else None
+
+
+async def save_transfer(session_factory, transfer_id: int, **values):
+    async with session_factory() as db:
+        await user.update_transfer_async(db, transfer_id, **values)
+
+
+async def remote_exists(sftp: paramiko.SFTPClient, path: str) -> bool:
+    try:
+        await ssh_pool.executor.run(sftp.stat, path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+@router.get("/list")
+async def list_directory(client_id: int, path: str = ".", session_factory=Depends(get_async_session_factory), current_user: user_schema.Principal = Depends(get_current_principal)):
+    """List a remote directory"""
+    client_details = await load_client(session_factory, client_id, current_user.id)
+    if not client_details:
+        return {"error": "Client not found"}
+    try:
+        async with sftp_session(ssh_pool, current_user.id, client_details) as sftp:
+            resolved = await ssh_pool.executor.run(sftp.normalize, path)
+            entries = await ssh_pool.executor.run(sftp.listdir_attr, resolved)
+    except SFTP_ERRORS as e:
+        logger.error(f"SFTP listing of {path} on client {client_id} failed: {e}")
+        return {"error": f"Failed to list {path}: {e}"}
+    entries.sort(key=lambda entry: entry.filename)
+    return {"path": resolved, "entries": [describe(entry) for entry in entries]}
+
+
+@router.get("/stat")
+async def stat_path(client_id: int, path: str = Query(..., min_length=1), session_factory=Depends(get_async_session_factory), current_user: user_schema.Principal = Depends(get_current_principal)):
+    """Return the attributes of a remote file or directory"""
+    client_details = await load_client(session_factory, client_id, current_user.id)
+    if not client_details:
+        return {"error": "Client not found"}
+    try:
+        async with sftp_session(ssh_pool, current_user.id, client_details) as sftp:
+            attributes = await ssh_pool.executor.run(sftp.stat, path)
+    except SFTP_ERRORS as e:
+        return {"error": f"Failed to stat {path}: {e}"}
+    return describe(attributes, posixpath.basename(path.rstrip("/")) or path)
+
+
+@router.get("/file")
+async def download_file(client_id: int, path: str = Query(..., min_length=1), session_factory=Depends(get_async_session_factory), current_user: user_schema.Principal = Depends(get_current_principal)):
+    """Stream a remote file to the browser"""
+    client_details = await load_client(session_factory, client_id, current_user.id)
+    if not client_details:
+        return {"error": "Client not found"}
+
+    # The SFTP channel and file stay open until the body has been sent
+    resources = AsyncExitStack()
+    try:
+        sftp = await resources.enter_async_context(sftp_session(ssh_pool, current_user.id, client_details))
+        attributes = await ssh_pool.executor.run(sftp.stat, path)
+        remote_file = await ssh_pool.executor.run(sftp.open, path, "rb")
+        resources.push_async_callback(ssh_pool.executor.run, remote_file.close)
+    except SFTP_ERRORS as e:
+        await resources.aclose()
+        logger.error(f"SFTP download of {path} from client {client_id} failed: {e}")
+        return {"error": f"Failed to open {path}: {e}"}
+
+    async def body():
+        async with resources:
+            async for chunk in iter_remote_file(
+                ssh_pool.executor, remote_file, attributes.st_size, window_bytes=settings.SFTP_READ_WINDOW_BYTES
+            ):
+                yield chunk
+
+    filename = posixpath.basename(path) or "download"
+    return StreamingResponse(body(), media_type="application/octet-stream", headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Content-Length": str(attributes.st_size),
+    })
+
+
+@router.put("/file")
+async def upload_file(client_id: int, request: Request, path: str = Query(..., min_length=1), overwrite: bool = False, session_factory=Depends(get_async_session_factory), current_user: user_schema.Principal = Depends(get_current_principal)):
+    """Write the raw request body to a remote file as it arrives"""
+    client_details = await load_client(session_factory, client_id, current_user.id)
+    if not client_details:
+        return {"error": "Client not found"}
+    try:
+        async with sftp_session(ssh_pool, current_user.id, client_details) as sftp:
+            # "x" refuses to replace an existing file
+            remote_file = await ssh_pool.executor.run(sftp.open, path, "wb" if overwrite else "wxb")
+            try:
+                size = await write_remote_file(ssh_pool.executor, remote_file, request.stream())
+            finally:
+                # Closing waits for the replies to the pipelined writes
+                await ssh_pool.executor.run(remote_file.close)
+    except SFTP_ERRORS as e:
+        logger.error(f"SFTP upload of {path} to client {client_id} failed: {e}")
+        return {"error": f"Failed to upload {path}: {e}"}
+    logger.info(f"Uploaded {size} bytes to {path} on client {client_id}.")
+    return {"path": path, "size": size}
+
+
+@router.post("/transfers")
+async def create_transfer(client_id: int, request: user_schema.FileTransferCreate, session_factory=Depends(get_async_session_factory), current_user: user_schema.Principal = Depends(get_current_principal)):
+    """Start a resumable upload or download.
+
+    Uploads are written to a partial file next to the target and only
+    moved into place once verified; an existing file is only replaced if
+    the transfer asks to overwrite it. Downloads remember the remote file's
+    size and mtime so a resume can detect that it changed.
+    """
+    client_details = await load_client(session_factory, client_id, current_user.id)
+    if not client_details:
+        return {"error": "Client not found"}
+    try:
+        async with sftp_session(ssh_pool, current_user.id, client_details) as sftp:
+            size, mtime = request.size, None
+            if request.direction == "download":
+                attributes = await ssh_pool.executor.run(sftp.stat, request.path)
+                size, mtime = attributes.st_size, int(attributes.st_mtime)
+            elif not request.overwrite and await remote_exists(sftp, request.path):
+                return {"error": f"{request.path} already exists"}
+            async with session_factory() as db:
+                transfer = await user.create_transfer_async(
+                    db, current_user.id, client_id, request.direction, request.path, size,
+                    sha256=request.sha256, remote_mtime=mtime, overwrite=request.overwrite
+                )
+            if request.direction == "upload":
+                try:
+                    partial = await ssh_pool.executor.run(sftp.open, partial_path(request.path, transfer.id), "wb")
+                    await ssh_pool.executor.run(partial.close)
+                except SFTP_ERRORS as e:
+                    await save_transfer(session_factory, transfer.id, status="failed", error=str(e))
+                    raise
+    except SFTP_ERRORS as e:
+        logger.error(f"Starting {request.direction} of {request.path} on client {client_id} failed: {e}")
+        return {"error": f"Failed to start {request.direction}: {e}"}
+    return user_schema.FileTransferInfo.model_validate(transfer)
+
+
+@router.get("/transfers/{transfer_id}")
+async def get_transfer(client_id: int, transfer_id: int, session_factory=Depends(get_async_session_factory), current_user: user_schema.Principal = Depends(get_current_principal)):
+    """Report a transfer's status and the offset to resume from"""
+    transfer = await load_transfer(session_factory, transfer_id, client_id, current_user.id)
+    return transfer or {"error": "Transfer not found"}
+
+
+@router.put("/transfers/{transfer_id}/data")
+async def upload_transfer_data(client_id: int, transfer_id: int, request: Request, offset: int = Query(..., ge=0), session_factory=Depends(get_async_session_factory), current_user: user_schema.Principal = Depends(get_current_principal)):
+    """Append the raw request body to an upload, starting at its confirmed offset.
+
+    Progress is saved after every SFTP_TRANSFER_SEGMENT_BYTES, so after an
+    interruption the client asks for the transfer and resends from
+    confirmed_offset.
+    """
+    if transfer_id in active_transfers:
+        return {"error": "Transfer already in progress"}
+    # Claimed before the first await, so a concurrent request for the same
+    # transfer cannot pass the check above or read a stale confirmed_offset
+    active_transfers.add(transfer_id)
+    try:
+        transfer = await load_transfer(session_factory, transfer_id, client_id, current_user.id)
+        if not transfer or transfer.direction != "upload":
+            return {"error": "Transfer not found"}
+        if transfer.status != "active":
+            return {"error": f"Transfer is {transfer.status}"}
+        if offset != transfer.confirmed_offset:
+            return {"error": f"Resume from offset {transfer.confirmed_offset}", "confirmed_offset": transfer.confirmed_offset}
+        client_details = await load_client(session_factory, client_id, current_user.id)
+        if not client_details:
+            return {"error": "Client not found"}
+
+        async def confirm(confirmed_offset):
+            await save_transfer(session_factory, transfer_id, confirmed_offset=confirmed_offset)
+
+        try:
+            async with sftp_session(ssh_pool, current_user.id, client_details) as sftp:
+                await upload_segments(
+                    ssh_pool.executor, sftp, partial_path(transfer.remote_path, transfer_id), request.stream(),
+                    offset, transfer.size, settings.SFTP_TRANSFER_SEGMENT_BYTES, confirm
+                )
+        except SFTP_ERRORS as e:
+            logger.error(f"Upload {transfer_id} to client {client_id} interrupted: {e}")
+            transfer = await load_transfer(session_factory, transfer_id, client_id, current_user.id)
+            return {"error": f"Upload interrupted: {e}", "confirmed_offset": transfer.confirmed_offset}
+    finally:
+        active_transfers.discard(transfer_id)
+    return await load_transfer(session_factory, transfer_id, client_id, current_user.id)
+
+
+@router.get("/transfers/{transfer_id}/data")
+async def download_transfer_data(client_id: int, transfer_id: int, offset: int = Query(0, ge=0), session_factory=Depends(get_async_session_factory), current_user: user_schema.Principal = Depends(get_current_principal)):
+    """Stream a download from offset to the end of the file.
+
+    Requesting an offset confirms that the client holds every byte before
+    it; that offset is saved as the transfer's progress.
+    """
+    transfer = await load_transfer(session_factory, transfer_id, client_id, current_user.id)
+    if not transfer or transfer.direction != "download":
+        return {"error": "Transfer not found"}
+    if transfer.status != "active":
+        return {"error": f"Transfer is {transfer.status}"}
+    if offset > transfer.size:
+        return {"error": f"Offset is past the end of the {transfer.size} byte file"}
+    client_details = await load_client(session_factory, client_id, current_user.id)
+    if not client_details:
+        return {"error": "Client not found"}
+
+    resources = AsyncExitStack()
+    try:
+        sftp = await resources.enter_async_context(sftp_session(ssh_pool, current_user.id, client_details))
+        attributes = await ssh_pool.executor.run(sftp.stat, transfer.remote_path)
+        if (attributes.st_size, int(attributes.st_mtime)) != (transfer.size, transfer.remote_mtime):
+            raise TransferError("Remote file changed since the transfer started")
+        remote_file = await ssh_pool.executor.run(sftp.open, transfer.remote_path, "rb")
+        resources.push_async_callback(ssh_pool.executor.run, remote_file.close)
+    except SFTP_ERRORS as e:
+        await resources.aclose()
+        if isinstance(e, TransferError):
+            await save_transfer(session_factory, transfer_id, status="failed", error=str(e))
+        return {"error": f"Failed to resume download: {e}"}
+    await save_transfer(session_factory, transfer_id, confirmed_offset=offset)
+
+    async def body():
+        async with resources:
+            async for chunk in iter_remote_file(
+                ssh_pool.executor, remote_file, transfer.size, offset=offset,
+                window_bytes=settings.SFTP_READ_WINDOW_BYTES
+            ):
+                yield chunk
+
+    return StreamingResponse(body(), media_type="application/octet-stream", headers={
+        "Content-Length": str(transfer.size - offset),
+        "X-Transfer-Offset": str(offset),
+    })
+
+
+@router.post("/transfers/{transfer_id}/verify")
+async def verify_transfer(client_id: int, transfer_id: int, request: Optional[user_schema.FileTransferVerify] = None, session_factory=Depends(get_async_session_factory), current_user: user_schema.Principal = Depends(get_current_principal)):
+    """Hash the file on the host and finish the transfer.
+
+    The digest is checked against the one given here or when the transfer
+    was created. A verified upload is moved to its final path; for
+    downloads the returned sha256 lets the client check its copy.
+    """
+    transfer = await load_transfer(session_factory, transfer_id, client_id, current_user.id)
+    if not transfer:
+        return {"error": "Transfer not found"}
+    if transfer.status != "active":
+        return {"error": f"Transfer is {transfer.status}"}
+    if transfer.direction == "upload" and transfer.confirmed_offset != transfer.size:
+        return {"error": f"Upload incomplete: {transfer.confirmed_offset} of {transfer.size} bytes confirmed"}
+    client_details = await load_client(session_factory, client_id, current_user.id)
+    if not client_details:
+        return {"error": "Client not found"}
+
+    expected = (request.sha256 if request else None) or transfer.sha256
+    target = partial_path(transfer.remote_path, transfer_id) if transfer.direction == "upload" else transfer.remote_path
+    try:
+        async with ssh_pool.borrow(current_user.id, client_details) as ssh_client:
+            # Hashing a large file can take minutes, so it runs with the
+            # fan-out commands instead of on the interactive SSH executor
+            digest = await exec_executor.run(remote_sha256, ssh_client, target, settings.SFTP_HASH_TIMEOUT)
+        if expected and digest != expected:
+            await save_transfer(session_factory, transfer_id, status="failed", sha256=digest,
+                                error=f"Checksum mismatch: expected {expected}, host has {digest}")
+            return await load_transfer(session_factory, transfer_id, client_id, current_user.id)
+        if transfer.direction == "upload":
+            async with sftp_session(ssh_pool, current_user.id, client_details) as sftp:
+                if transfer.overwrite:
+                    await ssh_pool.executor.run(sftp.posix_rename, target, transfer.remote_path)
+                elif await remote_exists(sftp, transfer.remote_path):
+                    # Created since the transfer started; keep the partial
+                    # file so the upload can be redone with overwrite
+                    return {"error": f"{transfer.remote_path} already exists"}
+                else:
+                    await ssh_pool.executor.run(sftp.rename, target, transfer.remote_path)
+    except SFTP_ERRORS as e:
+        logger.error(f"Verifying transfer {transfer_id} on client {client_id} failed: {e}")
+        return {"error": f"Failed to verify transfer: {e}"}
+    await save_transfer(session_factory, transfer_id, status="completed", sha256=digest,
+                        confirmed_offset=transfer.size, error=None)
+    return await load_transfer(session_factory, transfer_id, client_id, current_user.id)
@@ -0,0 +1,113 @@
+import logging
+
+from fastapi import APIRouter, Depends, WebSocket
+from starlette.websockets import WebSocketDisconnect, WebSocketState
+
+from app.core.jwt_auth import get_current_principal, get_current_user_from_token
+from app.core.port_forwarding import (
+    SOCKS_GENERAL_FAILURE, SOCKS_SUCCEEDED, TUNNEL_MODES, FrameReader, TunnelError,
+    socks_handshake, socks_reply, tunnels, validate_target
+)
+from app.crud import user
+from app.dependencies import get_async_session_factory
+from app.schemas import user_schema
+
+logger = logging.getLogger(__name__)
+router = APIRouter(tags=["tunnels"])
+
+# WebSocket close reasons are limited to 123 bytes
+MAX_CLOSE_REASON = 120
+
+
+def close_reason(message: str) -> str:
+    """Cut a message to fit a close frame without splitting a UTF-8 sequence"""
+    return message.encode()[:MAX_CLOSE_REASON].decode(errors="ignore")
+
+
+@router.get("/tunnels")
+async def list_tunnels(current_user: user_schema.Principal = Depends(get_current_principal)):
+    """List the user's open tunnels with their byte counters"""
+    return [tunnel.describe() for tunnel in tunnels.list(current_user.id)]
+
+
+@router.websocket("/ws/tunnel/{client_id}")
+async def tunnel_endpoint(websocket: WebSocket, client_id: int, token: str = None, mode: str = "direct", host: str = None, port: int = None, session_factory=Depends(get_async_session_factory)):
+    # One WebSocket carries one forwarded TCP connection as binary frames.
+    # ?mode=direct&host=...&port=... connects to a fixed target reachable from
+    # the saved host (local forwarding). ?mode=socks reads a SOCKS5 CONNECT
+    # request from the stream first (dynamic forwarding).
+    # Authentication works as for terminals, with ?token=...
+    await websocket.accept()
+
+    if not token:
+        await websocket.close(code=4003, reason="Authentication required")
+        return
+
+    if mode not in TUNNEL_MODES:
+        await websocket.close(code=4002, reason="Unsupported tunnel mode")
+        return
+
+    if mode == "direct":
+        try:
+            validate_target(host, port or 0)
+        except ValueError as e:
+            await websocket.close(code=4002, reason=close_reason(str(e)))
+            return
+
+    # Tunnels can stay open for hours, so the database is only used here
+    async with session_factory() as db:
+        try:
+            current_user = await get_current_user_from_token(token, db)
+        except Exception as e:
+            logger.error(f"Tunnel auth failed: {e}")
+            await websocket.close(code=4003, reason="Invalid token")
+            return
+        row = await user.get_client_async(db=db, client_id=client_id, user_id=current_user.id)
+        if not row:
+            logger.warning(f"Client with id {client_id} not found.")
+            await websocket.close(code=4000, reason="Client not found")
+            return
+        client_details = user_schema.SSHClientRecord.model_validate(row)
+
+    try:
+        tunnel = tunnels.create(current_user.id, client_id, mode)
+    except TunnelError as e:
+        await websocket.close(code=4029, reason=close_reason(str(e)))
+        return
+
+    async def receive():
+        # Only binary frames carry data; None marks the end of the stream
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return None
+            if message.get("bytes"):
+                return message["bytes"]
+
+    reader = FrameReader(receive)
+    try:
+        if mode == "socks":
+            host, port = await socks_handshake(reader, websocket.send_bytes)
+        try:
+            await tunnel.connect(client_details, host, port)
+        except Exception as e:
+            if mode == "socks":
+                reply = e.reply if isinstance(e, TunnelError) else SOCKS_GENERAL_FAILURE
+                await websocket.send_bytes(socks_reply(reply))
+            raise
+        if mode == "socks":
+            await websocket.send_bytes(socks_reply(SOCKS_SUCCEEDED))
+        await tunnel.run(reader, websocket.send_bytes)
+        if websocket.client_state == WebSocketState.CONNECTED:
+            # The target closed the connection
+            await websocket.close()
+    except WebSocketDisconnect:
+        logger.info(f"Tunnel {tunnel.id} for client {client_id} disconnected.")
+    except Exception as e:
+        logger.error(f"Tunnel {tunnel.id} for client {client_id} failed: {e}")
+        try:
+            await websocket.close(code=4004, reason=close_reason(str(e)))
+        except RuntimeError as re:
+            logger.warning(f"Tried to close websocket, but it was already closed: {re}")
+    finally:
+        await tunnel.close()
@@ -1,17 +1,31 @@
 import logging
-import paramiko
 import asyncio
+import json
 import time
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, Request, WebSocket
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import APIRouter, Depends, File, Form, Query, Request, UploadFile, WebSocket
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.websockets import WebSocketDisconnect
 from app.crud import user
-from app.dependencies import get_db
+from app.crud.auth import AsyncUserCRUD
+from app.dependencies import get_async_db, get_async_session_factory
 from app.schemas import user_schema
-from app.core.jwt_auth import get_current_active_user
+from app.core.jwt_auth import get_current_principal
+from app.core.config import settings
+from app.core.host_inventory import (
+    EXPORT_FIELDS, EXPORT_FORMATS, IMPORT_FORMATS, guess_format, parse_inventory, render_csv_header, render_csv_row
+)
+from app.core.known_hosts import known_hosts
+from app.core.session_recording import read_recording, session_recordings
+from app.core.ssh_bridge import OutputEncoder, parse_control_message, validate_terminal_size
+from app.core.ssh_bulk import exec_on_clients, map_clients
+from app.core.ssh_executor import ssh_executor
+from app.core.ssh_keys import private_key_cache
+from app.core.ssh_pool import ssh_pool
+from app.core.terminal_sessions import SESSION_TOKEN_PATTERN, terminal_sessions
 
 
 logger = logging.getLogger(__name__)
@@ -29,175 +43,396 @@ async def login_page(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
 @router.post("/clients")
-async def create_client(client: user_schema.SSHClient, db: Session = Depends(get_db), current_user: user_schema.UserResponse = Depends(get_current_active_user)):
-    return user.create_client(db=db, client=client, user_id=current_user.id)
+async def create_client(client: user_schema.SSHClient, db: AsyncSession = Depends(get_async_db), current_user: user_schema.Principal = Depends(get_current_principal)):
+    return await user.create_client_async(db=db, client=client, user_id=current_user.id)
 
-@router.get("/clients")
-async def get_clients(db: Session = Depends(get_db), current_user: user_schema.UserResponse = Depends(get_current_active_user)):
-    return {"clients": user.get_clients(db=db, user_id=current_user.id)}
+@router.get("/clients", response_model=user_schema.SSHClientPage)
+async def get_clients(cursor: Optional[int] = None, limit: int = Query(100, ge=1, le=500), q: Optional[str] = Query(None, max_length=255), os: Optional[str] = None, group: Optional[str] = None, db: AsyncSession = Depends(get_async_db), current_user: user_schema.Principal = Depends(get_current_principal)):
+    """List the user's hosts in id order, one keyset page at a time.
+
+    q filters by label, host or username prefix; os and group filter by
+    detected OS and group name.
+    """
+    rows, next_cursor = await user.get_client_page_async(
+        db=db, user_id=current_user.id, cursor=cursor, limit=limit, search=q, os_name=os, group_name=group
+    )
+    return {"clients": rows, "next_cursor": next_cursor}
+
+@router.post("/clients/import")
+async def import_clients(file: UploadFile = File(...), format: Optional[str] = Form(None), db: AsyncSession = Depends(get_async_db), current_user: user_schema.Principal = Depends(get_current_principal)):
+    """Import hosts from a CSV, JSON or OpenSSH config file in one transaction.
+
+    Nothing is stored if any entry fails validation; the response lists the
+    failing entries instead.
+    """
+    fmt = format or guess_format(file.filename)
+    if fmt not in IMPORT_FORMATS:
+        return {"error": f"Unsupported import format: {fmt}"}
+    content = await file.read(settings.CLIENT_IMPORT_MAX_BYTES + 1)
+    if len(content) > settings.CLIENT_IMPORT_MAX_BYTES:
+        return {"error": "Import file is too large"}
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return {"error": "Import file must be UTF-8 encoded"}
+
+    clients, errors = parse_inventory(text, fmt)
+    if errors:
+        return {"imported": 0, "errors": errors}
+    imported = await user.bulk_create_clients_async(db=db, clients=clients, user_id=current_user.id)
+    logger.info(f"Imported {imported} SSH clients for user {current_user.id}.")
+    return {"imported": imported, "errors": []}
+
+@router.get("/clients/export")
+async def export_clients(format: str = "json", db: AsyncSession = Depends(get_async_db), current_user: user_schema.Principal = Depends(get_current_principal)):
+    """Stream the user's hosts as CSV or JSON; credentials are never exported"""
+    if format not in EXPORT_FORMATS:
+        return {"error": f"Unsupported export format: {format}"}
+    rows = user.stream_clients_async(db=db, user_id=current_user.id, columns=EXPORT_FIELDS)
+
+    async def as_csv():
+        yield render_csv_header()
+        async for row in rows:
+            yield render_csv_row(row)
+
+    async def as_json():
+        yield '{"clients": ['
+        separator = ""
+        async for row in rows:
+            yield separator + json.dumps(dict(row._mapping))
+            separator = ","
+        yield "]}"
+
+    if format == "csv":
+        body, media_type = as_csv(), "text/csv"
+    else:
+        body, media_type = as_json(), "application/json"
+    return StreamingResponse(body, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="ssh-clients.{format}"'
+    })
 
 @router.get("/clients/{client_id}")
-async def get_client(client_id: int, db: Session = Depends(get_db), current_user: user_schema.UserResponse = Depends(get_current_active_user)):
-    return user.get_client(db=db, client_id=client_id, user_id=current_user.id)
+async def get_client(client_id: int, db: AsyncSession = Depends(get_async_db), current_user: user_schema.Principal = Depends(get_current_principal)):
+    return await user.get_client_async(db=db, client_id=client_id, user_id=current_user.id)
 
 @router.put("/clients/{client_id}")
-async def update_client(client_id: int, client: user_schema.SSHClient, db: Session = Depends(get_db), current_user: user_schema.UserResponse = Depends(get_current_active_user)):
-    return user.update_client(db=db, client_id=client_id, client=client, user_id=current_user.id)
+async def update_client(client_id: int, client: user_schema.SSHClient, db: AsyncSession = Depends(get_async_db), current_user: user_schema.Principal = Depends(get_current_principal)):
+    ssh_pool.invalidate(current_user.id, client_id)
+    private_key_cache.invalidate(client_id)
+    return await user.update_client_async(db=db, client_id=client_id, client=client, user_id=current_user.id)
 
 @router.delete("/clients/{client_id}")
-async def delete_client(client_id: int, db: Session = Depends(get_db), current_user: user_schema.UserResponse = Depends(get_current_active_user)):
-    return user.delete_client(db=db, client_id=client_id, user_id=current_user.id)
+async def delete_client(client_id: int, db: AsyncSession = Depends(get_async_db), current_user: user_schema.Principal = Depends(get_current_principal)):
+    ssh_pool.invalidate(current_user.id, client_id)
+    private_key_cache.invalidate(client_id)
+    return await user.delete_client_async(db=db, client_id=client_id, user_id=current_user.id)
+
+@router.delete("/clients/{client_id}/host-key")
+async def forget_client_host_key(client_id: int, db: AsyncSession = Depends(get_async_db), current_user: user_schema.Principal = Depends(get_current_principal)):
+    """Forget the pinned host key so the next connection pins the new one"""
+    client_details = await user.get_client_async(db=db, client_id=client_id, user_id=current_user.id)
+    if not client_details:
+        return {"error": "Client not found"}
+    ssh_pool.invalidate(current_user.id, client_id)
+    forgotten = await ssh_executor.run(known_hosts.forget, current_user.id, client_details.host, client_details.port)
+    return {"forgotten": forgotten}
+
+
+# One round trip for POSIX hosts: the first line is the kernel name, the
+# rest is the distribution's release file if there is one
+OS_PROBE_COMMAND = 'uname -s 2>/dev/null; cat /etc/os-release 2>/dev/null || cat /etc/redhat-release 2>/dev/null'
+
+
+def parse_os_probe(output: str) -> Optional[str]:
+    """Map the output of OS_PROBE_COMMAND to an OS name, or None if not POSIX"""
+    lines = output.lower().split('\n', 1)
+    os_output = lines[0].strip()
+    distro_output = lines[1] if len(lines) > 1 else ''
+    
+    if 'linux' in os_output:
+        if 'ubuntu' in distro_output:
+            return 'ubuntu'
+        elif 'debian' in distro_output:
+            return 'debian'
+        elif 'centos' in distro_output or 'red hat' in distro_output:
+            return 'redhat'
+        elif 'fedora' in distro_output:
+            return 'fedora'
+        elif 'alpine' in distro_output:
+            return 'alpine'
+        elif 'arch' in distro_output:
+            return 'arch'
+        else:
+            return 'linux'
+    elif 'darwin' in os_output:
+        return 'macos'
+    elif 'freebsd' in os_output:
+        return 'freebsd'
+    elif 'openbsd' in os_output:
+        return 'openbsd'
+    return None
 
 
 def detect_operating_system(ssh_client):
     """Detect operating system through SSH connection"""
     try:
-        # Execute uname command to detect OS
-        stdin, stdout, stderr = ssh_client.exec_command('uname -s', timeout=5)
-        os_output = stdout.read().decode().strip().lower()
+        stdin, stdout, stderr = ssh_client.exec_command(OS_PROBE_COMMAND, timeout=5)
+        detected_os = parse_os_probe(stdout.read().decode(errors='replace'))
+        if detected_os:
+            return detected_os
         
-        if 'linux' in os_output:
-            # Try to detect specific Linux distribution
-            stdin, stdout, stderr = ssh_client.exec_command('cat /etc/os-release 2>/dev/null || cat /etc/redhat-release 2>/dev/null || echo "linux"', timeout=5)
-            distro_output = stdout.read().decode().lower()
-            
-            if 'ubuntu' in distro_output:
-                return 'ubuntu'
-            elif 'debian' in distro_output:
-                return 'debian'
-            elif 'centos' in distro_output or 'red hat' in distro_output:
-                return 'redhat'
-            elif 'fedora' in distro_output:
-                return 'fedora'
-            elif 'alpine' in distro_output:
-                return 'alpine'
-            elif 'arch' in distro_output:
-                return 'arch'
-            else:
-                return 'linux'
-                
-        elif 'darwin' in os_output:
-            return 'macos'
-        elif 'freebsd' in os_output:
-            return 'freebsd'
-        elif 'openbsd' in os_output:
-            return 'openbsd'
-        else:
-            # Try Windows detection
-            stdin, stdout, stderr = ssh_client.exec_command('ver', timeout=5)
-            windows_output = stdout.read().decode().lower()
-            if 'windows' in windows_output or 'microsoft' in windows_output:
-                return 'windows'
-            return 'unknown'
+        # Try Windows detection
+        stdin, stdout, stderr = ssh_client.exec_command('ver', timeout=5)
+        windows_output = stdout.read().decode(errors='replace').lower()
+        if 'windows' in windows_output or 'microsoft' in windows_output:
+            return 'windows'
+        return 'unknown'
             
     except Exception as e:
         logger.error(f"OS detection failed: {e}")
         return 'unknown'
 
 
+async def load_clients(session_factory, user_id: int, client_ids: Optional[List[int]] = None):
+    # Bulk jobs stream for a long time, so the records are copied out of a
+    # short-lived session instead of holding a DB connection until the end
+    async with session_factory() as db:
+        rows = await user.get_clients_by_ids_async(db=db, user_id=user_id, client_ids=client_ids)
+        return [user_schema.SSHClientRecord.model_validate(row) for row in rows]
+
+
+@router.post("/clients/detect-os")
+async def detect_clients_os(selection: Optional[user_schema.ClientSelection] = None, session_factory=Depends(get_async_session_factory), current_user: user_schema.Principal = Depends(get_current_principal)):
+    """Detect the operating system of many SSH clients concurrently.
+
+    Streams one JSON line per host as soon as it finishes. Each result is
+    stored before its line is sent, so results are kept even if the caller
+    disconnects part way through.
+    """
+    client_ids = selection.client_ids if selection else None
+    user_id = current_user.id
+    records = await load_clients(session_factory, user_id, client_ids)
+
+    async def results():
+        async for record, detected_os, error in map_clients(
+            detect_operating_system, records, user_id, settings.SSH_BULK_CONCURRENCY
+        ):
+            line = {"client_id": record.id, "label": record.label}
+            if error:
+                logger.error(f"OS detection failed for client {record.id}: {error}")
+                line.update(detected_os="unknown", error=f"Failed to detect OS: {error}")
+            else:
+                async with session_factory() as db:
+                    await user.set_detected_os_async(db=db, user_id=user_id, detected={record.id: detected_os})
+                line["detected_os"] = detected_os
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@router.post("/clients/exec")
+async def exec_on_clients_command(request: user_schema.FanOutCommand, session_factory=Depends(get_async_session_factory), current_user: user_schema.Principal = Depends(get_current_principal)):
+    """Run one command on many SSH clients concurrently.
+
+    Streams NDJSON events as they happen: {"stream": "stdout"|"stderr",
+    "data": ...} chunks, an optional {"stream": "truncated"} notice, then one
+    {"exit_status": ...} or {"error": ...} line per host.
+    """
+    timeout = min(request.timeout or settings.SSH_EXEC_DEFAULT_TIMEOUT, settings.SSH_EXEC_MAX_TIMEOUT)
+    records = await load_clients(session_factory, current_user.id, request.client_ids)
+    user_id = current_user.id
+    logger.info(f"User {user_id} running command on {len(records)} SSH clients.")
+
+    async def events():
+        async for record, kind, payload in exec_on_clients(
+            request.command, records, user_id, settings.SSH_BULK_CONCURRENCY,
+            timeout, settings.SSH_EXEC_MAX_OUTPUT_BYTES
+        ):
+            line = {"client_id": record.id, "label": record.label}
+            if kind == "exit":
+                line["exit_status"] = payload
+            elif kind == "error":
+                logger.error(f"Command failed on client {record.id}: {payload}")
+                line["error"] = str(payload) or type(payload).__name__
+            else:
+                line.update(stream=kind, data=payload)
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
 @router.post("/clients/{client_id}/detect-os")
-async def detect_client_os(client_id: int, db: Session = Depends(get_db), current_user: user_schema.UserResponse = Depends(get_current_active_user)):
+async def detect_client_os(client_id: int, db: AsyncSession = Depends(get_async_db), current_user: user_schema.Principal = Depends(get_current_principal)):
     """Detect and update the operating system of an SSH client"""
-    client_details = user.get_client(db=db, client_id=client_id, user_id=current_user.id)
+    client_details = await user.get_client_async(db=db, client_id=client_id, user_id=current_user.id)
     if not client_details:
         return {"error": "Client not found"}
     
     try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        
-        # Connect to SSH server
-        if client_details.private_key:
-            from io import StringIO
-            private_key = paramiko.RSAKey.from_private_key(StringIO(client_details.private_key))
-            ssh.connect(client_details.host, client_details.port, client_details.username, pkey=private_key, timeout=10)
-        else:
-            ssh.connect(client_details.host, client_details.port, client_details.username, client_details.password, timeout=10)
-        
-        # Detect OS
-        detected_os = detect_operating_system(ssh)
-        ssh.close()
-        
-        # Update the client with detected OS
-        client_data = user_schema.SSHClient(
-            label=client_details.label,
-            host=client_details.host,
-            port=client_details.port,
-            username=client_details.username,
-            password=client_details.password,
-            private_key=client_details.private_key,
-            detected_os=detected_os
-        )
+        # Probe off the event loop, reusing a pooled connection if one is open
+        conn = await ssh_pool.acquire(current_user.id, client_details)
+        try:
+            detected_os = await ssh_executor.run(detect_operating_system, conn.client)
+        finally:
+            ssh_pool.release(conn)
         
-        updated_client = user.update_client(db=db, client_id=client_id, client=client_data, user_id=current_user.id)
-        return {"detected_os": detected_os, "client": updated_client}
+        # Only the detected OS changes; the rest of the client is left as stored
+        await user.set_detected_os_async(db=db, user_id=current_user.id, detected={client_id: detected_os})
+        await db.refresh(client_details)
+        return {"detected_os": detected_os, "client": client_details}
         
     except Exception as e:
         logger.error(f"OS detection failed for client {client_id}: {e}")
         return {"error": f"Failed to detect OS: {str(e)}", "detected_os": "unknown"}
 
 
+@router.get("/recordings", response_model=List[user_schema.SessionRecordingInfo])
+async def list_recordings(client_id: Optional[int] = None, limit: int = Query(100, ge=1, le=500), db: AsyncSession = Depends(get_async_db), current_user: user_schema.Principal = Depends(get_current_principal)):
+    """List the user's terminal recordings, newest first"""
+    return await user.get_recordings_async(db=db, user_id=current_user.id, client_id=client_id, limit=limit)
+
+
+@router.get("/recordings/{recording_id}")
+async def download_recording(recording_id: int, compressed: bool = False, db: AsyncSession = Depends(get_async_db), current_user: user_schema.Principal = Depends(get_current_principal)):
+    """Stream a recording as an asciicast v2 file, ready for asciinema play.
+
+    ?compressed=true returns the stored gzip file instead. Recordings of
+    running sessions can be fetched; they end at the last written batch.
+    """
+    recording = await user.get_recording_async(db=db, recording_id=recording_id, user_id=current_user.id)
+    if not recording:
+        return {"error": "Recording not found"}
+    path = session_recordings.path_for(recording.path)
+    # A sync generator is iterated on Starlette's thread pool, so file reads
+    # and decompression stay off the event loop
+    if compressed:
+        body = read_recording(path, decompress=False)
+        media_type, filename = "application/gzip", f"recording-{recording_id}.cast.gz"
+    else:
+        body = read_recording(path)
+        media_type, filename = "application/x-asciicast", f"recording-{recording_id}.cast"
+    return StreamingResponse(body, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="{filename}"'
+    })
+
+
 @router.websocket("/ws/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id: int, token: str = None, db: Session = Depends(get_db)):
+async def websocket_endpoint(websocket: WebSocket, client_id: int, token: str = None, encoding: str = "text", session: str = None, cols: int = 80, rows: int = 24, session_factory=Depends(get_async_session_factory)):
     # Note: We need to validate the token here since WS doesn't support headers easily
     # We'll expect ?token=... in the URL
+    # ?encoding=binary ships raw output bytes as binary frames instead of text.
+    # In binary mode, binary frames from the browser are keystrokes and text
+    # frames are JSON control messages (data, resize, ping, broadcast); in text
+    # mode every frame is a keystroke. A broadcast message joins this shell with
+    # the user's other sessions so one input stream drives all of them.
+    # ?session=... names a resumable session; reconnecting with the same value
+    # within the grace period reattaches to the running shell
+    # ?cols=...&rows=... size the PTY of a new shell
     await websocket.accept()
     
     if not token:
         await websocket.close(code=4003, reason="Authentication required")
         return
 
-    from app.core.jwt_auth import get_current_user_from_token
+    if encoding not in OutputEncoder.ENCODINGS:
+        await websocket.close(code=4002, reason="Unsupported encoding")
+        return
+
     try:
-        current_user = await get_current_user_from_token(token, db)
-    except Exception as e:
-        logger.error(f"WebSocket auth failed: {e}")
-        await websocket.close(code=4003, reason="Invalid token")
+        validate_terminal_size(cols, rows)
+    except ValueError as e:
+        await websocket.close(code=4002, reason=str(e))
         return
 
-    client_details = user.get_client(db=db, client_id=client_id, user_id=current_user.id)
-    if not client_details:
-        logger.warning(f"Client with id {client_id} not found.")
-        await websocket.close(code=4000, reason="Client not found")
+    if session and not SESSION_TOKEN_PATTERN.match(session):
+        await websocket.close(code=4002, reason="Invalid session token")
         return
 
+    from app.core.jwt_auth import get_current_user_from_token
+    # The terminal can stay open for hours, so the database is only used in
+    # this short-lived session and everything needed afterwards is copied
+    # into plain records before the connection goes back to the pool
+    async with session_factory() as db:
+        try:
+            current_user = await get_current_user_from_token(token, db)
+        except Exception as e:
+            logger.error(f"WebSocket auth failed: {e}")
+            await websocket.close(code=4003, reason="Invalid token")
+            return
+
+        terminal = terminal_sessions.get(session, current_user.id, client_id) if session else None
+        client_details = None
+        if terminal is None:
+            row = await user.get_client_async(db=db, client_id=client_id, user_id=current_user.id)
+            if not row:
+                logger.warning(f"Client with id {client_id} not found.")
+                await websocket.close(code=4000, reason="Client not found")
+                return
+            client_details = user_schema.SSHClientRecord.model_validate(row)
+            terminal_settings = await AsyncUserCRUD.get_terminal_settings(db, current_user.id)
+            record = client_details.record_sessions or bool(terminal_settings.get("recordSessions"))
+
+    attachment = None
+    end_session = False
     try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-        if client_details.private_key:
-            from io import StringIO
-            private_key = paramiko.RSAKey.from_private_key(StringIO(client_details.private_key))
-            logger.info(f"Connecting to {client_details.host}:{client_details.port} with user {client_details.username} and private key.")
-            ssh.connect(client_details.host, client_details.port, client_details.username, pkey=private_key)
+        if terminal is None:
+            terminal = await terminal_sessions.create(
+                session, current_user.id, client_details, cols=cols, rows=rows, record=record
+            )
         else:
-            logger.info(f"Connecting to {client_details.host}:{client_details.port} with user {client_details.username} and password.")
-            ssh.connect(client_details.host, client_details.port, client_details.username, client_details.password)
-        
-        channel = ssh.invoke_shell()
+            logger.info(f"Reattaching to terminal session for client {client_id}.")
+        attachment, scrollback = terminal.attach()
+
+        output = OutputEncoder(encoding)
 
         async def read_from_ssh():
-            while not channel.exit_status_ready():
-                try:
-                    if channel.recv_ready():
-                        data = channel.recv(1024)
-                        if not data:
-                            break
-                        await websocket.send_text(data.decode())
-                    else:
-                        await asyncio.sleep(0.01)
-                except Exception as e:
-                    logger.error(f"Error reading from SSH: {e}")
-                    break
+            try:
+                if scrollback:
+                    await output.send(websocket, scrollback)
+                while True:
+                    data = await attachment.get()
+                    if not data:
+                        break
+                    await output.send(websocket, data)
+                await output.flush(websocket)
+                if not terminal.closed:
+                    # Another connection took the session over
+                    await websocket.close(code=4001, reason="Session attached elsewhere")
+            except Exception as e:
+                logger.error(f"Error sending SSH output to WebSocket: {e}")
             logger.info(f"SSH read loop for client {client_id} finished.")
 
+        async def handle_control_message(text):
+            try:
+                control = parse_control_message(text)
+            except ValueError as e:
+                logger.warning(f"Ignoring control message from client {client_id}: {e}")
+                return
+            if control["type"] == "data":
+                await terminal.write(control["data"])
+            elif control["type"] == "resize":
+                await terminal.resize(control["cols"], control["rows"])
+            elif control["type"] == "ping":
+                await websocket.send_text(json.dumps({"type": "pong"}))
+            elif control["type"] == "broadcast":
+                group = terminal_sessions.broadcast(terminal, control["sessions"])
+                sessions = group.tokens() if group else []
+                await websocket.send_text(json.dumps({"type": "broadcast", "sessions": sessions}))
+
         async def write_to_ssh():
             try:
                 while True:
-                    data = await websocket.receive_text()
-                    if not channel.active:
+                    message = await websocket.receive()
+                    if message["type"] == "websocket.disconnect":
+                        raise WebSocketDisconnect(message.get("code", 1005))
+                    if terminal.closed or not terminal.is_attached(attachment):
                         break
-                    channel.send(data)
+                    if message.get("bytes") is not None:
+                        await terminal.write(message["bytes"])
+                    elif message.get("text") and not output.binary:
+                        await terminal.write(message["text"])
+                    elif message.get("text"):
+                        await handle_control_message(message["text"])
             except WebSocketDisconnect:
                 logger.info(f"WebSocket client {client_id} disconnected.")
                 raise
@@ -226,8 +461,11 @@ async def websocket_endpoint(websocket: WebSocket, client_id: int, token: str =
             if task.exception():
                 raise task.exception()
 
-    except WebSocketDisconnect:
+    except WebSocketDisconnect as e:
         logger.info(f"WebSocketDisconnect: Client {client_id} disconnected gracefully.")
+        # A normal closure means the user closed the terminal; anything else
+        # (reload, network loss) keeps the shell for a reattach
+        end_session = e.code == 1000
     except Exception as e:
         logger.error(f"An error occurred for client {client_id}: {e}")
         try:
@@ -235,8 +473,9 @@ async def websocket_endpoint(websocket: WebSocket, client_id: int, token: str =
         except RuntimeError as re:
             logger.warning(f"Tried to close websocket, but it was already closed: {re}")
     finally:
-        if channel:
-            channel.close()
-        if ssh:
-            ssh.close()
-        logger.info(f"SSH connection for client {client_id} cleaned up.")
\ No newline at end of file
+        if attachment is not None and end_session:
+            await terminal.end(attachment)
+        elif attachment is not None:
+            # The shell keeps running for the grace period if the session is resumable
+            terminal.detach(attachment)
+        logger.info(f"WebSocket for client {client_id} detached from its terminal session.")
@@ -103,6 +103,7 @@ class TerminalSettings(BaseModel):
     theme: Optional[str] = "hacker-blue"
     autoReconnect: Optional[bool] = True
     bellSound: Optional[bool] = False
+    recordSessions: Optional[bool] = False  # Record every terminal the user opens
     terminalThemes: Optional[dict] = {}  # Per-terminal theme mapping
 
 # SSH Client Schema (existing)
@@ -114,6 +115,146 @@ class SSHClient(BaseModel):
     password: Optional[str] = None
     private_key: Optional[str] = None
     detected_os: Optional[str] = None
+    group_name: Optional[str] = None
+    record_sessions: Optional[bool] = None  # Record terminals opened to this host; omitted keeps the stored value
+
+class SSHClientSummary(BaseModel):
+    """Host list entry; credentials are only returned by the detail view"""
+    id: int
+    label: str
+    host: str
+    port: int
+    username: str
+    detected_os: Optional[str] = None
+    group_name: Optional[str] = None
+    
+    class Config:
+        from_attributes = True
+
+class SSHClientPage(BaseModel):
+    clients: List[SSHClientSummary]
+    next_cursor: Optional[int] = None  # Pass back as ?cursor= for the next page
+
+class Principal(BaseModel):
+    """Identity of an authenticated user, cached between requests"""
+    id: int
+    email: str
+    is_active: bool
+    
+    class Config:
+        from_attributes = True
+        frozen = True
+
+class SSHClientRecord(BaseModel):
+    """Immutable snapshot of a saved SSH client, safe to use off the DB session"""
+    id: int
+    user_id: int
+    label: str
+    host: str
+    port: int
+    username: str
+    password: Optional[str] = None
+    private_key: Optional[str] = None
+    detected_os: Optional[str] = None
+    group_name: Optional[str] = None
+    record_sessions: bool = False
+    
+    class Config:
+        from_attributes = True
+        frozen = True
+
+class SessionRecordingInfo(BaseModel):
+    id: int
+    client_id: Optional[int] = None
+    title: Optional[str] = None
+    cols: int
+    rows: int
+    size_bytes: Optional[int] = None  # Compressed size; 0 while recording
+    started_at: Optional[datetime] = None
+    ended_at: Optional[datetime] = None  # None while the session is still running
+    
+    class Config:
+        from_attributes = True
+
+class ClientSelection(BaseModel):
+    client_ids: Optional[List[int]] = None  # None selects all of the user's clients
+
+class FanOutCommand(BaseModel):
+    command: str
+    client_ids: Optional[List[int]] = None  # None runs on all of the user's clients
+    timeout: Optional[float] = None  # Per-host seconds; defaults to SSH_EXEC_DEFAULT_TIMEOUT
+    
+    @validator('command')
+    def command_not_empty(cls, v):
+        if not v.strip():
+            raise ValueError('Command must not be empty')
+        return v
+    
+    @validator('timeout')
+    def timeout_positive(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError('Timeout must be positive')
+        return v
+
+def _check_sha256(v):
+    if v is None:
+        return v
+    v = v.strip().lower()
+    if len(v) != 64 or any(c not in "0123456789abcdef" for c in v):
+        raise ValueError('sha256 must be 64 hex digits')
+    return v
+
+class FileTransferCreate(BaseModel):
+    direction: str  # upload or download
+    path: str
+    size: Optional[int] = None  # Required for uploads; taken from the remote file for downloads
+    sha256: Optional[str] = None  # Expected digest, checked on the host when verifying
+    overwrite: bool = False  # Let a verified upload replace an existing file
+    
+    @validator('direction')
+    def direction_supported(cls, v):
+        if v not in ("upload", "download"):
+            raise ValueError('Direction must be upload or download')
+        return v
+    
+    @validator('path')
+    def path_not_empty(cls, v):
+        if not v.strip():
+            raise ValueError('Path must not be empty')
+        return v
+    
+    @validator('size', always=True)
+    def size_valid(cls, v, values, **kwargs):
+        if v is not None and v < 0:
+            raise ValueError('Size must not be negative')
+        if v is None and values.get('direction') == 'upload':
+            raise ValueError('Uploads must declare their size')
+        return v
+    
+    _sha256 = validator('sha256', allow_reuse=True)(_check_sha256)
+
+class FileTransferVerify(BaseModel):
+    sha256: Optional[str] = None  # Digest computed by the client, e.g. after a download
+    
+    _sha256 = validator('sha256', allow_reuse=True)(_check_sha256)
+
+class FileTransferInfo(BaseModel):
+    id: int
+    client_id: int
+    direction: str
+    remote_path: str
+    size: int
+    confirmed_offset: int  # Resume uploads and downloads from here
+    remote_mtime: Optional[int] = None
+    sha256: Optional[str] = None
+    overwrite: bool = False
+    status: str
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
 
 # Trusted Device Schemas
 class TrustedDeviceCreate(BaseModel):
@@ -0,0 +1,99 @@
+"""
+Measure per-request overhead of the HTTP middleware stack.
+
+Drives a trivial endpoint through the ASGI interface directly (no sockets),
+once bare, once behind the previous BaseHTTPMiddleware implementations and
+once behind the current pure ASGI middleware.
+
+Usage: python -m benchmarks.middleware_overhead [requests]
+"""
+import asyncio
+import sys
+import time
+
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from app.core.auth_middleware import AuthMiddleware
+from app.main import ReferrerPolicyMiddleware
+
+
+class LegacyAuthMiddleware(BaseHTTPMiddleware):
+    PROTECTED_ROUTES = []
+    PUBLIC_ROUTES = ["/auth", "/css", "/js", "/docs", "/openapi.json", "/"]
+
+    async def dispatch(self, request, call_next):
+        path = request.url.path
+        if any(path.startswith(route) for route in self.PUBLIC_ROUTES):
+            return await call_next(request)
+        return await call_next(request)
+
+
+class LegacyReferrerPolicyMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        response = await call_next(request)
+        response.headers["Referrer-Policy"] = "same-origin"
+        return response
+
+
+async def endpoint(request):
+    return PlainTextResponse("ok")
+
+
+def build_app(*middleware):
+    app = Starlette(routes=[Route("/clients", endpoint)])
+    for middleware_class in middleware:
+        app.add_middleware(middleware_class)
+    return app
+
+
+async def drive(app, requests: int) -> float:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/clients",
+        "raw_path": b"/clients",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"localhost"), (b"accept", b"application/json")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("localhost", 8000),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    # Warm up route and middleware stack construction
+    for _ in range(100):
+        await app(dict(scope), receive, send)
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    variants = [
+        ("no middleware", build_app()),
+        ("BaseHTTPMiddleware", build_app(LegacyAuthMiddleware, LegacyReferrerPolicyMiddleware)),
+        ("pure ASGI", build_app(AuthMiddleware, ReferrerPolicyMiddleware)),
+    ]
+    baseline = None
+    for name, app in variants:
+        per_request = asyncio.run(drive(app, requests))
+        baseline = per_request if baseline is None else baseline
+        print(f"{name:>20}: {per_request:8.1f} us/request  (+{per_request - baseline:.1f} us)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+// Sessions whose terminal the user closed on purpose. Their socket closes
+// with 1000 so the server ends the shell now; any other unmount (moving a
+// pane, reloading the page) leaves it running for a reattach.
+const endedSessions = new Set()
+
+export const endSession = (sessionId) => {
+  endedSessions.add(sessionId)
+}
+
+export const takeEndedSession = (sessionId) => endedSessions.delete(sessionId)
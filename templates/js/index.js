@@ -933,7 +933,10 @@ Important: Each code can only be used once. Store these codes securely!
         this.createModal.classList.add('active');
     }
 
-    openEditModal(client) {
+    async openEditModal(summary) {
+        // The host list omits credentials; load them from the detail view
+        const response = await fetch(`/clients/${summary.id}`);
+        const client = await response.json();
         this.editingClientId = client.id;
         this.modalHeaderTitle.textContent = 'Edit SSH Client';
         this.submitBtn.textContent = 'Update';
@@ -1245,9 +1248,15 @@ Important: Each code can only be used once. Store these codes securely!
 
     // Client Management
     async fetchClients() {
-        const response = await fetch('/clients');
-        const data = await response.json();
-        this.clients = data.clients;
+        const clients = [];
+        let cursor = null;
+        do {
+            const response = await fetch(cursor === null ? '/clients' : `/clients?cursor=${cursor}`);
+            const data = await response.json();
+            clients.push(...data.clients);
+            cursor = data.next_cursor;
+        } while (cursor !== null && cursor !== undefined);
+        this.clients = clients;
         this.renderClients();
     }
 
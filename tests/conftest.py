@@ -1,12 +1,16 @@
 import pytest
 import tempfile
 import os
+import uuid
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from fastapi.testclient import TestClient
 from app.main import app
 from app.models.user_model import Base
-from app.dependencies import get_db
+from app.db.session import async_database_url
+from app.dependencies import get_async_db, get_async_session_factory, get_db
 
 # Test database setup
 def get_test_db_url():
@@ -48,7 +52,20 @@ def client(db_session):
         finally:
             pass
     
+    # Async routes talk to the same test database; NullPool keeps
+    # connections from outliving the TestClient's event loop
+    async_engine = create_async_engine(
+        async_database_url(str(db_session.get_bind().url)), poolclass=NullPool
+    )
+    AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    
+    async def override_get_async_db():
+        async with AsyncTestingSessionLocal() as session:
+            yield session
+    
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_async_session_factory] = lambda: AsyncTestingSessionLocal
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
@@ -68,4 +85,18 @@ def test_user_login():
     return {
         "email": "test@example.com",
         "password": "Test123!@#"
-    }
\ No newline at end of file
+    }
+
+
+@pytest.fixture
+def auth_headers(client):
+    """Register a fresh user and return its Authorization header"""
+    email = f"user-{uuid.uuid4().hex[:12]}@example.com"
+    password = "Test123!@#"
+    client.post("/auth/register", json={
+        "email": email,
+        "password": password,
+        "confirm_password": password
+    })
+    response = client.post("/auth/login", json={"email": email, "password": password})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
@@ -1,5 +1,27 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import types
+import uuid
+from contextlib import ExitStack, asynccontextmanager
+
+import paramiko
 import pytest
 from fastapi import status
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.websockets import WebSocketDisconnect
+
+from app.core.config import settings
+from app.core.port_forwarding import SOCKS_SUCCEEDED, TunnelRegistry, socks_reply
+from app.core.ssh_executor import SSHExecutor
+from app.db.pool import InstrumentedAsyncQueuePool
+from app.db.session import async_database_url
+from app.dependencies import get_async_db, get_async_session_factory
+from app.main import app
+from app.models.user_model import SessionRecording
+from app.schemas import user_schema
 
 class TestAuthAPI:
     """Test authentication API endpoints"""
@@ -202,4 +224,745 @@ class TestAuthPages:
         response = client.get("/auth/reset-password?token=test_token")
         
         assert response.status_code == status.HTTP_200_OK
-        assert "text/html" in response.headers["content-type"]
\ No newline at end of file
+        assert "text/html" in response.headers["content-type"]
+class TestClientsAPI:
+    """Test SSH client API endpoints"""
+    
+    def create_client(self, client, headers, **overrides):
+        data = {
+            "label": "web-1",
+            "host": "10.0.0.1",
+            "port": 22,
+            "username": "root",
+            "password": "secret"
+        }
+        data.update(overrides)
+        response = client.post("/clients", json=data, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        return response.json()
+    
+    def test_list_clients_pages_without_secrets(self, client, auth_headers):
+        """Test the host list pages by cursor and omits credentials"""
+        created = [self.create_client(client, auth_headers, label=f"web-{i}") for i in range(5)]
+        
+        first = client.get("/clients?limit=2", headers=auth_headers).json()
+        assert [c["id"] for c in first["clients"]] == [c["id"] for c in created[:2]]
+        assert "password" not in first["clients"][0]
+        assert "private_key" not in first["clients"][0]
+        
+        seen = [c["id"] for c in first["clients"]]
+        cursor = first["next_cursor"]
+        while cursor is not None:
+            page = client.get(f"/clients?limit=2&cursor={cursor}", headers=auth_headers).json()
+            seen.extend(c["id"] for c in page["clients"])
+            cursor = page["next_cursor"]
+        assert seen == [c["id"] for c in created]
+        
+        detail = client.get(f"/clients/{created[0]['id']}", headers=auth_headers).json()
+        assert detail["password"] == "secret"
+    
+    def test_search_clients(self, client, auth_headers):
+        """Test filtering the host list by prefix, OS and group"""
+        web = self.create_client(client, auth_headers, label="Web-1", host="10.0.0.1", group_name="prod", detected_os="ubuntu")
+        db = self.create_client(client, auth_headers, label="db-1", host="10.0.1.5", group_name="prod", detected_os="debian")
+        self.create_client(client, auth_headers, label="build_box", host="ci.example.com", username="ci")
+        
+        def search(query):
+            response = client.get(f"/clients?{query}", headers=auth_headers)
+            assert response.status_code == status.HTTP_200_OK
+            return [c["label"] for c in response.json()["clients"]]
+        
+        assert search("q=web") == ["Web-1"]
+        assert search("q=10.0.") == ["Web-1", "db-1"]
+        assert search("q=ci") == ["build_box"]
+        assert search("q=build_") == ["build_box"]
+        assert search("q=%25") == []
+        assert search("group=prod&os=debian") == ["db-1"]
+        assert search("group=prod&q=10.0.0") == ["Web-1"]
+        assert web["group_name"] == "prod" and db["detected_os"] == "debian"
+    
+    def test_import_and_export_clients(self, client, auth_headers):
+        """Test a CSV import lands in one go and streams back out without secrets"""
+        inventory = "label,host,port,username,password,group_name\n"
+        inventory += "".join(f"web-{i},10.0.{i // 250}.{i % 250},,root,secret,prod\n" for i in range(300))
+        response = client.post(
+            "/clients/import",
+            files={"file": ("hosts.csv", inventory, "text/csv")},
+            headers=auth_headers
+        )
+        assert response.json() == {"imported": 300, "errors": []}
+        
+        export = client.get("/clients/export?format=csv", headers=auth_headers)
+        assert export.headers["content-type"].startswith("text/csv")
+        lines = export.text.strip().splitlines()
+        assert lines[0] == "label,host,port,username,group_name,detected_os"
+        assert len(lines) == 301
+        assert lines[1] == "web-0,10.0.0.0,22,root,prod,"
+        assert "secret" not in export.text
+        
+        exported = client.get("/clients/export", headers=auth_headers).json()
+        assert len(exported["clients"]) == 300
+    
+    def test_import_rejects_invalid_entries(self, client, auth_headers):
+        """Test nothing is stored when any entry is invalid"""
+        response = client.post(
+            "/clients/import",
+            files={"file": ("hosts.json", '[{"label": "ok", "host": "h", "username": "u"}, {"label": "bad", "host": "h", "port": "x"}]', "application/json")},
+            headers=auth_headers
+        )
+        data = response.json()
+        assert data["imported"] == 0
+        assert [error["entry"] for error in data["errors"]] == [2]
+        assert client.get("/clients", headers=auth_headers).json()["clients"] == []
+    
+    def test_import_reports_ssh_config_errors(self, client, auth_headers):
+        """Test a malformed ssh_config is reported per line instead of failing the request"""
+        response = client.post(
+            "/clients/import",
+            files={"file": ("config", "Host\nMatch all\n    User root\n", "text/plain")},
+            headers=auth_headers
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert [error["entry"] for error in response.json()["errors"]] == ["line 1", "line 2"]
+    
+    def test_bulk_detect_os_streams_results(self, client, auth_headers, monkeypatch):
+        """Test bulk OS detection streams one line per host and stores results"""
+        from app.routers import user_router
+        
+        first = self.create_client(client, auth_headers, label="web-1")
+        second = self.create_client(client, auth_headers, label="db-1", host="10.0.0.2")
+        
+        async def fake_map_clients(func, clients, user_id, concurrency):
+            for record in clients:
+                if record.id == first["id"]:
+                    yield record, "ubuntu", None
+                else:
+                    yield record, None, TimeoutError("timed out")
+        
+        monkeypatch.setattr(user_router, "map_clients", fake_map_clients)
+        response = client.post("/clients/detect-os", json={}, headers=auth_headers)
+        
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert {line["client_id"] for line in lines} == {first["id"], second["id"]}
+        failed = next(line for line in lines if line["client_id"] == second["id"])
+        assert failed["detected_os"] == "unknown"
+        assert "timed out" in failed["error"]
+        
+        stored = client.get(f"/clients/{first['id']}", headers=auth_headers).json()
+        assert stored["detected_os"] == "ubuntu"
+    
+    def test_bulk_detect_os_keeps_results_after_disconnect(self, client, db_session, auth_headers, monkeypatch):
+        """Test finished hosts are stored without holding a DB connection, even if the stream stops early"""
+        from app.routers import user_router
+        
+        engine = use_pooled_async_db(db_session)
+        first = self.create_client(client, auth_headers, label="web-1")
+        self.create_client(client, auth_headers, label="db-1", host="10.0.0.2")
+        checked_out = []
+        
+        async def fake_map_clients(func, clients, user_id, concurrency):
+            checked_out.append(engine.pool.checkedout())
+            yield next(record for record in clients if record.id == first["id"]), "ubuntu", None
+            raise ConnectionResetError("caller went away")
+        
+        monkeypatch.setattr(user_router, "map_clients", fake_map_clients)
+        with pytest.raises(ConnectionResetError):
+            client.post("/clients/detect-os", json={}, headers=auth_headers)
+        
+        stored = client.get(f"/clients/{first['id']}", headers=auth_headers).json()
+        client.portal.call(engine.dispose)
+        assert stored["detected_os"] == "ubuntu"
+        assert checked_out == [0]
+    
+    def test_exec_streams_command_output(self, client, auth_headers, monkeypatch):
+        """Test fan-out exec streams output chunks and a final status per host"""
+        from app.routers import user_router
+        
+        first = self.create_client(client, auth_headers, label="web-1")
+        self.create_client(client, auth_headers, label="db-1", host="10.0.0.2")
+        calls = []
+        
+        async def fake_exec_on_clients(command, clients, user_id, concurrency, timeout, max_output):
+            calls.append((command, [record.id for record in clients], timeout))
+            for record in clients:
+                yield record, "stdout", "up 3 days\n"
+                yield record, "exit", 0
+        
+        monkeypatch.setattr(user_router, "exec_on_clients", fake_exec_on_clients)
+        response = client.post(
+            "/clients/exec",
+            json={"command": "uptime", "client_ids": [first["id"]], "timeout": 10**6},
+            headers=auth_headers
+        )
+        
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert calls == [("uptime", [first["id"]], settings.SSH_EXEC_MAX_TIMEOUT)]
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert lines == [
+            {"client_id": first["id"], "label": "web-1", "stream": "stdout", "data": "up 3 days\n"},
+            {"client_id": first["id"], "label": "web-1", "exit_status": 0},
+        ]
+    
+    def test_exec_stream_does_not_hold_db_connection(self, client, db_session, auth_headers, monkeypatch):
+        """Test no DB connection stays checked out while command output streams"""
+        from app.routers import user_router
+        
+        engine = use_pooled_async_db(db_session)
+        first = self.create_client(client, auth_headers, label="web-1")
+        checked_out = []
+        
+        async def fake_exec_on_clients(command, clients, user_id, concurrency, timeout, max_output):
+            for record in clients:
+                checked_out.append(engine.pool.checkedout())
+                yield record, "exit", 0
+        
+        monkeypatch.setattr(user_router, "exec_on_clients", fake_exec_on_clients)
+        response = client.post("/clients/exec", json={"command": "uptime", "client_ids": [first["id"]]}, headers=auth_headers)
+        client.portal.call(engine.dispose)
+        
+        assert json.loads(response.text)["exit_status"] == 0
+        assert checked_out == [0]
+    
+    def test_exec_rejects_empty_command(self, client, auth_headers):
+        """Test a blank command is rejected before any host is contacted"""
+        response = client.post("/clients/exec", json={"command": "  "}, headers=auth_headers)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+def use_pooled_async_db(db_session, pool_size=2):
+    """Serve the app's async sessions from an instrumented pool and return its engine"""
+    engine = create_async_engine(
+        async_database_url(str(db_session.get_bind().url)),
+        poolclass=InstrumentedAsyncQueuePool, pool_size=pool_size, max_overflow=0, pool_timeout=1
+    )
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    
+    async def get_pooled_db():
+        async with session_factory() as session:
+            yield session
+    
+    app.dependency_overrides[get_async_db] = get_pooled_db
+    app.dependency_overrides[get_async_session_factory] = lambda: session_factory
+    return engine
+
+
+class FakeTerminal:
+    """Terminal session stand-in that prints a prompt and echoes input"""
+    
+    closed = False
+    
+    def attach(self):
+        self.output = asyncio.Queue()
+        return self.output, b"$ "
+    
+    async def write(self, data):
+        self.output.put_nowait(data)
+    
+    def is_attached(self, attachment):
+        return True
+    
+    def detach(self, attachment):
+        attachment.put_nowait(b"")
+    
+    async def end(self, attachment):
+        self.closed = True
+        attachment.put_nowait(b"")
+
+
+class FakeTerminalRegistry:
+    def __init__(self):
+        self.created = []
+    
+    def get(self, token, user_id, client_id):
+        return None
+    
+    async def create(self, token, user_id, client_details, cols=80, rows=24, record=False):
+        assert isinstance(client_details, user_schema.SSHClientRecord)
+        self.created.append(FakeTerminal())
+        return self.created[-1]
+
+
+class TestTerminalWebSocket:
+    """Test the terminal WebSocket's use of the database"""
+    
+    def test_open_terminals_do_not_hold_db_connections(self, client, db_session, auth_headers, monkeypatch):
+        """Test pool usage stays flat however many terminals are open"""
+        from app.routers import user_router
+        
+        # Two connections would be exhausted by the third terminal if each
+        # one kept its session for its lifetime
+        engine = use_pooled_async_db(db_session)
+        monkeypatch.setattr(user_router, "terminal_sessions", FakeTerminalRegistry())
+        
+        created = client.post("/clients", json={
+            "label": "web-1", "host": "10.0.0.1", "port": 22, "username": "root", "password": "secret"
+        }, headers=auth_headers).json()
+        token = auth_headers["Authorization"].split()[1]
+        
+        checked_out = []
+        with ExitStack() as stack:
+            for _ in range(6):
+                websocket = stack.enter_context(
+                    client.websocket_connect(f"/ws/{created['id']}?token={token}&encoding=binary")
+                )
+                assert websocket.receive_bytes() == b"$ "
+                checked_out.append(engine.pool.checkedout())
+            websocket.send_bytes(b"uptime\r")
+            assert websocket.receive_bytes() == b"uptime\r"
+        client.portal.call(engine.dispose)
+        
+        assert checked_out == [0] * 6
+    
+    def test_normal_close_ends_session(self, client, auth_headers, monkeypatch):
+        """Test closing a terminal on purpose ends its shell while a dropped socket keeps it"""
+        from app.routers import user_router
+        
+        registry = FakeTerminalRegistry()
+        monkeypatch.setattr(user_router, "terminal_sessions", registry)
+        created = client.post("/clients", json={
+            "label": "web-1", "host": "10.0.0.1", "port": 22, "username": "root", "password": "secret"
+        }, headers=auth_headers).json()
+        token = auth_headers["Authorization"].split()[1]
+        
+        for code in (1000, 1001):
+            with client.websocket_connect(f"/ws/{created['id']}?token={token}&encoding=binary") as websocket:
+                assert websocket.receive_bytes() == b"$ "
+                websocket.close(code=code)
+        
+        assert [terminal.closed for terminal in registry.created] == [True, False]
+    
+    def test_rejects_invalid_token(self, client):
+        """Test an unauthenticated socket is closed before any terminal opens"""
+        with client.websocket_connect("/ws/1?token=bogus") as websocket:
+            with pytest.raises(WebSocketDisconnect) as exc:
+                websocket.receive_bytes()
+        assert exc.value.code == 4003
+
+class TestRecordingsAPI:
+    """Test session recording endpoints"""
+    
+    def test_list_and_download_recording(self, client, db_session, auth_headers, tmp_path, monkeypatch):
+        """Test a user's recordings can be listed and replayed, but not other users'"""
+        from app.routers import user_router
+        
+        monkeypatch.setattr(user_router.session_recordings, "directory", str(tmp_path))
+        user_id = client.get("/auth/me", headers=auth_headers).json()["id"]
+        cast = b'{"version": 2, "width": 80, "height": 24}\n[0.5, "o", "$ "]\n'
+        with gzip.open(tmp_path / "session.cast.gz", "wb") as recording_file:
+            recording_file.write(cast)
+        recording = SessionRecording(user_id=user_id, client_id=7, title="web-1", path="session.cast.gz", cols=80, rows=24)
+        db_session.add(recording)
+        db_session.commit()
+        
+        listed = client.get("/recordings?client_id=7", headers=auth_headers).json()
+        assert [entry["id"] for entry in listed] == [recording.id]
+        assert client.get("/recordings?client_id=8", headers=auth_headers).json() == []
+        
+        replay = client.get(f"/recordings/{recording.id}", headers=auth_headers)
+        assert replay.headers["content-type"] == "application/x-asciicast"
+        assert replay.content == cast
+        raw = client.get(f"/recordings/{recording.id}?compressed=true", headers=auth_headers)
+        assert gzip.decompress(raw.content) == cast
+        
+        other_email = f"other-{uuid.uuid4().hex[:12]}@example.com"
+        client.post("/auth/register", json={"email": other_email, "password": "Test123!@#", "confirm_password": "Test123!@#"})
+        token = client.post("/auth/login", json={"email": other_email, "password": "Test123!@#"}).json()["access_token"]
+        other = client.get(f"/recordings/{recording.id}", headers={"Authorization": f"Bearer {token}"})
+        assert other.json() == {"error": "Recording not found"}
+    
+    def test_record_sessions_flag_can_be_cleared(self, client, auth_headers):
+        """Test a host's recording flag is stored and can be switched off again"""
+        data = {"label": "web-1", "host": "10.0.0.1", "port": 22, "username": "root", "record_sessions": True}
+        created = client.post("/clients", json=data, headers=auth_headers).json()
+        assert created["record_sessions"] is True
+        
+        kept = client.put(f"/clients/{created['id']}", json=dict(data, record_sessions=None), headers=auth_headers)
+        assert kept.json()["record_sessions"] is True
+        updated = client.put(f"/clients/{created['id']}", json=dict(data, record_sessions=False), headers=auth_headers)
+        assert updated.json()["record_sessions"] is False
+    
+    def test_detect_os_keeps_record_flag(self, client, auth_headers, monkeypatch):
+        """Test single-host OS detection only changes the detected OS"""
+        from app.routers import user_router
+        
+        async def acquire(user_id, client_details):
+            return types.SimpleNamespace(client=None)
+        
+        monkeypatch.setattr(user_router, "ssh_pool", types.SimpleNamespace(acquire=acquire, release=lambda conn: None))
+        monkeypatch.setattr(user_router, "detect_operating_system", lambda ssh_client: "ubuntu")
+        data = {"label": "web-1", "host": "10.0.0.1", "port": 22, "username": "root", "record_sessions": True}
+        created = client.post("/clients", json=data, headers=auth_headers).json()
+        
+        detected = client.post(f"/clients/{created['id']}/detect-os", headers=auth_headers).json()
+        assert detected["detected_os"] == "ubuntu"
+        stored = client.get(f"/clients/{created['id']}", headers=auth_headers).json()
+        assert (stored["detected_os"], stored["record_sessions"]) == ("ubuntu", True)
+
+class LocalSFTP:
+    """SFTP client stand-in serving a local directory"""
+    
+    def __init__(self, root):
+        self.root = root
+    
+    def local(self, path):
+        return os.path.join(self.root, path.lstrip("/"))
+    
+    def normalize(self, path):
+        return "/" + path.strip("./")
+    
+    def stat(self, path):
+        return paramiko.SFTPAttributes.from_stat(os.stat(self.local(path)))
+    
+    def listdir_attr(self, path):
+        return [
+            paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(self.local(path), name)), filename=name)
+            for name in os.listdir(self.local(path))
+        ]
+    
+    def open(self, path, mode):
+        return LocalSFTPFile(self.local(path), "xb" if "x" in mode else mode)
+    
+    def rename(self, old_path, new_path):
+        if os.path.exists(self.local(new_path)):
+            raise IOError(f"{new_path} exists")
+        os.rename(self.local(old_path), self.local(new_path))
+    
+    def posix_rename(self, old_path, new_path):
+        os.replace(self.local(old_path), self.local(new_path))
+
+
+class LocalSFTPFile:
+    def __init__(self, path, mode):
+        self.file = open(path, mode)
+    
+    def readv(self, ranges):
+        for offset, length in ranges:
+            self.file.seek(offset)
+            yield self.file.read(length)
+    
+    def set_pipelined(self, pipelined=True):
+        pass
+    
+    def seek(self, offset):
+        self.file.seek(offset)
+    
+    def write(self, data):
+        self.file.write(data)
+    
+    def close(self):
+        self.file.close()
+
+
+class TestSFTPAPI:
+    """Test SFTP browsing and file transfer endpoints"""
+    
+    def test_upload_list_and_download(self, client, auth_headers, tmp_path, monkeypatch):
+        """Test a file round-trips through upload and download unchanged"""
+        from app.routers import sftp_router
+        
+        @asynccontextmanager
+        async def local_sftp_session(pool, user_id, client_details):
+            yield LocalSFTP(str(tmp_path))
+        
+        monkeypatch.setattr(sftp_router, "sftp_session", local_sftp_session)
+        created = client.post("/clients", json={
+            "label": "web-1", "host": "10.0.0.1", "port": 22, "username": "root", "password": "secret"
+        }, headers=auth_headers).json()
+        base = f"/clients/{created['id']}/sftp"
+        data = os.urandom(300000)
+        
+        uploaded = client.put(f"{base}/file?path=/backup.tar", content=data, headers=auth_headers)
+        assert uploaded.json() == {"path": "/backup.tar", "size": len(data)}
+        assert (tmp_path / "backup.tar").read_bytes() == data
+        refused = client.put(f"{base}/file?path=/backup.tar", content=b"new", headers=auth_headers)
+        assert "error" in refused.json()
+        replaced = client.put(f"{base}/file?path=/backup.tar&overwrite=true", content=b"new", headers=auth_headers)
+        assert replaced.json()["size"] == 3
+        
+        (tmp_path / "logs").mkdir()
+        listing = client.get(f"{base}/list?path=/", headers=auth_headers).json()
+        assert [(entry["name"], entry["type"]) for entry in listing["entries"]] == [("backup.tar", "file"), ("logs", "directory")]
+        assert client.get(f"{base}/stat?path=/backup.tar", headers=auth_headers).json()["size"] == 3
+        assert "error" in client.get(f"{base}/stat?path=/missing", headers=auth_headers).json()
+        
+        (tmp_path / "big.bin").write_bytes(data)
+        download = client.get(f"{base}/file?path=/big.bin", headers=auth_headers)
+        assert download.headers["content-length"] == str(len(data))
+        assert download.content == data
+    
+    def test_unknown_client(self, client, auth_headers):
+        """Test SFTP requests for another user's or a missing client are refused"""
+        response = client.get("/clients/999999/sftp/list", headers=auth_headers)
+        assert response.json() == {"error": "Client not found"}
+
+
+class TestFileTransferAPI:
+    """Test resumable, checksum-verified transfers"""
+    
+    @pytest.fixture
+    def base(self, client, auth_headers, tmp_path, monkeypatch):
+        from app.routers import sftp_router
+        
+        @asynccontextmanager
+        async def local_sftp_session(pool, user_id, client_details):
+            yield LocalSFTP(str(tmp_path))
+        
+        @asynccontextmanager
+        async def borrow(user_id, client_details):
+            yield None
+        
+        def local_sha256(ssh_client, path, timeout):
+            return hashlib.sha256(open(os.path.join(str(tmp_path), path.lstrip("/")), "rb").read()).hexdigest()
+        
+        monkeypatch.setattr(sftp_router, "sftp_session", local_sftp_session)
+        monkeypatch.setattr(sftp_router, "remote_sha256", local_sha256)
+        monkeypatch.setattr(sftp_router.ssh_pool, "borrow", borrow)
+        created = client.post("/clients", json={
+            "label": "web-1", "host": "10.0.0.1", "port": 22, "username": "root", "password": "secret"
+        }, headers=auth_headers).json()
+        return f"/clients/{created['id']}/sftp/transfers"
+    
+    def test_upload_resumes_from_confirmed_offset(self, client, auth_headers, tmp_path, base):
+        """Test an interrupted upload continues where it stopped and is moved into place once verified"""
+        data = os.urandom(200000)
+        transfer = client.post(base, json={
+            "direction": "upload", "path": "/backup.tar", "size": len(data),
+            "sha256": hashlib.sha256(data).hexdigest()
+        }, headers=auth_headers).json()
+        assert transfer["status"] == "active" and transfer["confirmed_offset"] == 0
+        
+        first = client.put(f"{base}/{transfer['id']}/data?offset=0", content=data[:120000], headers=auth_headers)
+        assert first.json()["confirmed_offset"] == 120000
+        stale = client.put(f"{base}/{transfer['id']}/data?offset=0", content=data, headers=auth_headers)
+        assert stale.json()["confirmed_offset"] == 120000
+        assert "error" in stale.json()
+        
+        early = client.post(f"{base}/{transfer['id']}/verify", headers=auth_headers).json()
+        assert "error" in early
+        client.put(f"{base}/{transfer['id']}/data?offset=120000", content=data[120000:], headers=auth_headers)
+        
+        verified = client.post(f"{base}/{transfer['id']}/verify", headers=auth_headers).json()
+        assert verified["status"] == "completed"
+        assert verified["sha256"] == hashlib.sha256(data).hexdigest()
+        assert (tmp_path / "backup.tar").read_bytes() == data
+        assert not (tmp_path / f"backup.tar.part-{transfer['id']}").exists()
+    
+    def test_upload_refuses_to_overwrite(self, client, auth_headers, tmp_path, base):
+        """Test an existing file is only replaced by an upload created with overwrite"""
+        (tmp_path / "app.conf").write_bytes(b"old")
+        refused = client.post(base, json={"direction": "upload", "path": "/app.conf", "size": 3}, headers=auth_headers).json()
+        assert "already exists" in refused["error"]
+        
+        (tmp_path / "app.conf").unlink()
+        transfer = client.post(base, json={"direction": "upload", "path": "/app.conf", "size": 3}, headers=auth_headers).json()
+        client.put(f"{base}/{transfer['id']}/data?offset=0", content=b"new", headers=auth_headers)
+        (tmp_path / "app.conf").write_bytes(b"old")
+        late = client.post(f"{base}/{transfer['id']}/verify", headers=auth_headers).json()
+        assert "already exists" in late["error"]
+        assert (tmp_path / "app.conf").read_bytes() == b"old"
+        
+        replacing = client.post(base, json={
+            "direction": "upload", "path": "/app.conf", "size": 3, "overwrite": True
+        }, headers=auth_headers).json()
+        assert replacing["overwrite"] is True
+        client.put(f"{base}/{replacing['id']}/data?offset=0", content=b"new", headers=auth_headers)
+        assert client.post(f"{base}/{replacing['id']}/verify", headers=auth_headers).json()["status"] == "completed"
+        assert (tmp_path / "app.conf").read_bytes() == b"new"
+    
+    def test_upload_refused_while_in_progress(self, client, auth_headers, base, monkeypatch):
+        """Test a second request for a transfer with one in flight is refused before anything is written"""
+        from app.routers import sftp_router
+        
+        transfer = client.post(base, json={"direction": "upload", "path": "/backup.tar", "size": 3}, headers=auth_headers).json()
+        monkeypatch.setattr(sftp_router, "active_transfers", {transfer["id"]})
+        response = client.put(f"{base}/{transfer['id']}/data?offset=0", content=b"abc", headers=auth_headers).json()
+        assert response["error"] == "Transfer already in progress"
+        assert sftp_router.active_transfers == {transfer["id"]}
+        assert client.get(f"{base}/{transfer['id']}", headers=auth_headers).json()["confirmed_offset"] == 0
+    
+    def test_verify_hashes_off_interactive_executor(self, client, auth_headers, tmp_path, base, monkeypatch):
+        """Test the host-side hash runs on the command executor, not the shared SSH executor"""
+        from app.routers import sftp_router
+        
+        hashed_on = []
+        
+        class CommandExecutor:
+            async def run(self, func, *args):
+                hashed_on.append(func.__name__)
+                return func(*args)
+        
+        monkeypatch.setattr(sftp_router, "exec_executor", CommandExecutor())
+        (tmp_path / "big.bin").write_bytes(b"data")
+        transfer = client.post(base, json={"direction": "download", "path": "/big.bin"}, headers=auth_headers).json()
+        verified = client.post(f"{base}/{transfer['id']}/verify", headers=auth_headers).json()
+        assert verified["status"] == "completed"
+        assert hashed_on == ["local_sha256"]
+    
+    def test_upload_requires_size(self, client, auth_headers, base):
+        """Test an upload cannot start without its declared size"""
+        response = client.post(base, json={"direction": "upload", "path": "/backup.tar"}, headers=auth_headers)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    
+    def test_download_resumes_and_detects_changes(self, client, auth_headers, tmp_path, base):
+        """Test a download restarts at an offset and is refused once the remote file changes"""
+        data = os.urandom(100000)
+        (tmp_path / "big.bin").write_bytes(data)
+        transfer = client.post(base, json={"direction": "download", "path": "/big.bin"}, headers=auth_headers).json()
+        assert transfer["size"] == len(data)
+        
+        rest = client.get(f"{base}/{transfer['id']}/data?offset=40000", headers=auth_headers)
+        assert rest.headers["content-length"] == str(len(data) - 40000)
+        assert rest.content == data[40000:]
+        assert client.get(f"{base}/{transfer['id']}", headers=auth_headers).json()["confirmed_offset"] == 40000
+        
+        mismatch = client.post(f"{base}/{transfer['id']}/verify", json={"sha256": "0" * 64}, headers=auth_headers).json()
+        assert mismatch["status"] == "failed"
+        assert "mismatch" in mismatch["error"]
+        
+        changed = client.post(base, json={"direction": "download", "path": "/big.bin"}, headers=auth_headers).json()
+        (tmp_path / "big.bin").write_bytes(data + b"more")
+        assert "changed" in client.get(f"{base}/{changed['id']}/data", headers=auth_headers).json()["error"]
+
+class EchoForwardChannel:
+    """Forwarded channel stand-in whose target echoes its input"""
+    
+    def __init__(self):
+        self._rfd, self._wfd = os.pipe()
+        self._buffer = b""
+        self.closed = False
+        self.eof_received = False
+    
+    def fileno(self):
+        return self._rfd
+    
+    def recv_ready(self):
+        return bool(self._buffer)
+    
+    def recv(self, nbytes):
+        data, self._buffer = self._buffer[:nbytes], self._buffer[nbytes:]
+        if not self._buffer:
+            os.read(self._rfd, 4096)
+        return data
+    
+    def sendall(self, data):
+        self._buffer += data
+        os.write(self._wfd, b"x")
+    
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            os.close(self._rfd)
+            os.close(self._wfd)
+
+
+class EchoForwardPool:
+    """SSH pool stand-in that forwards every connection to an echo target"""
+    
+    def __init__(self):
+        self.executor = SSHExecutor(max_workers=2)
+        self.forwards = []
+    
+    async def acquire(self, user_id, client_details):
+        return client_details.id
+    
+    def release(self, conn):
+        pass
+    
+    async def open_forward(self, conn, host, port, timeout):
+        self.forwards.append((conn, host, port))
+        return EchoForwardChannel()
+
+
+class TestTunnelAPI:
+    """Test port forwarding over WebSocket tunnels"""
+    
+    def test_socks_tunnel_forwards_and_counts_bytes(self, client, auth_headers, monkeypatch):
+        """Test a SOCKS5 CONNECT is forwarded and its traffic shows up in the tunnel list"""
+        from app.routers import tunnel_router
+        
+        pool = EchoForwardPool()
+        monkeypatch.setattr(tunnel_router, "tunnels", TunnelRegistry(pool, max_per_user=4, open_timeout=5))
+        created = client.post("/clients", json={
+            "label": "web-1", "host": "10.0.0.1", "port": 22, "username": "root", "password": "secret"
+        }, headers=auth_headers).json()
+        token = auth_headers["Authorization"].split()[1]
+        
+        with client.websocket_connect(f"/ws/tunnel/{created['id']}?token={token}&mode=socks") as websocket:
+            websocket.send_bytes(b"\x05\x01\x00")
+            assert websocket.receive_bytes() == b"\x05\x00"
+            websocket.send_bytes(b"\x05\x01\x00\x03\x0bdb.internal" + (5432).to_bytes(2, "big"))
+            assert websocket.receive_bytes() == socks_reply(SOCKS_SUCCEEDED)
+            websocket.send_bytes(b"ping")
+            assert websocket.receive_bytes() == b"ping"
+            
+            listing = client.get("/tunnels", headers=auth_headers).json()
+        pool.executor.shutdown()
+        
+        assert pool.forwards == [(created["id"], "db.internal", 5432)]
+        assert [(tunnel["mode"], tunnel["host"], tunnel["bytes_sent"], tunnel["bytes_received"]) for tunnel in listing] == [
+            ("socks", "db.internal", 4, 4)
+        ]
+    
+    def test_direct_tunnel_requires_target(self, client, auth_headers):
+        """Test a local forward without a valid port is refused"""
+        token = auth_headers["Authorization"].split()[1]
+        with client.websocket_connect(f"/ws/tunnel/1?token={token}&host=db.internal") as websocket:
+            with pytest.raises(WebSocketDisconnect) as exc:
+                websocket.receive_bytes()
+        assert exc.value.code == 4002
+    
+    def test_close_reason_fits_frame(self):
+        """Test long non-ASCII close reasons are cut by bytes on a character boundary"""
+        from app.routers.tunnel_router import MAX_CLOSE_REASON, close_reason
+        
+        reason = close_reason("Hôte injoignable: " + "é" * 200)
+        assert len(reason.encode()) <= MAX_CLOSE_REASON
+        assert reason.startswith("Hôte injoignable: é")
+        assert close_reason("short") == "short"
+    
+    def test_rejects_invalid_token(self, client):
+        """Test an unauthenticated tunnel is closed before anything is forwarded"""
+        with client.websocket_connect("/ws/tunnel/1?token=bogus&mode=socks") as websocket:
+            with pytest.raises(WebSocketDisconnect) as exc:
+                websocket.receive_bytes()
+        assert exc.value.code == 4003
+
+
+class TestMetricsAPI:
+    """Test operational metrics endpoints"""
+    
+    def test_db_pool_metrics(self, client, auth_headers):
+        """Test pool occupancy and wait times are reported for both engines"""
+        response = client.get("/metrics/db-pool", headers=auth_headers)
+        
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        for engine_name in ("sync", "async"):
+            assert {"size", "checked_out", "overflow", "checkouts", "avg_wait_ms", "max_wait_ms"} <= set(data[engine_name])
+    
+    def test_db_pool_metrics_requires_auth(self, client):
+        """Test metrics are not exposed anonymously"""
+        response = client.get("/metrics/db-pool")
+        assert response.status_code in (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN)
+
+class TestMiddleware:
+    """Test the ASGI middleware stack"""
+    
+    def test_route_matcher(self):
+        """Test public prefixes match whole segments and "/" only matches the root"""
+        from app.core.auth_middleware import compile_route_matcher
+        
+        is_public = compile_route_matcher(["/auth", "/openapi.json", "/"])
+        assert is_public("/")
+        assert is_public("/auth")
+        assert is_public("/auth/login-page")
+        assert is_public("/openapi.json")
+        assert not is_public("/authors")
+        assert not is_public("/clients")
+        assert not compile_route_matcher([])("/")
+    
+    def test_referrer_policy_header(self, client):
+        """Test every HTTP response carries the referrer policy"""
+        response = client.get("/openapi.json")
+        assert response.headers["Referrer-Policy"] == "same-origin"
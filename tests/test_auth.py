@@ -1,5 +1,15 @@
+import asyncio
+import time
+import uuid
 import pytest
+from sqlalchemy import event
 from app.core.auth import AuthManager, MFAManager
+from app.core.config import settings
+from app.core.jwt_auth import (
+    PrincipalCache, create_access_token, principal_cache, resolve_principal, token_claims
+)
+from app.crud.auth import UserCRUD
+from app.schemas.user_schema import Principal, UserCreate
 
 class TestAuthManager:
     """Test AuthManager functionality"""
@@ -18,6 +28,28 @@ class TestAuthManager:
         # Should not verify incorrect password
         assert AuthManager.verify_password("wrong_password", hashed) is False
     
+    def test_work_factor_and_rehash(self, monkeypatch):
+        """Test hashes use the configured cost and stale costs need a rehash"""
+        monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+        hashed = AuthManager.hash_password("Test123!@#")
+        
+        assert hashed.startswith("$2b$04$")
+        assert AuthManager.needs_rehash(hashed) is False
+        
+        monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 5)
+        assert AuthManager.needs_rehash(hashed) is True
+        assert AuthManager.needs_rehash("not-a-bcrypt-hash") is True
+    
+    def test_password_task_runs_off_event_loop(self, monkeypatch):
+        """Test password work runs on the bcrypt pool while the loop keeps ticking"""
+        monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+        
+        async def scenario():
+            hashed = await AuthManager.run_password_task(AuthManager.hash_password, "Test123!@#")
+            return await AuthManager.run_password_task(AuthManager.verify_password, "Test123!@#", hashed)
+        
+        assert asyncio.run(scenario()) is True
+    
     def test_mfa_secret_generation(self):
         """Test MFA secret generation"""
         secret = AuthManager.generate_mfa_secret()
@@ -96,4 +128,57 @@ class TestMFAManager:
         # This test would require a time-based code
         # In a real test, you'd mock the time or use a known timestamp
         # For now, we'll test the structure
-        assert MFAManager.verify_setup(secret, "123456") in [True, False]
\ No newline at end of file
+        assert MFAManager.verify_setup(secret, "123456") in [True, False]
+
+
+class TestPrincipalCache:
+    """Test token claims and the cached principal lookup"""
+    
+    def create_user(self, db_session):
+        return UserCRUD.create_user(db_session, UserCreate(
+            email=f"principal-{uuid.uuid4().hex[:8]}@example.com",
+            password="Test123!@#",
+            confirm_password="Test123!@#"
+        ))
+    
+    def test_cache_expires_entries(self, monkeypatch):
+        """Test entries are served until their TTL runs out"""
+        cache = PrincipalCache(ttl=30)
+        principal = Principal(id=1, email="a@example.com", is_active=True)
+        cache.put(principal)
+        assert cache.get(1) is principal
+        
+        monkeypatch.setattr(time, "monotonic", lambda: float("inf"))
+        assert cache.get(1) is None
+    
+    def test_cached_lookup_skips_database(self, db_session):
+        """Test a second request with the same token does not query the user"""
+        user = self.create_user(db_session)
+        token = create_access_token(data=token_claims(user))
+        principal_cache.invalidate(user.id)
+        
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+        try:
+            first = resolve_principal(token, db_session)
+            second = resolve_principal(token, db_session)
+        finally:
+            event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+        
+        assert first == second
+        assert first.id == user.id and first.is_active
+        assert len(statements) == 1
+    
+    def test_email_change_invalidates_old_tokens(self, db_session):
+        """Test tokens for the previous email stop resolving after a change"""
+        user = self.create_user(db_session)
+        token = create_access_token(data=token_claims(user))
+        assert resolve_principal(token, db_session) is not None
+        
+        UserCRUD.change_email(db_session, user, "Test123!@#", f"moved-{uuid.uuid4().hex[:8]}@example.com")
+        assert resolve_principal(token, db_session) is None
+        assert resolve_principal(create_access_token(data=token_claims(user)), db_session) is not None
+        
+        UserCRUD.delete_user(db_session, user)
+        assert resolve_principal(create_access_token(data=token_claims(user)), db_session) is None
@@ -1,8 +1,15 @@
+import asyncio
+import uuid
 import pytest
 from fastapi import status
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+from app.core.config import settings
+from app.crud import user as client_crud
+from app.db.session import async_database_url
 from app.models.user_model import User
-from app.crud.auth import UserCRUD
-from app.schemas.user_schema import UserCreate, UserUpdate
+from app.crud.auth import AsyncUserCRUD, UserCRUD
+from app.schemas.user_schema import SSHClient, UserCreate, UserUpdate
 
 class TestUserCRUD:
     """Test UserCRUD operations"""
@@ -107,6 +114,22 @@ class TestUserCRUD:
         
         assert authenticated_user is None
     
+    def test_authenticate_user_rehashes_on_cost_change(self, db_session, monkeypatch):
+        """Test a login upgrades a hash made with an outdated work factor"""
+        email = f"rehash-{uuid.uuid4().hex[:8]}@example.com"
+        monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+        UserCRUD.create_user(db_session, UserCreate(
+            email=email,
+            password="Test123!@#",
+            confirm_password="Test123!@#"
+        ))
+        
+        monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 5)
+        user = UserCRUD.authenticate_user(db_session, email, "Test123!@#")
+        
+        assert user.hashed_password.startswith("$2b$05$")
+        assert UserCRUD.authenticate_user(db_session, email, "Test123!@#") is not None
+    
     def test_update_user_email(self, db_session):
         """Test updating user email"""
         user_data = UserCreate(
@@ -203,4 +226,73 @@ class TestUserCRUD:
         auth_user = UserCRUD.authenticate_user(
             db_session, "test@example.com", "Test123!@#"
         )
-        assert auth_user is None
\ No newline at end of file
+        assert auth_user is None
+
+class TestAsyncCRUD:
+    """Test the async CRUD variants against the test database"""
+    
+    def run_with_session(self, db_session, scenario):
+        async def runner():
+            engine = create_async_engine(
+                async_database_url(str(db_session.get_bind().url)), poolclass=NullPool
+            )
+            try:
+                async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+                    return await scenario(session)
+            finally:
+                await engine.dispose()
+        return asyncio.run(runner())
+    
+    def test_async_database_url(self):
+        """Test sync URLs map to their async drivers"""
+        assert async_database_url("sqlite:///./ssh_client.db") == "sqlite+aiosqlite:///./ssh_client.db"
+        assert async_database_url("postgresql://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+        assert async_database_url("postgresql+psycopg2://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+        with pytest.raises(ValueError):
+            async_database_url("mysql://u:p@db/app")
+    
+    def test_client_crud_round_trip(self, db_session):
+        """Test creating, listing, updating and deleting clients asynchronously"""
+        owner = UserCRUD.create_user(db_session, UserCreate(
+            email=f"async-{uuid.uuid4().hex[:8]}@example.com",
+            password="Test123!@#",
+            confirm_password="Test123!@#"
+        ))
+        
+        async def scenario(session):
+            created = await client_crud.create_client_async(session, SSHClient(
+                label="web", host="10.0.0.1", port=22, username="root", password="secret"
+            ), owner.id)
+            client_id = created.id
+            await client_crud.update_client_async(session, client_id, SSHClient(
+                label="web-1", host="10.0.0.1", port=22, username="root"
+            ), owner.id)
+            await client_crud.set_detected_os_async(session, owner.id, {client_id: "Ubuntu 24.04"})
+            session.expire_all()
+            listed = await client_crud.get_clients_by_ids_async(session, owner.id, [client_id])
+            snapshot = (listed[0].label, listed[0].password, listed[0].detected_os)
+            deleted = await client_crud.delete_client_async(session, client_id, owner.id)
+            remaining, _ = await client_crud.get_client_page_async(session, owner.id)
+            return snapshot, deleted, remaining
+        
+        snapshot, deleted, remaining = self.run_with_session(db_session, scenario)
+        assert snapshot == ("web-1", "secret", "Ubuntu 24.04")
+        assert deleted is not None
+        assert remaining == []
+    
+    def test_terminal_settings(self, db_session):
+        """Test terminal settings round trip through the async user CRUD"""
+        owner = UserCRUD.create_user(db_session, UserCreate(
+            email=f"async-{uuid.uuid4().hex[:8]}@example.com",
+            password="Test123!@#",
+            confirm_password="Test123!@#"
+        ))
+        
+        async def scenario(session):
+            defaults = await AsyncUserCRUD.get_terminal_settings(session, owner.id)
+            await AsyncUserCRUD.save_terminal_settings(session, owner.id, {"theme": "solarized"})
+            return defaults, await AsyncUserCRUD.get_terminal_settings(session, owner.id)
+        
+        defaults, saved = self.run_with_session(db_session, scenario)
+        assert defaults["theme"] == "hacker-blue"
+        assert saved == {"theme": "solarized"}
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from app.db.pool import InstrumentedQueuePool, pool_status
+
+class TestInstrumentedPool:
+    """Test connection pool checkout metrics"""
+    
+    @pytest.fixture
+    def engine(self):
+        db_fd, db_path = tempfile.mkstemp()
+        os.close(db_fd)
+        engine = create_engine(
+            f"sqlite:///{db_path}",
+            poolclass=InstrumentedQueuePool,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=0.05,
+            connect_args={"check_same_thread": False}
+        )
+        yield engine
+        engine.dispose()
+        os.unlink(db_path)
+    
+    def test_checkouts_are_counted(self, engine):
+        """Test occupancy and checkout counts are reported"""
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            status = pool_status(engine.pool)
+            assert status["checked_out"] == 1
+            assert status["checkouts"] == 1
+        
+        assert pool_status(engine.pool)["checked_out"] == 0
+    
+    def test_queued_checkout_timeout_is_recorded(self, engine):
+        """Test a request waiting on an exhausted pool shows up as a timeout"""
+        with engine.connect():
+            with pytest.raises(PoolTimeoutError):
+                engine.connect()
+        
+        status = pool_status(engine.pool)
+        assert status["timeouts"] == 1
+        assert status["max_wait_ms"] >= 50
+    
+    def test_metrics_survive_dispose(self, engine):
+        """Test disposing the engine keeps the collected metrics"""
+        with engine.connect():
+            pass
+        engine.dispose()
+        
+        assert pool_status(engine.pool)["checkouts"] == 1
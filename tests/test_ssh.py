@@ -0,0 +1,1199 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import types
+import zlib
+from io import StringIO
+import pytest
+import paramiko
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519
+from app.core.config import settings
+from app.core.ssh_bridge import ChannelReader, OutputEncoder, coalesce_output, parse_control_message
+from app.core import ssh_executor as ssh_executor_module
+from app.core.host_inventory import parse_inventory
+from app.core.known_hosts import KnownHostStore, host_key_name
+from app.core.file_transfer import TransferError, upload_segments
+from app.core.port_forwarding import (
+    SOCKS_COMMAND_NOT_SUPPORTED, SOCKS_CONNECTION_REFUSED, FrameReader, TunnelError, TunnelRegistry,
+    socks_handshake, socks_reply
+)
+from app.core.session_recording import RecordingWriter, read_recording
+from app.core.sftp import iter_remote_file, write_remote_file
+from app.core.ssh_executor import SSHExecutor, open_ssh_client
+from app.core.ssh_bulk import exec_on_clients, map_clients
+from app.core.ssh_keys import PrivateKeyCache, parse_private_key
+from app.core.ssh_pool import SSHConnectionManager, SSHPoolExhausted
+from app.core.terminal_sessions import RingBuffer, TerminalSessionRegistry
+from app.models.user_model import SessionRecording
+from app.routers.user_router import parse_os_probe
+
+
+class FakeChannel:
+    """Minimal stand-in for a paramiko channel backed by an OS pipe"""
+
+    def __init__(self):
+        self._rfd, self._wfd = os.pipe()
+        self._buffer = b""
+        self.closed = False
+        self.eof_received = False
+        self.recv_ready_calls = 0
+        self.sent = b""
+        self.sizes = []
+
+    def feed(self, data: bytes):
+        self._buffer += data
+        os.write(self._wfd, b"x")
+
+    def send_eof(self):
+        self.eof_received = True
+        os.write(self._wfd, b"x")
+
+    def fileno(self):
+        return self._rfd
+
+    def recv_ready(self):
+        self.recv_ready_calls += 1
+        return bool(self._buffer)
+
+    def recv(self, nbytes):
+        data, self._buffer = self._buffer[:nbytes], self._buffer[nbytes:]
+        if not self._buffer and not self.eof_received:
+            os.read(self._rfd, 4096)
+        return data
+
+    def resize_pty(self, width=80, height=24):
+        self.sizes.append((width, height))
+
+    def sendall(self, data):
+        self.sent += data.encode() if isinstance(data, str) else data
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        os.close(self._rfd)
+        os.close(self._wfd)
+
+
+class TestChannelReader:
+    """Test the readiness-driven channel reader"""
+
+    def test_forwards_output_until_eof(self):
+        """Test output is delivered in order and iteration stops at EOF"""
+        async def scenario():
+            channel = FakeChannel()
+            reader = ChannelReader(channel).start()
+            channel.feed(b"hello ")
+            channel.feed(b"world")
+            channel.send_eof()
+
+            received = [chunk async for chunk in reader]
+            reader.close()
+            channel.close()
+            return b"".join(received)
+
+        assert asyncio.run(scenario()) == b"hello world"
+
+    def test_idle_channel_is_not_polled(self):
+        """Test an idle channel causes no reads while waiting for output"""
+        async def scenario():
+            channel = FakeChannel()
+            reader = ChannelReader(channel).start()
+
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(reader.read(), timeout=0.1)
+            idle_calls = channel.recv_ready_calls
+
+            channel.feed(b"ls\r\n")
+            data = await asyncio.wait_for(reader.read(), timeout=1)
+            reader.close()
+            channel.close()
+            return idle_calls, data
+
+        idle_calls, data = asyncio.run(scenario())
+        assert idle_calls == 0
+        assert data == b"ls\r\n"
+
+
+class TestSSHExecutor:
+    """Test the blocking SSH executor"""
+
+    def test_blocking_call_does_not_stall_loop(self):
+        """Test the event loop keeps running while a call blocks on the pool"""
+        async def scenario():
+            executor = SSHExecutor(max_workers=2)
+            release = threading.Event()
+            blocked = asyncio.ensure_future(executor.run(release.wait, 5))
+
+            ticks = 0
+            for _ in range(5):
+                await asyncio.sleep(0.01)
+                ticks += 1
+            release.set()
+            await blocked
+            executor.shutdown()
+            return ticks
+
+        assert asyncio.run(scenario()) == 5
+
+    def test_connect_uses_configured_timeouts(self, monkeypatch):
+        """Test connect, banner and auth timeouts come from settings"""
+        captured = {}
+
+        def fake_connect(self, hostname, port, username, password=None, **kwargs):
+            captured.update(kwargs, hostname=hostname, password=password)
+
+        monkeypatch.setattr(paramiko.SSHClient, "connect", fake_connect)
+        monkeypatch.setattr(ssh_executor_module, "known_hosts", KnownHostStore(None))
+        monkeypatch.setattr(KnownHostStore, "lookup", lambda self, *args: None)
+        details = types.SimpleNamespace(
+            id=1, user_id=1, host="10.0.0.1", port=22, username="root", password="secret", private_key=None
+        )
+        open_ssh_client(details)
+
+        assert captured["hostname"] == "10.0.0.1"
+        assert captured["password"] == "secret"
+        assert captured["timeout"] == settings.SSH_CONNECT_TIMEOUT
+        assert captured["banner_timeout"] == settings.SSH_BANNER_TIMEOUT
+        assert captured["auth_timeout"] == settings.SSH_AUTH_TIMEOUT
+
+
+class TestOutputCoalescing:
+    """Test adaptive reads and output coalescing"""
+
+    def test_bulk_output_is_coalesced(self):
+        """Test many small chunks of bulk output become few frames"""
+        async def scenario():
+            channel = FakeChannel()
+            reader = ChannelReader(channel, chunk_size=16, max_chunk_size=256).start()
+            for _ in range(100):
+                channel.feed(b"x" * 64)
+            channel.send_eof()
+
+            frames = [frame async for frame in coalesce_output(reader, 1024, 0.005)]
+            reader.close()
+            channel.close()
+            return frames, reader.chunk_size
+
+        frames, chunk_size = asyncio.run(scenario())
+        assert b"".join(frames) == b"x" * 6400
+        assert len(frames) <= 7
+        assert all(len(frame) <= 1024 + 256 for frame in frames)
+        assert chunk_size > 16
+
+    def test_interactive_echo_is_not_delayed(self):
+        """Test small output is flushed without waiting for the window"""
+        async def scenario():
+            channel = FakeChannel()
+            reader = ChannelReader(channel, chunk_size=4096).start()
+            frames = coalesce_output(reader, 65536, 10)
+            channel.feed(b"a")
+            frame = await asyncio.wait_for(frames.__anext__(), timeout=1)
+            await frames.aclose()
+            reader.close()
+            channel.close()
+            return frame
+
+        assert asyncio.run(scenario()) == b"a"
+
+
+class FakeWebSocket:
+    """Collects frames sent by the bridge"""
+
+    def __init__(self):
+        self.frames = []
+
+    async def send_text(self, data):
+        self.frames.append(data)
+
+    async def send_bytes(self, data):
+        self.frames.append(data)
+
+
+class TestOutputEncoder:
+    """Test WebSocket output encoding"""
+
+    def test_text_mode_carries_split_multibyte_characters(self):
+        """Test a character split across reads is decoded intact"""
+        async def scenario():
+            websocket = FakeWebSocket()
+            encoder = OutputEncoder("text")
+            data = "héllo → wörld".encode()
+            split = data.index("→".encode()) + 1
+            await encoder.send(websocket, data[:split])
+            await encoder.send(websocket, data[split:])
+            await encoder.flush(websocket)
+            return websocket.frames
+
+        frames = asyncio.run(scenario())
+        assert "".join(frames) == "héllo → wörld"
+        assert all(isinstance(frame, str) for frame in frames)
+
+    def test_binary_mode_sends_raw_bytes(self):
+        """Test binary mode forwards output without decoding"""
+        async def scenario():
+            websocket = FakeWebSocket()
+            encoder = OutputEncoder("binary")
+            await encoder.send(websocket, b"\xe2\x86")
+            await encoder.send(websocket, b"\x92")
+            await encoder.flush(websocket)
+            return websocket.frames
+
+        assert asyncio.run(scenario()) == [b"\xe2\x86", b"\x92"]
+
+    def test_rejects_unknown_encoding(self):
+        """Test an unsupported encoding is refused"""
+        with pytest.raises(ValueError):
+            OutputEncoder("latin-1")
+
+
+class FakeExecChannel(FakeChannel):
+    """Session channel whose command prints to stdout and stderr, then exits 3"""
+
+    def __init__(self):
+        super().__init__()
+        self._stderr = b""
+        self.exit_status = None
+
+    def exec_command(self, command):
+        if command == "hang":
+            return
+        self._stderr += b"warn\n"
+        self.exit_status = 3
+        self.feed(f"ran {command}\n".encode())
+
+    def recv_stderr_ready(self):
+        return bool(self._stderr)
+
+    def recv_stderr(self, nbytes):
+        data, self._stderr = self._stderr[:nbytes], self._stderr[nbytes:]
+        return data
+
+    def exit_status_ready(self):
+        return self.exit_status is not None
+
+    def recv_exit_status(self):
+        return self.exit_status
+
+
+class EchoChannel(FakeChannel):
+    """Forwarded channel whose target echoes everything back"""
+
+    def sendall(self, data):
+        super().sendall(data)
+        self.feed(data)
+
+
+class StalledChannel(FakeChannel):
+    """Forwarded channel whose target never reads, so sendall blocks until closed"""
+
+    def __init__(self):
+        super().__init__()
+        self.released = threading.Event()
+
+    def sendall(self, data):
+        self.released.wait()
+
+    def close(self):
+        self.released.set()
+        super().close()
+
+
+class FakeTransport:
+    def __init__(self):
+        self.active = True
+        self.forwards = []
+
+    def is_active(self):
+        return self.active
+
+    def open_session(self, timeout=None):
+        return FakeExecChannel()
+
+    def open_channel(self, kind, dest_addr=None, src_addr=None, timeout=None):
+        if dest_addr[1] == 1:
+            raise paramiko.ChannelException(paramiko.common.OPEN_FAILED_CONNECT_FAILED, "Connect failed")
+        self.forwards.append((kind, dest_addr))
+        # Port 9 (discard) stands for a target that stops reading
+        return StalledChannel() if dest_addr[1] == 9 else EchoChannel()
+
+
+class FakeSSHClient:
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.closed = threading.Event()
+
+    def get_transport(self):
+        return self.transport
+
+    def invoke_shell(self, width=80, height=24, **kwargs):
+        channel = FakeChannel()
+        channel.sizes.append((width, height))
+        return channel
+
+    def close(self):
+        self.transport.active = False
+        self.closed.set()
+
+
+class FakeExecutor(SSHExecutor):
+    """Executor whose connect hands out fake clients and counts handshakes"""
+
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.connects = 0
+
+    async def connect(self, client_details):
+        self.connects += 1
+        return FakeSSHClient()
+
+
+def make_client_details(client_id):
+    return types.SimpleNamespace(id=client_id, user_id=1, label=f"host-{client_id}", host="10.0.0.1", port=22, username="root")
+
+
+class TestSSHConnectionManager:
+    """Test the pooled SSH connection manager"""
+
+    def test_channels_share_one_connection(self):
+        """Test several tabs to one host reuse a single handshake"""
+        async def scenario():
+            executor = FakeExecutor()
+            pool = SSHConnectionManager(executor, max_connections=10, idle_timeout=60)
+            details = make_client_details(1)
+            first = await pool.acquire(1, details)
+            second = await pool.acquire(1, details)
+            await pool.open_shell(first)
+            await pool.open_shell(second)
+            other_user = await pool.acquire(2, details)
+            return executor.connects, first is second, other_user is first, first.refs
+
+        connects, shared, shared_across_users, refs = asyncio.run(scenario())
+        assert connects == 2
+        assert shared is True
+        assert shared_across_users is False
+        assert refs == 2
+
+    def test_idle_connection_is_evicted(self):
+        """Test a released connection closes after the idle timeout"""
+        async def scenario():
+            pool = SSHConnectionManager(FakeExecutor(), max_connections=10, idle_timeout=0.05)
+            conn = await pool.acquire(1, make_client_details(1))
+            pool.release(conn)
+            await asyncio.sleep(0.1)
+            return len(pool), conn.client.closed.wait(1)
+
+        size, closed = asyncio.run(scenario())
+        assert size == 0
+        assert closed is True
+
+    def test_connection_cap(self):
+        """Test the cap evicts idle connections and refuses when all are busy"""
+        async def scenario():
+            executor = FakeExecutor()
+            pool = SSHConnectionManager(executor, max_connections=1, idle_timeout=60)
+            first = await pool.acquire(1, make_client_details(1))
+            pool.release(first)
+            second = await pool.acquire(1, make_client_details(2))
+            with pytest.raises(SSHPoolExhausted):
+                await pool.acquire(1, make_client_details(3))
+            return first.client.closed.wait(1), len(pool), second.refs
+
+        evicted, size, refs = asyncio.run(scenario())
+        assert evicted is True
+        assert size == 1
+        assert refs == 1
+
+    def test_invalidate_stops_reuse(self):
+        """Test an invalidated connection is not handed out again"""
+        async def scenario():
+            executor = FakeExecutor()
+            pool = SSHConnectionManager(executor, max_connections=10, idle_timeout=60)
+            details = make_client_details(1)
+            first = await pool.acquire(1, details)
+            pool.invalidate(1, 1)
+            second = await pool.acquire(1, details)
+            pool.release(first)
+            return executor.connects, first is second, first.client.closed.wait(1)
+
+        connects, shared, closed = asyncio.run(scenario())
+        assert connects == 2
+        assert shared is False
+        assert closed is True
+
+
+class TestRingBuffer:
+    """Test the scrollback ring buffer"""
+
+    def test_keeps_most_recent_bytes(self):
+        """Test old output is dropped once capacity is exceeded"""
+        buffer = RingBuffer(10)
+        buffer.append(b"abcdef")
+        buffer.append(b"ghijkl")
+        assert buffer.getvalue() == b"cdefghijkl"
+        assert len(buffer) == 10
+
+        buffer.append(b"0123456789XYZ")
+        assert buffer.getvalue() == b"3456789XYZ"
+
+
+class TestTerminalSessions:
+    """Test detaching and reattaching terminal sessions"""
+
+    SESSION = "a" * 32
+
+    def test_reattach_replays_scrollback(self):
+        """Test output produced while detached is replayed on reattach"""
+        async def scenario():
+            executor = FakeExecutor()
+            pool = SSHConnectionManager(executor, max_connections=10, idle_timeout=60)
+            registry = TerminalSessionRegistry(pool, grace_period=60, scrollback_bytes=1024)
+            session = await registry.create(self.SESSION, 1, make_client_details(1))
+
+            attachment, replay = session.attach()
+            session.channel.feed(b"$ ")
+            first = await asyncio.wait_for(attachment.get(), timeout=1)
+            await session.write("uptime\r")
+            session.detach(attachment)
+
+            session.channel.feed(b"up 3 days\r\n$ ")
+            await asyncio.sleep(0.05)
+            resumed = registry.get(self.SESSION, 1, 1)
+            other_user = registry.get(self.SESSION, 2, 1)
+            _, scrollback = resumed.attach()
+            await session.close()
+            return replay, first, session.channel.sent, resumed is session, other_user, scrollback, executor.connects
+
+        replay, first, sent, resumed, other_user, scrollback, connects = asyncio.run(scenario())
+        assert replay == b""
+        assert first == b"$ "
+        assert sent == b"uptime\r"
+        assert resumed is True
+        assert other_user is None
+        assert scrollback == b"$ up 3 days\r\n$ "
+        assert connects == 1
+
+    def test_takeover_ends_previous_attachment(self):
+        """Test a new connection signals EOF to the one it replaces, which can no longer end the session"""
+        async def scenario():
+            pool = SSHConnectionManager(FakeExecutor(), max_connections=10, idle_timeout=60)
+            registry = TerminalSessionRegistry(pool, grace_period=60, scrollback_bytes=1024)
+            session = await registry.create(self.SESSION, 1, make_client_details(1))
+            old, _ = session.attach()
+            new, _ = session.attach()
+            eof = await asyncio.wait_for(old.get(), timeout=1)
+            attached = (session.is_attached(old), session.is_attached(new))
+            await session.end(old)
+            still_open = not session.closed
+            await session.end(new)
+            return eof, attached, still_open, session.closed, len(registry), session.conn.refs
+
+        eof, attached, still_open, closed, size, refs = asyncio.run(scenario())
+        assert eof == b""
+        assert attached == (False, True)
+        assert still_open is True
+        assert closed is True
+        assert size == 0 and refs == 0
+
+    def test_detached_session_expires(self):
+        """Test a detached session closes after the grace period"""
+        async def scenario():
+            pool = SSHConnectionManager(FakeExecutor(), max_connections=10, idle_timeout=60)
+            registry = TerminalSessionRegistry(pool, grace_period=0.05, scrollback_bytes=1024)
+            session = await registry.create(self.SESSION, 1, make_client_details(1))
+            attachment, _ = session.attach()
+            session.detach(attachment)
+            await asyncio.sleep(0.2)
+            return session.closed, len(registry), session.conn.refs
+
+        closed, size, refs = asyncio.run(scenario())
+        assert closed is True
+        assert size == 0
+        assert refs == 0
+
+    def test_shell_exit_ends_attachment(self):
+        """Test the attached consumer sees EOF when the shell exits"""
+        async def scenario():
+            pool = SSHConnectionManager(FakeExecutor(), max_connections=10, idle_timeout=60)
+            registry = TerminalSessionRegistry(pool, grace_period=60, scrollback_bytes=1024)
+            session = await registry.create(None, 1, make_client_details(1))
+            attachment, _ = session.attach()
+            session.channel.feed(b"logout\r\n")
+            session.channel.send_eof()
+            frames = []
+            while True:
+                frame = await asyncio.wait_for(attachment.get(), timeout=1)
+                if not frame:
+                    break
+                frames.append(frame)
+            await asyncio.sleep(0.05)
+            return frames, session.closed
+
+        frames, closed = asyncio.run(scenario())
+        assert frames == [b"logout\r\n"]
+        assert closed is True
+
+    def test_broadcast_group_fans_out_input(self):
+        """Test input typed into one member reaches every shell of the group"""
+        async def scenario():
+            pool = SSHConnectionManager(FakeExecutor(), max_connections=10, idle_timeout=60)
+            registry = TerminalSessionRegistry(pool, grace_period=60, scrollback_bytes=1024)
+            web = await registry.create("w" * 32, 1, make_client_details(1))
+            db = await registry.create("d" * 32, 1, make_client_details(2))
+            foreign = await registry.create("f" * 32, 2, make_client_details(3))
+
+            group = registry.broadcast(web, ["d" * 32, "f" * 32, "missing" * 4])
+            tokens = group.tokens()
+            await db.write("uptime\r")
+            await db.close()
+            await web.write("id\r")
+            registry.broadcast(web, [])
+            await web.write("ls\r")
+            left = web.group
+            for session in (web, foreign):
+                await session.close()
+            return tokens, web.channel.sent, db.channel.sent, foreign.channel.sent, left
+
+        tokens, web_sent, db_sent, foreign_sent, left = asyncio.run(scenario())
+        assert tokens == ["d" * 32, "w" * 32]
+        assert web_sent == b"uptime\rid\rls\r"
+        assert db_sent == b"uptime\r"
+        assert foreign_sent == b""
+        assert left is None
+
+
+class TestControlMessages:
+    """Test the WebSocket control protocol"""
+
+    def test_parses_supported_messages(self):
+        """Test data, resize, ping and broadcast messages are accepted"""
+        assert parse_control_message('{"type": "data", "data": "ls\\r"}')["data"] == "ls\r"
+        resize = parse_control_message('{"type": "resize", "cols": 120, "rows": 40}')
+        assert (resize["cols"], resize["rows"]) == (120, 40)
+        assert parse_control_message('{"type": "ping"}')["type"] == "ping"
+        assert parse_control_message('{"type": "broadcast", "sessions": []}')["sessions"] == []
+
+    @pytest.mark.parametrize("text", [
+        "not json",
+        '["resize"]',
+        '{"type": "exec"}',
+        '{"type": "data"}',
+        '{"type": "resize", "cols": 0, "rows": 40}',
+        '{"type": "resize", "cols": 120, "rows": "40"}',
+        '{"type": "resize", "cols": 100000, "rows": 40}',
+        '{"type": "broadcast", "sessions": "all"}',
+        '{"type": "broadcast", "sessions": [1, 2]}',
+    ])
+    def test_rejects_invalid_messages(self, text):
+        """Test malformed or out-of-range messages are rejected"""
+        with pytest.raises(ValueError):
+            parse_control_message(text)
+
+    def test_resize_reaches_pty(self):
+        """Test a resize is applied to the session's channel"""
+        async def scenario():
+            pool = SSHConnectionManager(FakeExecutor(), max_connections=10, idle_timeout=60)
+            registry = TerminalSessionRegistry(pool, grace_period=60, scrollback_bytes=1024)
+            session = await registry.create(None, 1, make_client_details(1), cols=132, rows=43)
+            await session.resize(200, 50)
+            await session.close()
+            return session.channel.sizes
+
+        assert asyncio.run(scenario()) == [(132, 43), (200, 50)]
+
+
+class TestSessionRecording:
+    """Test asciicast recording of terminal sessions"""
+
+    def record(self, tmp_path, test_db, output_chunks):
+        writer = RecordingWriter(str(tmp_path), flush_bytes=8, flush_interval=0.01, session_factory=test_db)
+
+        async def scenario():
+            pool = SSHConnectionManager(FakeExecutor(), max_connections=10, idle_timeout=60)
+            registry = TerminalSessionRegistry(pool, grace_period=60, scrollback_bytes=1024, recordings=writer)
+            session = await registry.create(None, 1, make_client_details(1), cols=100, rows=30, record=True)
+            attachment, _ = session.attach()
+            for chunk in output_chunks:
+                session.channel.feed(chunk)
+                await asyncio.wait_for(attachment.get(), timeout=1)
+            await session.resize(120, 40)
+            await session.close()
+            return session.recorder.recording_id
+
+        recording_id = asyncio.run(scenario())
+        writer.shutdown()
+        db = test_db()
+        try:
+            recording = db.query(SessionRecording).filter(SessionRecording.id == recording_id).one()
+            path = writer.path_for(recording.path)
+            return recording, [json.loads(line) for line in b"".join(read_recording(path)).splitlines()]
+        finally:
+            db.close()
+
+    def test_records_asciicast(self, tmp_path, test_db):
+        """Test output is stored as asciicast v2 with split characters rejoined"""
+        recording, lines = self.record(tmp_path, test_db, [b"$ ls\r\n", b"caf\xc3", b"\xa9\r\n"])
+
+        header, events = lines[0], lines[1:]
+        assert header["version"] == 2
+        assert (header["width"], header["height"]) == (100, 30)
+        assert header["title"] == "host-1 (root@10.0.0.1)"
+        assert [event[1:] for event in events] == [["o", "$ ls\r\n"], ["o", "caf"], ["o", "\u00e9\r\n"], ["r", "120x40"]]
+        assert [event[0] for event in events] == sorted(event[0] for event in events)
+        assert recording.ended_at is not None
+        assert recording.size_bytes == os.path.getsize(tmp_path / recording.path)
+
+    def test_reads_recording_in_progress(self, tmp_path):
+        """Test a recording without its gzip trailer yields what was flushed"""
+        path = tmp_path / "live.cast.gz"
+        with open(path, "wb") as raw:
+            compressor = zlib.compressobj(wbits=31)
+            raw.write(compressor.compress(b'{"version": 2}\n') + compressor.flush(zlib.Z_SYNC_FLUSH))
+
+        assert b"".join(read_recording(str(path))) == b'{"version": 2}\n'
+
+
+class FakeRemoteFile:
+    """In-memory stand-in for a paramiko SFTPFile"""
+
+    def __init__(self, data=b""):
+        self.data = bytearray(data)
+        self.windows = []
+        self.writes = []
+        self.pipelined = False
+        self.position = len(self.data)
+        self.closes = 0
+
+    def readv(self, ranges):
+        self.windows.append(sum(length for _, length in ranges))
+        for offset, length in ranges:
+            yield bytes(self.data[offset:offset + length])
+
+    def set_pipelined(self, pipelined=True):
+        self.pipelined = pipelined
+
+    def seek(self, offset):
+        self.position = offset
+
+    def write(self, data):
+        self.writes.append(len(data))
+        self.data[self.position:self.position + len(data)] = data
+        self.position += len(data)
+
+    def close(self):
+        self.closes += 1
+
+
+class TestSFTPStreaming:
+    """Test streamed SFTP reads and writes"""
+
+    def test_download_reads_bounded_windows(self):
+        """Test a file is read in pipelined windows and reassembled in order"""
+        data = os.urandom(50000)
+        remote_file = FakeRemoteFile(data)
+
+        async def scenario():
+            executor = FakeExecutor()
+            chunks = [chunk async for chunk in iter_remote_file(
+                executor, remote_file, len(data), chunk_size=4096, window_bytes=16384
+            )]
+            executor.shutdown()
+            return chunks
+
+        chunks = asyncio.run(scenario())
+        assert b"".join(chunks) == data
+        assert max(len(chunk) for chunk in chunks) == 4096
+        assert remote_file.windows == [16384, 16384, 16384, 848]
+
+    def test_download_resumes_at_offset(self):
+        """Test reading can start part way into a file"""
+        remote_file = FakeRemoteFile(b"0123456789")
+
+        async def scenario():
+            executor = FakeExecutor()
+            chunks = [chunk async for chunk in iter_remote_file(executor, remote_file, 10, offset=6, chunk_size=3)]
+            executor.shutdown()
+            return chunks
+
+        assert asyncio.run(scenario()) == [b"678", b"9"]
+
+    def test_upload_coalesces_pipelined_writes(self):
+        """Test small body chunks are merged into full-size pipelined writes"""
+        remote_file = FakeRemoteFile()
+
+        async def body():
+            for _ in range(100):
+                yield b"x" * 1000
+
+        async def scenario():
+            executor = FakeExecutor()
+            written = await write_remote_file(executor, remote_file, body(), chunk_size=4096)
+            executor.shutdown()
+            return written
+
+        assert asyncio.run(scenario()) == 100000
+        assert remote_file.pipelined is True
+        assert bytes(remote_file.data) == b"x" * 100000
+        assert all(size >= 4096 for size in remote_file.writes[:-1])
+        assert len(remote_file.writes) == 20
+
+    def test_upload_segments_confirm_progress(self):
+        """Test each segment is acknowledged by closing the handle before its offset is confirmed"""
+        remote_file = FakeRemoteFile(b"a" * 10)
+        sftp = types.SimpleNamespace(open=lambda path, mode: remote_file)
+        confirmed = []
+
+        async def confirm(offset):
+            confirmed.append((offset, remote_file.closes))
+
+        async def body():
+            for _ in range(100):
+                yield b"b" * 1000
+
+        async def scenario():
+            executor = FakeExecutor()
+            offset = await upload_segments(executor, sftp, "/f.part-1", body(), 10, 100010, 40000, confirm)
+            executor.shutdown()
+            return offset
+
+        assert asyncio.run(scenario()) == 100010
+        assert confirmed == [(66010, 1), (100010, 2)]
+        assert bytes(remote_file.data) == b"a" * 10 + b"b" * 100000
+
+    def test_upload_segments_reject_oversized_body(self):
+        """Test a body longer than the declared size fails without confirming anything"""
+        remote_file = FakeRemoteFile()
+        sftp = types.SimpleNamespace(open=lambda path, mode: remote_file)
+        confirmed = []
+
+        async def confirm(offset):
+            confirmed.append(offset)
+
+        async def body():
+            yield b"x" * 100
+
+        async def scenario():
+            executor = FakeExecutor()
+            try:
+                await upload_segments(executor, sftp, "/f.part-1", body(), 0, 50, 40000, confirm)
+            finally:
+                executor.shutdown()
+
+        with pytest.raises(TransferError):
+            asyncio.run(scenario())
+        assert confirmed == []
+
+
+def frame_source(*frames):
+    queue = asyncio.Queue()
+    for frame in frames:
+        queue.put_nowait(frame)
+    return queue.get
+
+
+class TestPortForwarding:
+    """Test SOCKS negotiation and tunnels over pooled connections"""
+
+    def test_socks_handshake_parses_connect(self):
+        """Test a CONNECT request split across frames is parsed and trailing data is kept"""
+        request = b"\x05\x01\x00\x03\x0bdb.internal" + (5432).to_bytes(2, "big")
+        sent = []
+
+        async def send(data):
+            sent.append(data)
+
+        async def scenario():
+            reader = FrameReader(frame_source(b"\x05", b"\x01\x00", request + b"SELECT 1"))
+            target = await socks_handshake(reader, send)
+            return target, await reader.read()
+
+        assert asyncio.run(scenario()) == (("db.internal", 5432), b"SELECT 1")
+        assert sent == [b"\x05\x00"]
+
+    def test_socks_refuses_unsupported_command(self):
+        """Test a BIND request is answered with a failure reply"""
+        sent = []
+
+        async def send(data):
+            sent.append(data)
+
+        async def scenario():
+            reader = FrameReader(frame_source(b"\x05\x01\x00", b"\x05\x02\x00\x01\x0a\x00\x00\x01\x00\x50"))
+            await socks_handshake(reader, send)
+
+        with pytest.raises(TunnelError):
+            asyncio.run(scenario())
+        assert sent[-1] == socks_reply(SOCKS_COMMAND_NOT_SUPPORTED)
+
+    def test_tunnels_share_connection_and_count_bytes(self):
+        """Test forwarded connections reuse one handshake and count traffic each way"""
+        async def scenario():
+            executor = FakeExecutor()
+            pool = SSHConnectionManager(executor, max_connections=10, idle_timeout=60)
+            registry = TunnelRegistry(pool, max_per_user=2, open_timeout=5)
+            details = make_client_details(1)
+            first = registry.create(1, 1, "direct")
+            second = registry.create(1, 1, "socks")
+            with pytest.raises(TunnelError):
+                registry.create(1, 1, "direct")
+            await first.connect(details, "10.0.0.5", 80)
+            await second.connect(details, "db.internal", 5432)
+            transport = pool._connections[(1, 1)].client.transport
+
+            echoed = asyncio.Event()
+            received = []
+
+            async def receive():
+                # End the stream only once the echo has come back
+                if not first.bytes_sent:
+                    return b"hello"
+                await echoed.wait()
+                return None
+
+            async def send(data):
+                received.append(data)
+                echoed.set()
+
+            await first.run(FrameReader(receive), send)
+            counters = (first.bytes_sent, first.bytes_received)
+            listed = [tunnel.describe()["port"] for tunnel in registry.list(1)]
+            await first.close()
+            await second.close()
+            refs = pool._connections[(1, 1)].refs
+            executor.shutdown()
+            return executor.connects, transport.forwards, b"".join(received), counters, listed, refs, len(registry)
+
+        connects, forwards, received, counters, listed, refs, remaining = asyncio.run(scenario())
+        assert connects == 1
+        assert forwards == [("direct-tcpip", ("10.0.0.5", 80)), ("direct-tcpip", ("db.internal", 5432))]
+        assert received == b"hello"
+        assert counters == (5, 5)
+        assert listed == [80, 5432]
+        assert refs == 0 and remaining == 0
+
+    def test_stalled_target_times_out_without_holding_threads(self):
+        """Test a target that stops reading closes the tunnel and frees the sending thread"""
+        async def scenario():
+            executor = FakeExecutor()
+            senders = SSHExecutor(max_workers=1)
+            pool = SSHConnectionManager(executor, max_connections=10, idle_timeout=60)
+            registry = TunnelRegistry(pool, max_per_user=2, open_timeout=5, executor=senders, send_timeout=0.1)
+            tunnel = registry.create(1, 1, "direct")
+            await tunnel.connect(make_client_details(1), "10.0.0.5", 9)
+            stalled = asyncio.Event()
+
+            async def receive():
+                if not tunnel.bytes_sent:
+                    return b"data"
+                await stalled.wait()
+
+            async def send(data):
+                pass
+
+            try:
+                with pytest.raises(TunnelError):
+                    await tunnel.run(FrameReader(receive), send)
+                # The interactive executor was never involved
+                await asyncio.wait_for(executor.run(time.sleep, 0), timeout=0.2)
+            finally:
+                await tunnel.close()
+            # Closing the channel released the blocked sender
+            await asyncio.wait_for(senders.run(time.sleep, 0), timeout=1)
+            senders.shutdown()
+            executor.shutdown()
+
+        asyncio.run(scenario())
+
+    def test_refused_target_maps_to_socks_reply(self):
+        """Test a target the host cannot reach reports connection refused and releases the pool"""
+        async def scenario():
+            executor = FakeExecutor()
+            pool = SSHConnectionManager(executor, max_connections=10, idle_timeout=60)
+            registry = TunnelRegistry(pool, max_per_user=2, open_timeout=5)
+            tunnel = registry.create(1, 1, "socks")
+            try:
+                await tunnel.connect(make_client_details(1), "10.0.0.5", 1)
+            finally:
+                await tunnel.close()
+                refs = pool._connections[(1, 1)].refs
+                executor.shutdown()
+            return refs
+
+        with pytest.raises(TunnelError) as exc:
+            asyncio.run(scenario())
+        assert exc.value.reply == SOCKS_CONNECTION_REFUSED
+
+
+def ecdsa_pem():
+    buffer = StringIO()
+    paramiko.ECDSAKey.generate().write_private_key(buffer)
+    return buffer.getvalue()
+
+
+def ed25519_pem(passphrase=None):
+    encryption = serialization.BestAvailableEncryption(passphrase.encode()) if passphrase \
+        else serialization.NoEncryption()
+    return ed25519.Ed25519PrivateKey.generate().private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.OpenSSH, encryption
+    ).decode()
+
+
+class TestPrivateKeys:
+    """Test private key detection and caching"""
+
+    def test_detects_key_types(self):
+        """Test ECDSA and Ed25519 keys load without naming the type"""
+        assert isinstance(parse_private_key(ecdsa_pem()), paramiko.ECDSAKey)
+        assert isinstance(parse_private_key(ed25519_pem("secret"), "secret"), paramiko.Ed25519Key)
+        with pytest.raises(paramiko.SSHException):
+            parse_private_key("-----BEGIN NONSENSE-----")
+
+    def test_cache_reuses_parsed_key(self):
+        """Test repeated loads return the same parsed key until the PEM changes"""
+        cache = PrivateKeyCache(max_entries=10)
+        pem = ecdsa_pem()
+        first = cache.load(1, pem)
+        assert cache.load(1, pem) is first
+
+        replaced = cache.load(1, ecdsa_pem())
+        assert replaced is not first
+
+        cache.invalidate(1)
+        assert len(cache) == 0
+
+    def test_cache_evicts_least_recently_used(self):
+        """Test the cache stays within its size bound"""
+        cache = PrivateKeyCache(max_entries=2)
+        pem = ecdsa_pem()
+        first = cache.load(1, pem)
+        cache.load(2, pem)
+        cache.load(1, pem)
+        cache.load(3, pem)
+
+        assert len(cache) == 2
+        assert cache.load(1, pem) is first
+
+
+class TestKnownHosts:
+    """Test the known-hosts store and host key pinning"""
+
+    def test_pin_and_lookup(self, test_db):
+        """Test a pinned key survives a cold cache and can be forgotten"""
+        key = parse_private_key(ecdsa_pem())
+        store = KnownHostStore(test_db)
+        assert store.lookup(1, "10.0.0.9", 2222) is None
+
+        store.pin(1, "10.0.0.9", 2222, key)
+        # Re-pinning an already known host keeps the first key
+        store.pin(1, "10.0.0.9", 2222, parse_private_key(ecdsa_pem()))
+
+        cold = KnownHostStore(test_db).lookup(1, "10.0.0.9", 2222)
+        assert cold.get_name() == key.get_name()
+        assert cold.asbytes() == key.asbytes()
+        assert KnownHostStore(test_db).lookup(2, "10.0.0.9", 2222) is None
+
+        assert store.forget(1, "10.0.0.9", 2222)
+        assert store.lookup(1, "10.0.0.9", 2222) is None
+
+    def test_cached_key_expires(self, test_db):
+        """Test a key forgotten by another worker stops being used once the TTL passes"""
+        key = parse_private_key(ecdsa_pem())
+        store = KnownHostStore(test_db, ttl=0.05)
+        store.pin(1, "10.0.0.9", 2222, key)
+        assert store.lookup(1, "10.0.0.9", 2222) is not None
+
+        assert KnownHostStore(test_db).forget(1, "10.0.0.9", 2222)
+        assert store.lookup(1, "10.0.0.9", 2222) is not None
+        time.sleep(0.1)
+        assert store.lookup(1, "10.0.0.9", 2222) is None
+
+    def test_pinned_key_is_preselected(self, monkeypatch, test_db):
+        """Test connect sees the pinned key and unknown hosts get pinned"""
+        key = parse_private_key(ecdsa_pem())
+        store = KnownHostStore(test_db)
+        monkeypatch.setattr(ssh_executor_module, "known_hosts", store)
+        seen = []
+
+        def fake_connect(self, hostname, port, username, password=None, **kwargs):
+            seen.append(self.get_host_keys().lookup(host_key_name(hostname, port)))
+            # What paramiko does when the server's key is not known yet
+            self._policy.missing_host_key(self, host_key_name(hostname, port), key)
+
+        monkeypatch.setattr(paramiko.SSHClient, "connect", fake_connect)
+        details = types.SimpleNamespace(
+            id=1, user_id=1, host="10.0.0.10", port=2200, username="root", password="secret", private_key=None
+        )
+        open_ssh_client(details)
+        assert seen == [None]
+
+        open_ssh_client(details)
+        assert seen[1][key.get_name()].asbytes() == key.asbytes()
+        assert host_key_name("10.0.0.10", 22) == "10.0.0.10"
+
+
+class TestHostInventory:
+    """Test host inventory parsing"""
+
+    def test_parse_ssh_config(self):
+        """Test concrete Host blocks become clients and wildcards only give defaults"""
+        config = """
+Host web1 web-alias
+    HostName 10.0.0.1
+    Port 2222
+Host db1
+    HostName 10.0.0.2
+    User postgres
+Host *.internal !bastion
+    ForwardAgent yes
+Host *
+    User deploy
+"""
+        clients, errors = parse_inventory(config, "ssh_config")
+
+        assert errors == []
+        assert [(c.label, c.host, c.port, c.username) for c in clients] == [
+            ("web1", "10.0.0.1", 2222, "deploy"),
+            ("db1", "10.0.0.2", 22, "postgres"),
+        ]
+
+    def test_missing_username_is_reported(self):
+        """Test entries that fail validation are reported by position"""
+        clients, errors = parse_inventory("Host lonely\n    HostName 10.0.0.3\n", "ssh_config")
+
+        assert clients == []
+        assert errors[0]["entry"] == "lonely"
+        assert "username" in errors[0]["error"]
+
+    def test_match_blocks_are_not_evaluated(self, tmp_path):
+        """Test Match blocks are reported and skipped instead of running their commands"""
+        marker = tmp_path / "ran"
+        config = f"""
+Match exec "touch {marker}"
+    User root
+Host web1
+    HostName 10.0.0.1
+    User deploy
+"""
+        clients, errors = parse_inventory(config, "ssh_config")
+
+        assert not marker.exists()
+        assert [(c.label, c.username) for c in clients] == [("web1", "deploy")]
+        assert errors == [{"entry": "line 2", "error": "Match blocks are not supported"}]
+
+    def test_malformed_config_is_reported(self):
+        """Test a bare Host line becomes an error entry instead of failing the import"""
+        clients, errors = parse_inventory("Host\n    User root\nHost db1\n    User postgres\n", "ssh_config")
+
+        assert [(c.label, c.username) for c in clients] == [("db1", "postgres")]
+        assert errors == [{"entry": "line 1", "error": "Host needs at least one pattern"}]
+
+
+class TestBulkOperations:
+    """Test bulk SSH work across many clients"""
+
+    @pytest.mark.parametrize("output, expected", [
+        ('Linux\nNAME="Ubuntu"\nVERSION="22.04"\n', "ubuntu"),
+        ('Linux\nCentOS Linux release 7.9\n', "redhat"),
+        ("Linux\n", "linux"),
+        ("Darwin\n", "macos"),
+        ("FreeBSD\n", "freebsd"),
+        ("", None),
+    ])
+    def test_parse_os_probe(self, output, expected):
+        """Test the combined probe output maps to an OS name"""
+        assert parse_os_probe(output) == expected
+
+    def run_exec(self, command, timeout=5, max_output=1024):
+        async def scenario():
+            executor = FakeExecutor()
+            pool = SSHConnectionManager(executor, max_connections=10, idle_timeout=60)
+            clients = [make_client_details(client_id) for client_id in range(1, 4)]
+            events = [
+                (details.id, kind, payload)
+                async for details, kind, payload in exec_on_clients(
+                    command, clients, 1, concurrency=2, timeout=timeout, max_output=max_output,
+                    pool=pool, executor=executor
+                )
+            ]
+            executor.shutdown()
+            return events
+
+        return asyncio.run(scenario())
+
+    def test_exec_streams_output_per_host(self):
+        """Test every host streams stdout and stderr before its exit status"""
+        events = self.run_exec("uptime")
+
+        for client_id in range(1, 4):
+            assert [(kind, payload) for cid, kind, payload in events if cid == client_id] == [
+                ("stdout", "ran uptime\n"), ("stderr", "warn\n"), ("exit", 3)
+            ]
+
+    def test_exec_truncates_and_times_out(self):
+        """Test output is capped per host and hung commands hit the timeout"""
+        truncated = self.run_exec("uptime", max_output=4)
+        assert [(kind, payload) for cid, kind, payload in truncated if cid == 1][:2] == [
+            ("stdout", "ran "), ("truncated", "Output limit of 4 bytes reached")
+        ]
+
+        hung = self.run_exec("hang", timeout=0.05)
+        assert [kind for _, kind, _ in hung] == ["error"] * 3
+        assert all(isinstance(payload, TimeoutError) for _, _, payload in hung)
+
+    def test_exec_leaves_interactive_executor_free(self):
+        """Test long commands run on their own executor while the SSH executor stays responsive"""
+        async def scenario():
+            executor = FakeExecutor()
+            commands = SSHExecutor(max_workers=1)
+            pool = SSHConnectionManager(executor, max_connections=10, idle_timeout=60)
+            clients = [make_client_details(client_id) for client_id in range(1, 4)]
+            stream = exec_on_clients("hang", clients, 1, concurrency=3, timeout=0.3, max_output=1024,
+                                     pool=pool, executor=commands)
+            first = asyncio.ensure_future(stream.__anext__())
+            await asyncio.sleep(0.05)
+            # Both interactive threads are free while a command is hanging
+            keystrokes = await asyncio.wait_for(asyncio.gather(
+                executor.run(time.sleep, 0.01), executor.run(time.sleep, 0.01)
+            ), timeout=0.2)
+            events = [await first] + [event async for event in stream]
+            commands.shutdown()
+            executor.shutdown()
+            return keystrokes, events
+
+        keystrokes, events = asyncio.run(scenario())
+        assert keystrokes == [None, None]
+        assert [kind for _, kind, _ in events] == ["error"] * 3
+
+    def test_map_clients_bounds_concurrency(self):
+        """Test hosts run in parallel up to the limit without filling the pool"""
+        async def scenario():
+            executor = FakeExecutor()
+            pool = SSHConnectionManager(executor, max_connections=10, idle_timeout=60)
+            running = 0
+            peak = 0
+            lock = threading.Lock()
+
+            def probe(ssh_client):
+                nonlocal running, peak
+                with lock:
+                    running += 1
+                    peak = max(peak, running)
+                threading.Event().wait(0.02)
+                with lock:
+                    running -= 1
+                return "linux"
+
+            clients = [make_client_details(client_id) for client_id in range(1, 9)]
+            results = [item async for item in map_clients(probe, clients, 1, concurrency=3, pool=pool)]
+            executor.shutdown()
+            return results, peak, executor.connects, len(pool)
+
+        results, peak, connects, pooled = asyncio.run(scenario())
+        assert sorted(details.id for details, _, _ in results) == list(range(1, 9))
+        assert all(result == "linux" and error is None for _, result, error in results)
+        assert 1 < peak <= 3
+        assert connects == 8
+        assert pooled == 0